@@ -0,0 +1,321 @@
+from hashlib import sha256
+from typing import Callable, Dict, List, Tuple
+
+"""
+This module validates and normalizes addresses locally, before they are stored in the wallet or
+looked up in the providers, so typos and addresses of other chains are rejected without a
+network call. It knows the address formats of the coins in the providers:
+    BTC, LTC - Base58Check (P2PKH, P2SH) and Bech32/Bech32m (SegWit)
+    BCH - Base58Check (legacy) and CashAddr
+    ETH - hex addresses with an optional EIP-55 mixed-case checksum (normalized to lowercase)
+Addresses of other coins are accepted as they are.
+"""
+
+
+class InvalidAddress(ValueError):
+    pass
+
+
+# Base58Check
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+BASE58_VALUES = {char: value for value, char in enumerate(BASE58_ALPHABET)}
+BASE58_ADDRESS_LEN = 25  # version byte, 20 bytes hash and 4 bytes checksum
+
+
+def base58check_decode(address: str) -> bytes:
+    """
+    :return: the payload of the given Base58Check string (version byte included, checksum
+             excluded)
+    :raise InvalidAddress: if the string isn't Base58 or its checksum is wrong
+    """
+    value = 0
+    for char in address:
+        if char not in BASE58_VALUES:
+            raise InvalidAddress(f"invalid character {char!r}")
+        value = value * 58 + BASE58_VALUES[char]
+    # every leading '1' stands for a leading zero byte
+    leading_zeros = len(address) - len(address.lstrip("1"))
+    data = bytes(leading_zeros) + value.to_bytes((value.bit_length() + 7) // 8, "big")
+    if len(data) < 5:
+        raise InvalidAddress("too short")
+    payload, checksum = data[:-4], data[-4:]
+    if sha256(sha256(payload).digest()).digest()[:4] != checksum:
+        raise InvalidAddress("wrong checksum")
+    return payload
+
+
+# Bech32 (BIP-173) and Bech32m (BIP-350). CashAddr uses the same character set
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_VALUES = {char: value for value, char in enumerate(BECH32_CHARSET)}
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+BECH32_MAX_LEN = 90
+
+
+def _bech32_polymod(values: List[int]) -> int:
+    generators = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            if (top >> i) & 1:
+                chk ^= generators[i]
+    return chk
+
+
+def _bech32_hrp_expand(hrp: str) -> List[int]:
+    return [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+
+
+def _convert_bits(data: List[int], from_bits: int, to_bits: int) -> List[int]:
+    """
+    regroup the bits of the given groups of from_bits bits into groups of to_bits bits, without
+    padding
+
+    :raise InvalidAddress: if there are leftover bits which aren't a zero padding
+    """
+    acc = 0
+    bits = 0
+    res = []
+    for value in data:
+        acc = acc << from_bits | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            res.append((acc >> bits) & ((1 << to_bits) - 1))
+    if bits >= from_bits or (acc << (to_bits - bits)) & ((1 << to_bits) - 1):
+        raise InvalidAddress("invalid padding")
+    return res
+
+
+def _decode_base32(data: str) -> List[int]:
+    if any(char not in BECH32_VALUES for char in data):
+        raise InvalidAddress("invalid character")
+    return [BECH32_VALUES[char] for char in data]
+
+
+def segwit_decode(hrp: str, address: str) -> Tuple[int, bytes]:
+    """
+    :param hrp: the human readable part of the coin's addresses (e.g. 'bc' for bitcoin)
+    :return: (witness version, witness program) of the given SegWit address
+    :raise InvalidAddress: if it isn't a valid SegWit address of the coin
+    """
+    if address.lower() != address and address.upper() != address:
+        raise InvalidAddress("mixed case")
+    address = address.lower()
+    separator = address.rfind("1")
+    if address[:separator] != hrp or separator + 7 > len(address) or \
+            len(address) > BECH32_MAX_LEN:
+        raise InvalidAddress("not a SegWit address of this coin")
+    data = _decode_base32(address[separator + 1:])
+    if len(data) < 7:  # the witness version and the checksum
+        raise InvalidAddress("too short")
+    
+    version = data[0]
+    const = BECH32_CONST if version == 0 else BECH32M_CONST
+    if _bech32_polymod(_bech32_hrp_expand(hrp) + data) != const:
+        raise InvalidAddress("wrong checksum")
+    program = bytes(_convert_bits(data[1:-6], 5, 8))
+    if version > 16 or not 2 <= len(program) <= 40 or \
+            (version == 0 and len(program) not in (20, 32)):
+        raise InvalidAddress("invalid witness program")
+    return version, program
+
+
+# CashAddr
+
+CASHADDR_PREFIX = "bitcoincash"
+CASHADDR_HASH_LEN = 20  # only 160 bits hashes are in use
+CASHADDR_TYPES = (0, 1)  # P2PKH, P2SH
+
+
+def _cashaddr_polymod(values: List[int]) -> int:
+    generators = [0x98f2bc8e61, 0x79b76d99e2, 0xf33e5fb3c4, 0xae2eabe2a8, 0x1e4f43e470]
+    chk = 1
+    for value in values:
+        top = chk >> 35
+        chk = (chk & 0x07ffffffff) << 5 ^ value
+        for i in range(5):
+            if (top >> i) & 1:
+                chk ^= generators[i]
+    return chk ^ 1
+
+
+def cashaddr_decode(address: str) -> Tuple[int, bytes]:
+    """
+    :param address: a CashAddr address, with or without the 'bitcoincash:' prefix
+    :return: (address type, hash) of the given address
+    :raise InvalidAddress: if it isn't a valid CashAddr address
+    """
+    if address.lower() != address and address.upper() != address:
+        raise InvalidAddress("mixed case")
+    address = address.lower()
+    prefix, _, payload = address.rpartition(":")
+    if prefix not in ("", CASHADDR_PREFIX):
+        raise InvalidAddress(f"unknown prefix {prefix!r}")
+    data = _decode_base32(payload)
+    if _cashaddr_polymod([ord(char) & 31 for char in CASHADDR_PREFIX] + [0] + data) != 0:
+        raise InvalidAddress("wrong checksum")
+    payload_bytes = _convert_bits(data[:-8], 5, 8)
+    if len(payload_bytes) == 0:
+        raise InvalidAddress("too short")
+    version, address_hash = payload_bytes[0], bytes(payload_bytes[1:])
+    # the version byte has the address type in bits 3-6, and the hash size in bits 0-2
+    if version >> 3 not in CASHADDR_TYPES or version & 7 != 0 or \
+            len(address_hash) != CASHADDR_HASH_LEN:
+        raise InvalidAddress("unsupported address type")
+    return version >> 3, address_hash
+
+
+# Keccak-256, as used by Ethereum. It differs from hashlib's sha3_256 in the padding
+
+KECCAK_RATE = 136  # bytes
+KECCAK_ROUND_CONSTANTS = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+# rotation offsets of the lanes. the lane (x, y) is at index x + 5 * y
+KECCAK_ROTATIONS = [
+    0, 1, 62, 28, 27,
+    36, 44, 6, 55, 20,
+    3, 10, 43, 25, 39,
+    41, 45, 15, 21, 8,
+    18, 2, 61, 56, 14,
+]
+LANE_MASK = (1 << 64) - 1
+
+
+def _rotate_left(lane: int, bits: int) -> int:
+    return (lane << bits | lane >> (64 - bits)) & LANE_MASK if bits else lane
+
+
+def _keccak_f(state: List[int]) -> List[int]:
+    for round_constant in KECCAK_ROUND_CONSTANTS:
+        # theta
+        parity = [state[x] ^ state[x + 5] ^ state[x + 10] ^ state[x + 15] ^ state[x + 20]
+                  for x in range(5)]
+        effect = [parity[(x - 1) % 5] ^ _rotate_left(parity[(x + 1) % 5], 1) for x in range(5)]
+        state = [lane ^ effect[i % 5] for i, lane in enumerate(state)]
+        # rho and pi
+        moved = [0] * 25
+        for x in range(5):
+            for y in range(5):
+                moved[y + 5 * ((2 * x + 3 * y) % 5)] = \
+                    _rotate_left(state[x + 5 * y], KECCAK_ROTATIONS[x + 5 * y])
+        # chi and iota
+        state = [
+            moved[i] ^ (~moved[(i + 1) % 5 + i - i % 5] & moved[(i + 2) % 5 + i - i % 5])
+            for i in range(25)
+        ]
+        state[0] ^= round_constant
+    return state
+
+
+def keccak256(data: bytes) -> bytes:
+    padded = bytearray(data)
+    padded += bytes(KECCAK_RATE - len(data) % KECCAK_RATE)
+    padded[len(data)] |= 0x01
+    padded[-1] |= 0x80
+    state = [0] * 25
+    for start in range(0, len(padded), KECCAK_RATE):
+        block = padded[start:start + KECCAK_RATE]
+        for i in range(KECCAK_RATE // 8):
+            state[i] ^= int.from_bytes(block[8 * i:8 * i + 8], "little")
+        state = _keccak_f(state)
+    return b"".join(lane.to_bytes(8, "little") for lane in state[:4])
+
+
+def to_checksum_address(address: str) -> str:
+    """
+    :param address: a hex address, with the '0x' prefix
+    :return: the EIP-55 mixed-case form of the address
+    """
+    hex_address = address[2:].lower()
+    digest = keccak256(hex_address.encode("ascii")).hex()
+    return "0x" + "".join(
+        char.upper() if int(digest[i], 16) >= 8 else char
+        for i, char in enumerate(hex_address)
+    )
+
+
+# validators of the coins
+
+BASE58_VERSIONS = {
+    "BTC": {0x00, 0x05},
+    "BCH": {0x00, 0x05},
+    "LTC": {0x30, 0x32, 0x05},  # L..., M... and legacy 3... P2SH addresses
+}
+SEGWIT_HRPS = {"BTC": "bc", "LTC": "ltc"}
+ETH_ADDRESS_LEN = 42
+HEX_DIGITS = set("0123456789abcdefABCDEF")
+
+
+def _normalize_base58_or_segwit(coin_symbol: str, address: str) -> str:
+    hrp = SEGWIT_HRPS.get(coin_symbol)
+    if hrp is not None and address.lower().startswith(hrp + "1"):
+        segwit_decode(hrp, address)
+        return address.lower()
+    payload = base58check_decode(address)
+    if len(payload) != BASE58_ADDRESS_LEN - 4 or payload[0] not in BASE58_VERSIONS[coin_symbol]:
+        raise InvalidAddress(f"not a {coin_symbol} address")
+    return address
+
+
+def _normalize_bch(address: str) -> str:
+    if address.lower().startswith(CASHADDR_PREFIX + ":") or address[0] in "qpQP":
+        cashaddr_decode(address)
+        # the prefix is dropped, so the addresses fit on the screen
+        return address.lower().rpartition(":")[2]
+    return _normalize_base58_or_segwit("BCH", address)
+
+
+def _normalize_eth(address: str) -> str:
+    if len(address) != ETH_ADDRESS_LEN or address[:2] not in ("0x", "0X") or \
+            not set(address[2:]) <= HEX_DIGITS:
+        raise InvalidAddress("not a hex address of 20 bytes")
+    address = "0x" + address[2:]
+    # an address in a single case has no checksum. the (slow) hash is computed only for
+    # mixed-case addresses
+    hex_address = address[2:]
+    if hex_address != hex_address.lower() and hex_address != hex_address.upper() and \
+            address != to_checksum_address(address):
+        raise InvalidAddress("wrong EIP-55 checksum")
+    return address.lower()
+
+
+# keys are coin symbols. the values return the normalized form of a valid address, and raise
+# InvalidAddress otherwise
+validators: Dict[str, Callable[[str], str]] = {
+    "BTC": lambda address: _normalize_base58_or_segwit("BTC", address),
+    "LTC": lambda address: _normalize_base58_or_segwit("LTC", address),
+    "BCH": _normalize_bch,
+    "ETH": _normalize_eth,
+}
+
+
+def normalize_address(coin_symbol: str, address: str) -> str:
+    """
+    :return: the normalized form of the given address. Addresses that are written differently
+             but are the same address (e.g. the letter case of Bech32 addresses) have the same
+             normalized form. Addresses of coins without a validator are only stripped
+    :raise InvalidAddress: if the address isn't a valid address of the coin
+    """
+    address = address.strip()
+    if len(address) == 0:
+        raise InvalidAddress("empty address")
+    validator = validators.get(coin_symbol.upper())
+    return address if validator is None else validator(address)
+
+
+def split_addresses(text: str) -> List[str]:
+    """
+    split comma separated addresses. whitespaces are ignored
+    """
+    return [address for address in "".join(text.split()).split(",") if len(address) > 0]
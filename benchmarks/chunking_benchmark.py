@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the batched addresses lookup: how the lookup time of a single coin scales with the
+number of its addresses.
+Requests are answered by the local mock providers server (no network access is needed): every
+request takes a fixed round trip time plus a small per-address processing time.
+
+usage: python3 benchmarks/chunking_benchmark.py
+"""
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "tests"))
+
+import data_retriever  # noqa: E402
+from mock_provider_server import MockConfig, MockProviderServer  # noqa: E402
+
+ROUND_TRIP_TIME = 0.05  # seconds
+PER_ADDRESS_TIME = 0.0002  # seconds
+ADDRESSES_COUNTS = [10, 100, 500, 1000, 5000]
+COINS = ["BTC", "ETH", "LTC"]
+
+
+def make_addresses(coin, count):
+    if coin == "ETH":
+        return ["0x%040x" % i for i in range(count)]
+    prefix = "1" if coin == "BTC" else "L"
+    return [prefix + ("%033d" % i) for i in range(count)]
+
+
+def main():
+    config = MockConfig(latency=ROUND_TRIP_TIME, per_address_latency=PER_ADDRESS_TIME)
+    with MockProviderServer(config) as server:
+        server.patch_data_retriever()
+        print(f"{'coin':<6}{'addresses':>10}{'requests':>10}{'time (s)':>10}")
+        for coin in COINS:
+            for count in ADDRESSES_COUNTS:
+                addresses = make_addresses(coin, count)
+                server.reset_counts()
+                start = time.perf_counter()
+                balances = data_retriever.fetch_addresses(coin, addresses)
+                elapsed = time.perf_counter() - start
+                assert balances is not None and len(balances) == count
+                print(f"{coin:<6}{count:>10}{server.total_requests():>10}{elapsed:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the balances history: fills the history of a coin with minute-level records over
+a number of years, and reports the time of appending a record, of the history screen lookups
+(the value now and 24h, 7d and 30d ago) and of a one-day range query, together with the memory
+the queries allocated.
+
+usage: python3 benchmarks/history_benchmark.py [--years N] [--runs N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from history import RECORD, BalanceHistory  # noqa: E402
+
+SAMPLE_INTERVAL = 60  # seconds between records
+DAY = 24 * 60 * 60
+FILL_CHUNK = 100_000  # records written at a time while filling the history
+
+
+def fill(history: BalanceHistory, coin_code: str, count: int, start: float):
+    """
+    write `count` records directly to the history file of the coin. appending them one at a time
+    would take minutes
+    """
+    os.makedirs(history.directory, exist_ok=True)
+    with open(history.path(coin_code), "wb") as f:
+        for first in range(0, count, FILL_CHUNK):
+            f.write(b"".join(
+                RECORD.pack(start + i * SAMPLE_INTERVAL, 1.5, 1000.0 + i % 1000, 0.05)
+                for i in range(first, min(first + FILL_CHUNK, count))
+            ))
+
+
+def measure(func: Callable[[], object], runs: int) -> Tuple[float, int]:
+    """
+    :return: the average time of a call in microseconds, and the peak memory it allocated in
+             bytes
+    """
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    elapsed = (time.perf_counter() - start) / runs
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1e6, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+    
+    count = int(args.years * 365 * DAY / SAMPLE_INTERVAL)
+    now = time.time()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        history = BalanceHistory(os.path.join(tmp_dir, "history"))
+        fill(history, "BTC", count, now - count * SAMPLE_INTERVAL)
+        size_mb = os.path.getsize(history.path("BTC")) / 1024 / 1024
+        print(f"{count} records ({size_mb:.1f} MB)")
+        
+        def range_query():
+            with history.view("BTC") as view:
+                return sum(record[2] for record in view.range(now - 2 * DAY, now - DAY))
+        
+        times = [now, now - DAY, now - 7 * DAY, now - 30 * DAY]
+        benchmarks = [
+            ("append", lambda: history.append(["BTC", 1.5, 1000.0, 0.05])),
+            ("history screen lookups", lambda: history.usd_values("BTC", times)),
+            ("one day range query", range_query),
+        ]
+        print(f"{'operation':<24}{'avg us':>10}{'peak KB':>10}")
+        for name, func in benchmarks:
+            elapsed_us, peak = measure(func, args.runs)
+            print(f"{name:<24}{elapsed_us:>10.1f}{peak / 1024:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
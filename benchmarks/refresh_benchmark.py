@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the refresh path against the local mock providers server (no network access is
+needed). Times Wallet.get_balances and lookup_addresses across numbers of coins and addresses,
+and reports p50/p95 latency and the number of requests sent to the providers per run.
+The 'unchanged tip' rows refresh a wallet whose cached balances expired while no block arrived,
+so only the chain heights are looked up.
+
+usage: python3 benchmarks/refresh_benchmark.py [--runs N] [--latency SECONDS] [--jitter SECONDS]
+                                               [--error-rate RATE]
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "tests"))
+
+from data_retriever import balance_cache, lookup_addresses  # noqa: E402
+from mock_provider_server import MockConfig, MockProviderServer, clear_caches  # noqa: E402
+from wallet import Wallet  # noqa: E402
+
+COINS = ["BTC", "ETH", "BCH", "LTC"]
+COINS_COUNTS = [1, 4]
+ADDRESSES_COUNTS = [10, 100, 1000]
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """
+    nearest-rank percentile
+    """
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def make_addresses(coin: str, count: int) -> List[str]:
+    if coin == "ETH":
+        return ["0x%040x" % i for i in range(count)]
+    return [f"{coin}{i:030d}" for i in range(count)]
+
+
+def measure(server: MockProviderServer, runs: int, func: Callable, unchanged_tip: bool = False):
+    """
+    run func `runs` times with cold caches. If unchanged_tip is True, the caches are filled once
+    instead, and the cached balances expire before every run while the chain tip doesn't advance
+
+    :return: (latencies, requests per run)
+    """
+    latencies = []
+    requests_counts = []
+    ttl = balance_cache.ttl
+    if unchanged_tip:
+        clear_caches()
+        func()
+        balance_cache.ttl = 0  # every cached balance is expired
+    try:
+        for _ in range(runs):
+            if not unchanged_tip:
+                clear_caches()
+            server.reset_counts()
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+            requests_counts.append(server.total_requests() + server.height_requests)
+    finally:
+        balance_cache.ttl = ttl
+    return latencies, requests_counts
+
+
+def report(name: str, coins_count: int, addresses_count: int, latencies, requests_counts):
+    print(f"{name:<22}{coins_count:>6}{addresses_count:>11}"
+          f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 95) * 1000:>10.1f}"
+          f"{sum(requests_counts) / len(requests_counts):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the refresh path on mock providers")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="providers latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="latency jitter (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    
+    config = MockConfig(latency=args.latency, latency_jitter=args.jitter,
+                        error_rate=args.error_rate)
+    print(f"{'benchmark':<22}{'coins':>6}{'addresses':>11}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+          f"{'requests':>10}")
+    with MockProviderServer(config) as server, tempfile.TemporaryDirectory() as tmp_dir:
+        server.patch_data_retriever()
+        for coins_count in COINS_COUNTS:
+            for addresses_count in ADDRESSES_COUNTS:
+                coins = COINS[:coins_count]
+                wallet = Wallet(
+                    storage_path=os.path.join(tmp_dir, f"wallet-{coins_count}-{addresses_count}.db"),
+                    legacy_path=os.path.join(tmp_dir, "wallet"),
+                )
+                for coin in coins:
+                    wallet.add_addresses(coin, make_addresses(coin, addresses_count))
+                
+                report("Wallet.get_balances", coins_count, addresses_count,
+                       *measure(server, args.runs, wallet.get_balances))
+                report("unchanged tip", coins_count, addresses_count,
+                       *measure(server, args.runs, wallet.get_balances, unchanged_tip=True))
+                
+                if coins_count == 1:
+                    for coin in COINS:
+                        addresses = make_addresses(coin, addresses_count)
+                        report(f"lookup_addresses {coin}", 1, addresses_count,
+                               *measure(server, args.runs,
+                                        lambda: lookup_addresses(coin, addresses)))
+
+
+if __name__ == '__main__':
+    main()
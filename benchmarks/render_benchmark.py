@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the curses screens, drawn on a fake screen (no terminal is needed). Replays a
+scripted sequence of keys against display_main_scr, manage_coin and remove_addresses_scr on
+synthetic wallets of varying size, and reports per keypress: the frame time, the number of
+addstr calls and of cells written, and the number of full redraws (screen erases).
+The address balances are looked up in the local mock providers server.
+
+usage: python3 benchmarks/render_benchmark.py [--repeat N] [--lines LINES] [--cols COLS]
+"""
+import argparse
+import curses
+import math
+import os
+import sys
+import tempfile
+from typing import Callable, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "tests"))
+
+import renderer  # noqa: E402
+from data_retriever import lookup_addresses  # noqa: E402
+from fake_screen import (FakeRefresher, FakeScreen, FrameStats, ScriptEnded,  # noqa: E402
+                         init_fake_render)
+from mock_provider_server import MockProviderServer  # noqa: E402
+from wallet import Wallet  # noqa: E402
+
+COINS_COUNTS = [10, 100, 1000]
+ADDRESSES_COUNTS = [10, 100, 1000, 10000]
+
+# the keys of each screen. every key is one frame
+NAVIGATION_KEYS = [curses.KEY_DOWN] * 10 + [curses.KEY_NPAGE] * 5 + [curses.KEY_UP] * 5
+OPTIONS_KEYS = [curses.KEY_RIGHT] * 3 + [curses.KEY_LEFT] * 3
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """
+    nearest-rank percentile
+    """
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_screen(keys: List, draw: Callable[[FakeScreen], None], lines: int,
+               cols: int) -> List[FrameStats]:
+    """
+    draw a screen and replay the keys on it
+
+    :return: the stats of every frame. the first frame is the initial drawing of the screen
+    """
+    screen = FakeScreen(keys, lines, cols)
+    try:
+        draw(screen)
+    except ScriptEnded:
+        pass
+    return screen.frames
+
+
+def report(name: str, rows_count: int, frames: List[FrameStats]):
+    first, keys = frames[0], frames[1:]
+    times = [frame.seconds * 1000 for frame in keys]
+    print(f"{name:<16}{rows_count:>7}{first.seconds * 1000:>11.2f}"
+          f"{percentile(times, 50):>10.3f}{percentile(times, 95):>10.3f}"
+          f"{sum(frame.addstr_calls for frame in keys) / len(keys):>10.1f}"
+          f"{sum(frame.cell_writes for frame in keys) / len(keys):>10.1f}"
+          f"{sum(frame.erases for frame in keys):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the curses screens on a fake screen")
+    parser.add_argument("--repeat", type=int, default=3, help="times to replay the keys")
+    parser.add_argument("--lines", type=int, default=24, help="height of the fake screen")
+    parser.add_argument("--cols", type=int, default=80, help="width of the fake screen")
+    args = parser.parse_args()
+    
+    init_fake_render()
+    print(f"{'screen':<16}{'rows':>7}{'first (ms)':>11}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+          f"{'addstr':>10}{'cells':>10}{'redraws':>9}")
+    
+    for coins_count in COINS_COUNTS:
+        rows = [[f"C{i:04d}", 1.5, 15000.0, 1.5] for i in range(coins_count)]
+        refresher = FakeRefresher(rows)
+        # a row refresh between every two keys
+        updates = [lambda i=i: refresher.update_row(i % coins_count, [rows[i % coins_count][0],
+                                                                      2.5, 25000.0, 2.5])
+                   for i in range(len(OPTIONS_KEYS + NAVIGATION_KEYS))]
+        keys = [key for pair in zip(OPTIONS_KEYS + NAVIGATION_KEYS, updates) for key in pair]
+        report("main", coins_count, run_screen(
+            keys * args.repeat, lambda screen: renderer.display_main_scr(screen, refresher),
+            args.lines, args.cols,
+        ))
+    
+    with MockProviderServer() as server, tempfile.TemporaryDirectory() as tmp_dir:
+        server.patch_data_retriever()
+        for addresses_count in ADDRESSES_COUNTS:
+            wallet = Wallet(storage_path=os.path.join(tmp_dir, f"wallet-{addresses_count}.db"),
+                            legacy_path=os.path.join(tmp_dir, "wallet"))
+            addresses = [f"address-{i}" for i in range(addresses_count)]
+            wallet.add_addresses("BTC", addresses)
+            balances = lookup_addresses("BTC", addresses)  # manage_coin takes them from the cache
+            
+            report("manage_coin", addresses_count, run_screen(
+                (NAVIGATION_KEYS + OPTIONS_KEYS) * args.repeat,
+                lambda screen: renderer.manage_coin(screen, "BTC", wallet),
+                args.lines, args.cols,
+            ))
+            # the last key removes an address
+            report("remove_addresses", addresses_count, run_screen(
+                NAVIGATION_KEYS * args.repeat + [renderer.ENTER],
+                lambda screen: renderer.remove_addresses_scr(screen, "BTC", list(addresses),
+                                                             list(balances), wallet),
+                args.lines, args.cols,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the batch mode cold startup: runs 'cryptowatch.py --json' on an empty wallet and
+compares it with the startup of a bare interpreter. Fails (exit code 1) if the overhead is above
+the target, or if curses or the HTTP stack were imported.
+
+usage: python3 benchmarks/startup_benchmark.py [--runs N] [--target-ms MS]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CRYPTOWATCH = os.path.join(ROOT_DIR, "cryptowatch.py")
+
+# time cryptowatch may add on top of the interpreter startup
+STARTUP_OVERHEAD_TARGET_MS = 100
+# modules the batch mode must not import when there is nothing to look up
+FORBIDDEN_MODULES = ["curses", "requests", "data_retriever"]
+
+
+def run_timed(args: List[str], env) -> float:
+    start = time.perf_counter()
+    subprocess.run(args, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def imported_modules(env) -> List[str]:
+    result = subprocess.run([sys.executable, "-X", "importtime", CRYPTOWATCH, "--json"],
+                            env=env, check=True, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    return [line.rsplit("|", 1)[1].strip() for line in result.stderr.splitlines()
+            if line.startswith("import time:") and "|" in line]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the batch mode cold startup")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--target-ms", type=float, default=STARTUP_OVERHEAD_TARGET_MS)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home)  # an empty wallet
+        baseline = sorted(run_timed([sys.executable, "-c", "pass"], env)
+                          for _ in range(args.runs))[args.runs // 2]
+        startup = sorted(run_timed([sys.executable, CRYPTOWATCH, "--json"], env)
+                         for _ in range(args.runs))[args.runs // 2]
+        forbidden = [module for module in imported_modules(env)
+                     if module.split(".")[0] in FORBIDDEN_MODULES]
+    
+    overhead_ms = (startup - baseline) * 1000
+    print(f"interpreter startup (p50): {baseline * 1000:.1f} ms")
+    print(f"cryptowatch --json (p50):  {startup * 1000:.1f} ms")
+    print(f"overhead:                  {overhead_ms:.1f} ms (target {args.target_ms:.0f} ms)")
+    if len(forbidden) > 0:
+        print(f"FAIL: imported {', '.join(forbidden)}")
+    if overhead_ms > args.target_ms:
+        print("FAIL: startup overhead is above the target")
+    if len(forbidden) > 0 or overhead_ms > args.target_ms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import time
+from threading import Lock
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+"""
+This module contains in-memory caches for data retrieved from external sources
+"""
+
+# (value_in_usd, value_in_btc)
+Quote = Tuple[float, float]
+
+
+class TTLCache:
+    """
+    A thread-safe mapping whose entries expire `ttl` seconds after they were stored.
+    Expired entries are not returned by default, but they are kept for `keep_expired_for` more
+    seconds, so a caller that can tell an expired value is still correct may renew() it instead of
+    storing it again. After that they are evicted, at most once every `ttl` seconds, when new
+    values are stored
+    """
+    
+    def __init__(self, ttl: float, keep_expired_for: float = 0):
+        self.ttl = ttl
+        self.keep_expired_for = keep_expired_for
+        # values are (value, time the value was stored)
+        self._entries: Dict[Hashable, Tuple[object, float]] = {}
+        self._evicted_at = time.time()
+        self._lock = Lock()
+    
+    def _is_fresh(self, entry: Tuple[object, float], now: float) -> bool:
+        return now - entry[1] < self.ttl
+    
+    def get(self, key: Hashable) -> Optional[object]:
+        """
+        return the value of the given key, or None if it's not in the cache or it has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or not self._is_fresh(entry, time.time()):
+            return None
+        return entry[0]
+    
+    def get_many(
+        self,
+        keys: Iterable[Hashable],
+        include_expired: bool = False,
+    ) -> Dict[Hashable, object]:
+        """
+        return a dictionary with the values of all the given keys that are in the cache and
+        haven't expired. If include_expired is True, the values of expired keys are returned too
+        """
+        res = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and (include_expired or self._is_fresh(entry, now)):
+                    res[key] = entry[0]
+        return res
+    
+    def put(self, key: Hashable, value: object):
+        self.put_many({key: value})
+    
+    def put_many(self, items: Dict[Hashable, object]):
+        now = time.time()
+        with self._lock:
+            if now - self._evicted_at >= self.ttl:
+                self._evict(now)
+            for key, value in items.items():
+                self._entries[key] = (value, now)
+    
+    def seed(self, items: Dict[Hashable, Tuple[object, float]]):
+        """
+        add values that were stored elsewhere (e.g. by another process), keeping the time each was
+        stored. A value is added only if it's newer than the cached value of its key
+
+        :param items: a dictionary from key to (value, time the value was stored)
+        """
+        with self._lock:
+            for key, (value, stored_at) in items.items():
+                entry = self._entries.get(key)
+                if entry is None or entry[1] < stored_at:
+                    self._entries[key] = (value, stored_at)
+    
+    def renew(self, keys: Iterable[Hashable]):
+        """
+        mark the values of the given keys as if they were just stored, so they don't expire for
+        another `ttl` seconds. Keys which are not in the cache are ignored
+        """
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries[key] = (self._entries[key][0], now)
+    
+    def age(self, key: Hashable) -> Optional[float]:
+        """
+        return the number of seconds since the value of the given key was stored, or None if
+        it's not in the cache
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return time.time() - entry[1]
+    
+    def invalidate(self, keys: Optional[Iterable[Hashable]] = None):
+        """
+        remove the given keys from the cache. If keys is None, the whole cache is cleared
+        """
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+    
+    def evict_expired(self):
+        """
+        remove the entries that have been expired for more than `keep_expired_for` seconds
+        """
+        with self._lock:
+            self._evict(time.time())
+    
+    def _evict(self, now: float):
+        # must be called while holding the lock
+        max_age = self.ttl + self.keep_expired_for
+        for key in [key for key, (_, stored_at) in self._entries.items()
+                    if now - stored_at >= max_age]:
+            del self._entries[key]
+        self._evicted_at = now
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+class PriceCache:
+    """
+    An index of coin quotes by coin symbol.
+    The whole ticker is fetched at once and kept for `ttl` seconds. After that, the next lookup
+    fetches it again. If fetching fails, the last known quotes are kept so they can still be
+    used (check their age with `age()`)
+    """
+    
+    def __init__(
+        self,
+        ttl: float,
+        fetch_ticker: Callable[[], Optional[Dict[str, Quote]]],
+        load_shared: Optional[Callable[[], Optional[Tuple[Dict[str, Quote], float]]]] = None,
+        store_shared: Optional[Callable[[Dict[str, Quote], float], None]] = None,
+    ):
+        """
+        :param ttl: number of seconds fetched quotes are considered fresh
+        :param fetch_ticker: a function that downloads the ticker and returns a dictionary from
+                             coin symbol to its quote, or None in case of failure
+        :param load_shared: a function that returns the last ticker fetched by any process, as
+                            (quotes, time it was fetched), or None. If it's fresh and newer than
+                            the cached ticker, it's used instead of downloading the ticker
+        :param store_shared: a function that is called with (quotes, time they were fetched)
+                             whenever the ticker is downloaded, to share it with other processes
+        """
+        self.ttl = ttl
+        self._fetch_ticker = fetch_ticker
+        self._load_shared = load_shared
+        self._store_shared = store_shared
+        # keys are coin symbols. values are (quote, time the quote was fetched)
+        self._quotes: Dict[str, Tuple[Quote, float]] = {}
+        self._fetched_at: Optional[float] = None  # time of the last successful fetch
+        # time the newest known ticker was fetched. unlike _fetched_at, invalidate() keeps it, so
+        # the ticker this cache shared isn't taken back as a newer one
+        self._newest: float = 0.0
+        # held while fetching, so concurrent lookups wait for a single fetch
+        self._lock = Lock()
+    
+    def is_fresh(self) -> bool:
+        """
+        return True if the ticker was fetched successfully less than `ttl` seconds ago
+        """
+        return self._fetched_at is not None and time.time() - self._fetched_at < self.ttl
+    
+    def _ensure_fresh(self):
+        if self.is_fresh():
+            return
+        with self._lock:
+            if self.is_fresh():  # another thread fetched while we were waiting
+                return
+            shared = self._load_shared() if self._load_shared is not None else None
+            if shared is not None and shared[1] > self._newest and \
+                    time.time() - shared[1] < self.ttl:
+                quotes, fetched_at = shared
+            else:
+                quotes = self._fetch_ticker()
+                if quotes is None:
+                    return
+                fetched_at = time.time()
+                if self._store_shared is not None:
+                    self._store_shared(quotes, fetched_at)
+            for symbol, quote in quotes.items():
+                self._quotes[symbol] = (quote, fetched_at)
+            self._fetched_at = fetched_at
+            self._newest = fetched_at
+    
+    def get_quotes(self, symbols: List[str]) -> List[Optional[Quote]]:
+        """
+        return the quotes of the given coin symbols, fetching the ticker first if it's expired.
+        None is placed in the index of a symbol that has no known quote
+        """
+        self._ensure_fresh()
+        res = []
+        for symbol in symbols:
+            entry = self._quotes.get(symbol.upper())
+            res.append(None if entry is None else entry[0])
+        return res
+    
+    def age(self, symbol: str) -> Optional[float]:
+        """
+        return the number of seconds since the quote of the given symbol was fetched, or None if
+        there is no quote for it
+        """
+        entry = self._quotes.get(symbol.upper())
+        if entry is None:
+            return None
+        return time.time() - entry[1]
+    
+    def invalidate(self):
+        """
+        mark the ticker as expired, so the next lookup fetches it again.
+        The current quotes are kept in case fetching fails
+        """
+        self._fetched_at = None
+    
+    def clear(self):
+        """
+        forget all quotes
+        """
+        with self._lock:
+            self._quotes.clear()
+            self._fetched_at = None
+            self._newest = 0.0
+    
+    def export(self, symbols: Iterable[str]) -> Dict[str, Tuple[Quote, float]]:
+        """
+        return the known quotes of the given symbols along with the time each was fetched
+        """
+        return {
+            symbol.upper(): self._quotes[symbol.upper()]
+            for symbol in symbols if symbol.upper() in self._quotes
+        }
+    
+    def seed(self, quotes: Dict[str, Tuple[Quote, float]]):
+        """
+        add previously exported quotes (e.g. from a file), keeping the time they were fetched.
+        Quotes that are already known are not overwritten. Seeding doesn't make the ticker fresh,
+        so the seeded quotes are used only if fetching fails
+        """
+        for symbol, (quote, fetched_at) in quotes.items():
+            self._quotes.setdefault(symbol.upper(), (tuple(quote), fetched_at))
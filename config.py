@@ -1,6 +1,84 @@
 import os
 
 CRYPTO_WATCH_DIR = os.path.join(os.path.expandvars("$HOME"), ".cryptowatch")
+WALLET_DB_FILENAME = "wallet.db"
+WALLET_DB_FULLPATH = os.path.join(CRYPTO_WATCH_DIR, WALLET_DB_FILENAME)
+# wallet file of older versions. it is migrated to the database on the first load
 WALLET_FILENAME = "wallet"
 WALLET_FULLPATH = os.path.join(CRYPTO_WATCH_DIR, WALLET_FILENAME)
 LOGFILE = os.path.join(CRYPTO_WATCH_DIR, "cryptowatch.log")
+
+# balances refresh
+REFRESH_MAX_WORKERS = 8  # maximum number of lookups running at the same time
+REFRESH_DEADLINE = 15  # seconds. lookups that didn't finish by then are considered failed
+BATCH_MAX_WORKERS = 4  # maximum number of address batches of a single coin looked up at the same time
+# if a provider didn't answer within this number of seconds, send the lookup to another provider
+# of the coin as well and take the first answer. None disables it
+PROVIDER_HEDGE_AFTER = 4
+
+# HTTP transport
+HTTP_CONNECT_TIMEOUT = 5  # seconds
+HTTP_READ_TIMEOUT = 10  # seconds
+HTTP_MAX_RETRIES = 2  # retries of failed requests (connection errors and 5xx responses)
+HTTP_BACKOFF_FACTOR = 0.5  # sleep between retries is {backoff factor} * (2 ** {retry number})
+HTTP_POOL_SIZE = 8  # maximum number of kept-alive connections per provider host
+
+# request budget of each provider host: (requests per second, burst size). requests above the
+# budget wait for it to refill. hosts which are not listed are not limited
+RATE_LIMITS = {
+    "blockchain.info": (5, 5),
+    "api.etherscan.io": (5, 5),
+    "chain.api.btc.com": (5, 10),
+    "bch-chain.api.btc.com": (5, 10),
+    "ltc-chain.api.btc.com": (5, 10),
+    "api.coinmarketcap.com": (1, 3),
+    "cloudflare-eth.com": (5, 10),
+}
+RATE_LIMIT_MAX_WAIT = 10  # seconds a request may wait for the budget before it's given up
+HTTP_MAX_THROTTLED_RETRIES = 3  # retries of requests answered with 429 (too many requests)
+RATE_LIMIT_JITTER = 0.25  # up to this fraction is randomly added to each throttling back off
+
+# Electrum servers (e.g. electrs or Fulcrum on your own full node) of each coin:
+# coin symbol -> (host, port, use SSL). The balances of a coin with a server are looked up in it
+# over a single persistent connection, before the public explorers. For example:
+# ELECTRUM_SERVERS = {"BTC": ("localhost", 50001, False), "LTC": ("localhost", 50011, False)}
+ELECTRUM_SERVERS = {}
+ELECTRUM_TIMEOUT = 10  # seconds to wait for the connection and for each answer
+
+# ERC-20 tokens whose balances are looked up in every ETH address of the wallet:
+# token symbol -> (contract address, decimals). Each token is displayed in a row of its own, and
+# is priced by its symbol. Tokens whose symbol is also a coin of the wallet (e.g. a manual
+# balance) are not looked up. For example:
+# ERC20_TOKENS = {"USDT": ("0xdac17f958d2ee523a2206206994597c13d831ec7", 6),
+#                 "LINK": ("0x514910771af9ca656af840dff83e8264ecf986ca", 18)}
+ERC20_TOKENS = {}
+
+# caches
+PRICE_TTL = 60  # seconds a downloaded coins ticker is used before it is downloaded again
+# seconds a looked up address balance is used as is. After that, it's used only if the chain tip
+# hasn't advanced since it was looked up, and otherwise it's looked up again
+BALANCE_TTL = 60
+# seconds an expired balance is kept for that check. Older balances are evicted
+BALANCE_KEEP_EXPIRED = 60 * 60
+
+# looked up balances and the coins ticker are shared between all the running CryptoWatch processes
+# through this database. None disables sharing
+SHARED_CACHE_FULLPATH = os.path.join(CRYPTO_WATCH_DIR, "cache.db")
+SHARED_CACHE_TIMEOUT = 2  # seconds to wait for another process that is writing to the database
+
+# seconds between summaries of the providers and caches metrics written to the log file
+METRICS_LOG_INTERVAL = 300
+
+# --profile writes a trace of the run (and possibly a cProfile dump) to this directory
+PROFILE_DIR = os.path.join(CRYPTO_WATCH_DIR, "profiles")
+
+# last known balances, displayed on startup until they are refreshed
+SNAPSHOT_FULLPATH = os.path.join(CRYPTO_WATCH_DIR, "snapshot.json")
+
+# the balances history of each coin, appended on every refresh and displayed in the history screen
+HISTORY_DIR = os.path.join(CRYPTO_WATCH_DIR, "history")
+
+# watch mode. polling intervals are (initial, minimum, maximum) seconds. an interval shrinks after
+# a change is detected, grows while nothing changes, and backs off on errors
+WATCH_PRICE_INTERVAL = (60, 30, 600)
+WATCH_ADDRESS_INTERVAL = (120, 30, 1800)
@@ -1,32 +1,184 @@
 #!/usr/bin/env python3
 
-from curses import wrapper
+import argparse
+import sys
+from functools import partial
 
-import renderer
-from wallet import Wallet
+# modules are imported where they are needed, so the batch mode starts fast and never imports
+# curses
 
 
-def run_crypto_watch(stdscr):
+def run_crypto_watch(stdscr, watch: bool = False):
+    """
+    :param watch: if True, prices and balances are polled in the background, so they refresh
+                  by themselves
+    """
+    import renderer
+    from refresher import Refresher
+    from wallet import Wallet
+    
     renderer.init_render(stdscr)
     wallet = Wallet()
+    # the last known balances are displayed immediately, and refreshed in the background
+    # while the main screen is displayed
+    refresher = Refresher(wallet)
+    refresher.start()
+    if watch:
+        from config import WATCH_ADDRESS_INTERVAL, WATCH_PRICE_INTERVAL
+        from scheduler import PollScheduler
+        refresher.watch(PollScheduler(WATCH_PRICE_INTERVAL, WATCH_ADDRESS_INTERVAL))
     option = renderer.ADD
-    refresh = True
     while option != renderer.EXIT:
-        if refresh:
-            coins = wallet.get_balances()
-            refresh = False
-        option = renderer.display_main_scr(stdscr, coins, option=option)
+        option = renderer.display_main_scr(stdscr, refresher, option=option)
         if option == renderer.ADD:
             renderer.display_add_scr(stdscr, wallet)
+            refresher.start()  # show the added coins
         elif option == renderer.MANAGE_COIN:
             renderer.manage_scr(stdscr, wallet)
+            refresher.start()  # show the changes. unchanged balances are cached
         elif option == renderer.REFRESH:
-            refresh = True
+            refresher.start()
+        elif option == renderer.HISTORY:
+            renderer.display_history_scr(stdscr, refresher)
+        elif option == renderer.STATS:
+            renderer.display_stats_scr(stdscr)
         elif option == renderer.DELETE_WALLET:
+            refresher.reset()
             wallet.delete()
+    refresher.stop_watching()
+    refresher.cancel()
 
 
-# wrapper will initialize the screen, turn off keys echoing, turn on
-# cbreak (response immediately upon key press), and on exit - restore the default
-# settings for the terminal
-wrapper(run_crypto_watch)
+COLUMNS = ["coin", "amount", "value_usd", "value_btc"]
+
+
+def print_balances(output_format: str):
+    """
+    refresh the wallet and print its balances table to the standard output
+
+    :param output_format: 'json' or 'csv'
+    """
+    from wallet import Wallet
+    
+    rows = Wallet().get_balances()
+    if output_format == "json":
+        import json
+        json.dump([dict(zip(COLUMNS, row)) for row in rows], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        import csv
+        writer = csv.writer(sys.stdout)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+
+def import_addresses(coin_symbol: str, path: str) -> int:
+    """
+    add the addresses in the given file to the wallet. Invalid addresses are reported to the
+    standard error
+
+    :param path: a file of comma or newline separated addresses. '-' is the standard input
+    :return: the exit status - 1 if some addresses were rejected, 0 otherwise
+    """
+    from wallet import Wallet
+    
+    coin_symbol = coin_symbol.upper()
+    if path == "-":
+        report = Wallet().import_addresses(coin_symbol, sys.stdin)
+    else:
+        with open(path) as f:
+            report = Wallet().import_addresses(coin_symbol, f)
+    for line_number, address, reason in report.rejected:
+        print(f"{path}:{line_number}: {address}: {reason}", file=sys.stderr)
+    print(f"Added {len(report.added)} {coin_symbol} addresses, skipped {report.duplicates} "
+          f"duplicates, rejected {len(report.rejected)} invalid addresses")
+    return 1 if len(report.rejected) > 0 else 0
+
+
+def write_profile(tracer, profiler, directory: str):
+    """
+    write the recorded trace, and the cProfile stats if profiled, to files in the given directory
+    """
+    import os
+    import time
+    
+    os.makedirs(directory, exist_ok=True)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    trace_path = os.path.join(directory, f"trace-{timestamp}.json")
+    tracer.export(trace_path)
+    print(f"Trace written to {trace_path} (open it in chrome://tracing or ui.perfetto.dev)",
+          file=sys.stderr)
+    if profiler is not None:
+        profile_path = os.path.join(directory, f"profile-{timestamp}.prof")
+        profiler.dump_stats(profile_path)
+        print(f"cProfile stats written to {profile_path}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="CryptoWatch - Multi Cryptocurrency watch-only wallet. "
+                    "Without options, the interactive interface is started"
+    )
+    output_format = parser.add_mutually_exclusive_group()
+    output_format.add_argument("--json", dest="output_format", action="store_const",
+                               const="json", help="print the balances as JSON and exit")
+    output_format.add_argument("--csv", dest="output_format", action="store_const",
+                               const="csv", help="print the balances as CSV and exit")
+    parser.add_argument("--watch", action="store_true",
+                        help="refresh prices and balances periodically by themselves")
+    parser.add_argument("--import", dest="import_addresses", nargs=2, metavar=("COIN", "FILE"),
+                        help="add the addresses in FILE ('-' for the standard input) to the "
+                             "wallet and exit. Invalid addresses are reported and skipped")
+    parser.add_argument("--profile", nargs="?", const="trace", choices=["trace", "cprofile"],
+                        help="write a Chrome trace of the run to ~/.cryptowatch/profiles on exit. "
+                             "With 'cprofile', write a cProfile dump of the main thread as well")
+    args = parser.parse_args()
+    if args.watch and args.output_format is not None:
+        parser.error("--watch can't be used with --json or --csv")
+    if args.import_addresses is not None and (args.watch or args.output_format is not None):
+        parser.error("--import can't be used with --watch, --json or --csv")
+    
+    if args.profile is None:
+        sys.exit(run(args))
+    
+    import tracing
+    from config import PROFILE_DIR
+    
+    tracing.start_tracing()
+    profiler = None
+    if args.profile == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        status = run(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        # written after the interactive interface restored the terminal
+        write_profile(tracing.stop_tracing(), profiler, PROFILE_DIR)
+    sys.exit(status)
+
+
+def run(args) -> int:
+    """
+    run the mode chosen by the command line arguments
+
+    :return: the exit status
+    """
+    if args.import_addresses is not None:
+        return import_addresses(*args.import_addresses)
+    if args.output_format is not None:
+        print_balances(args.output_format)
+        return 0
+    
+    from curses import wrapper
+    # wrapper will initialize the screen, turn off keys echoing, turn on
+    # cbreak (response immediately upon key press), and on exit - restore the default
+    # settings for the terminal
+    wrapper(partial(run_crypto_watch, watch=args.watch))
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,19 @@
-from typing import List, Optional, Tuple
-
-import requests
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
 
+import transport
+from cache import PriceCache, Quote, TTLCache
+from config import (BALANCE_KEEP_EXPIRED, BALANCE_TTL, BATCH_MAX_WORKERS, ELECTRUM_SERVERS,
+                    ERC20_TOKENS, PRICE_TTL, PROVIDER_HEDGE_AFTER, SHARED_CACHE_FULLPATH)
+from electrum_client import ElectrumBackend, ElectrumClient
+from metrics import metrics
+from providers import ConfirmedBalance, ProviderRegistry
+from shared_cache import SharedCache
+from singleflight import SingleFlight
+from tracing import span, traced
 from utils import logger
 
 """
@@ -11,33 +23,197 @@ addresses balance and coins value
 
 NOT_FOUND = -1
 
+# base URLs of the providers. They may be pointed to a local server, such as the mock server
+# in tests/mock_provider_server.py
+BLOCKCHAIN_INFO_URL = "https://blockchain.info"
+ETHERSCAN_URL = "https://api.etherscan.io"
+BTC_COM_URLS = {
+    "btc": "https://chain.api.btc.com",
+    "bch": "https://bch-chain.api.btc.com",
+    "ltc": "https://ltc-chain.api.btc.com",
+}
+COINMARKETCAP_URL = "https://api.coinmarketcap.com"
+# an Ethereum JSON-RPC endpoint. The balances of ERC-20 tokens are read from it
+ETH_RPC_URL = "https://cloudflare-eth.com"
 
-def lookup_btc_addresses(addresses: List[str]) -> Optional[List[float]]:
+
+class InvalidAddressesError(Exception):
+    """
+    raised by a batch lookup when the provider rejected the request because at least one of the
+    addresses in it is invalid
+    """
+    pass
+
+
+# URL length budget of a single request. long query strings are rejected by some servers and
+# proxies, so addresses are split into several requests to stay within the budget
+MAX_URL_LENGTH = 2000
+
+# maximum number of addresses in a single request to each provider
+BLOCKCHAIN_INFO_MAX_BATCH = 100
+ETHERSCAN_MAX_BATCH = 20  # the limit of etherscan's balancemulti
+BTC_COM_MAX_BATCH = 50
+ERC20_MAX_BATCH = 100  # eth_call requests in a single JSON-RPC batch
+
+
+def split_to_batches(
+    addresses: List[str],
+    base_url_length: int,
+    separator_length: int,
+    max_batch_size: int,
+    max_url_length: int = MAX_URL_LENGTH,
+) -> List[List[str]]:
+    """
+    split addresses to consecutive batches such that each batch has at most max_batch_size
+    addresses, and the URL of each batch is at most max_url_length characters long
+    (an address which is too long by itself gets its own batch)
+
+    :param base_url_length: the length of the URL without any addresses
+    :param separator_length: the length of the separator between addresses, as it appears in
+                             the URL
+    """
+    batches = []
+    batch = []
+    url_length = base_url_length
+    for addr in addresses:
+        addr_length = len(addr) + (separator_length if len(batch) > 0 else 0)
+        if len(batch) > 0 and (len(batch) == max_batch_size or
+                               url_length + addr_length > max_url_length):
+            batches.append(batch)
+            batch = []
+            url_length = base_url_length
+            addr_length = len(addr)
+        batch.append(addr)
+        url_length += addr_length
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+
+def lookup_bisecting(
+    lookup_batch: Callable[[List[str]], Optional[List[float]]],
+    addresses: List[str],
+) -> Optional[List[float]]:
+    """
+    look up a batch of addresses. If the provider rejects the batch because some of its addresses
+    are invalid, split it to halves and look up each half the same way, until the invalid
+    addresses are isolated. Invalid addresses get a NOT_FOUND balance.
+    For k invalid addresses out of n, this costs O(k*log(n)) additional requests
+
+    :return: the balances of the addresses, or None in case of failure
+    """
+    try:
+        return lookup_batch(addresses)
+    except InvalidAddressesError:
+        if len(addresses) == 1:
+            logger.info(f"Invalid address: {addresses[0]}")
+            return [NOT_FOUND]
+    
+    middle = len(addresses) // 2
+    halves = [addresses[:middle], addresses[middle:]]
+    results = [lookup_bisecting(lookup_batch, half) for half in halves]
+    if any(result is None for result in results):
+        return None
+    return results[0] + results[1]
+
+
+def lookup_in_batches(
+    lookup_batch: Callable[[List[str]], Optional[List[float]]],
+    addresses: List[str],
+    base_url_length: int,
+    separator_length: int,
+    max_batch_size: int,
+    max_url_length: float = MAX_URL_LENGTH,
+) -> Optional[List[float]]:
+    """
+    split the addresses to batches (see split_to_batches), look up the batches concurrently
+    using lookup_batch and merge the results back in the order of the input addresses.
+    Batches rejected because of invalid addresses are bisected (see lookup_bisecting).
+    If any of the batches failed, None is returned - a partial result would understate the
+    total balance
+
+    :param lookup_batch: looks up a single batch. returns the balances of the batch, None in case
+                         of failure, or raises InvalidAddressesError
+    """
+    if len(addresses) == 0:
+        return []
+    batches = split_to_batches(addresses, base_url_length, separator_length, max_batch_size,
+                               max_url_length)
+    lookup = partial(lookup_bisecting, lookup_batch)
+    if len(batches) == 1:
+        results = [lookup(batches[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(batches), BATCH_MAX_WORKERS)) as executor:
+            results = list(executor.map(lookup, batches))
+    
+    balances = []
+    for batch, result in zip(batches, results):
+        if result is None:
+            logger.error(f"Failed to look up a batch of {len(batch)} addresses")
+            return None
+        balances.extend(result)
+    return balances
+
+
+def blockchain_info_balance_url() -> str:
+    return f"{BLOCKCHAIN_INFO_URL}/balance?active="
+
+
+@traced(describe=lambda addresses: {"addresses": len(addresses)})
+def _lookup_btc_batch(addresses: List[str]) -> Optional[List[float]]:
     all_addresses = "|".join(addresses)
-    query = f"https://blockchain.info/balance?active={all_addresses}"
+    query = f"{blockchain_info_balance_url()}{all_addresses}"
     
-    response = requests.get(query)
+    response = transport.get(query)
+    if response is None:
+        return None
     if not response.ok:
-        # TODO: if at least one of the addresses is invalid the call will fail. try extracting them
-        #  one by one
+        # if at least one of the addresses is invalid the whole call fails with a bad request.
+        # other failures (e.g. rate limits, server errors) are not about the addresses
+        if response.status_code == 400:
+            raise InvalidAddressesError(response.text)
         return None
     
     response_json = response.json()
     
     return [
-        response_json[addr]['final_balance'] / 1e8  # amount is returned in satoshis
+        # amount is returned in satoshis. it includes unconfirmed transactions, if there are any
+        response_json[addr]['final_balance'] / 1e8
+        if addr in response_json
+        else NOT_FOUND
         for addr in addresses
     ]
 
 
-def lookup_eth_addresses(addresses: List[str]) -> Optional[List[float]]:
+def lookup_btc_addresses(addresses: List[str]) -> Optional[List[float]]:
+    return lookup_in_batches(
+        _lookup_btc_batch, addresses,
+        base_url_length=len(blockchain_info_balance_url()),
+        separator_length=len("%7C"),  # '|' is percent-encoded in the URL
+        max_batch_size=BLOCKCHAIN_INFO_MAX_BATCH,
+    )
+
+
+def etherscan_balance_url() -> str:
+    return f"{ETHERSCAN_URL}/api?module=account&action=balancemulti&address="
+
+
+@traced(describe=lambda addresses: {"addresses": len(addresses)})
+def _lookup_eth_batch(addresses: List[str]) -> Optional[List[float]]:
     all_addresses = ",".join(addresses)
-    query = f"https://api.etherscan.io/api?module=account&action=balancemulti&address={all_addresses}"
+    query = f"{etherscan_balance_url()}{all_addresses}"
     
-    response = requests.get(query)
-    if not response.ok:
+    response = transport.get(query)
+    if response is None or not response.ok:
         return None
-    response_json: List[dict] = response.json()['result']
+    response_json = response.json()
+    if response_json.get("status") == "0" and isinstance(response_json.get("result"), str):
+        # e.g. 'Error! Invalid address format'. the result is an error message instead of a list
+        if "invalid" in response_json["result"].lower():
+            raise InvalidAddressesError(response_json["result"])
+        logger.error(f"ETH addresses lookup failed: {response_json['result']}")
+        return None
+    response_json: List[dict] = response_json['result']
     
     # check that the addresses in the response are in the same order
     if not all(map(
@@ -48,28 +224,97 @@ def lookup_eth_addresses(addresses: List[str]) -> Optional[List[float]]:
         return None
     
     return [
-        float(response_dict["balance"]) / 1e18  # amount is returned in atomic units
+        # amount is returned in atomic units, as of the latest block
+        ConfirmedBalance(float(response_dict["balance"]) / 1e18)
         if "balance" in response_dict and response_dict["balance"] != ""
         else NOT_FOUND
         for response_dict in response_json
     ]
 
 
-def lookup_addresses_btc_com_api(chain: str, addresses: List[str]) -> Optional[List[float]]:
+def lookup_eth_addresses(addresses: List[str]) -> Optional[List[float]]:
+    return lookup_in_batches(
+        _lookup_eth_batch, addresses,
+        base_url_length=len(etherscan_balance_url()),
+        separator_length=len(","),
+        max_batch_size=ETHERSCAN_MAX_BATCH,
+    )
+
+
+# the selector of the ERC-20 balanceOf(address) function
+ERC20_BALANCE_OF = "0x70a08231"
+
+
+@traced(describe=lambda contract, decimals, addresses: {
+    "contract": contract, "addresses": len(addresses),
+})
+def _lookup_erc20_batch(contract: str, decimals: int,
+                        addresses: List[str]) -> Optional[List[float]]:
+    # a balanceOf call for every address, in a single JSON-RPC batch. the address is the call's
+    # argument, left-padded to 32 bytes
+    calls = [
+        {"jsonrpc": "2.0", "id": i, "method": "eth_call", "params": [
+            {"to": contract, "data": ERC20_BALANCE_OF + addr[2:].lower().rjust(64, "0")},
+            "latest",
+        ]}
+        for i, addr in enumerate(addresses)
+    ]
+    response = transport.post(ETH_RPC_URL, calls)
+    if response is None or not response.ok:
+        return None
+    try:
+        results = {answer["id"]: answer.get("result") for answer in response.json()}
+        return [
+            # as of the latest block. calls that failed (e.g. an invalid address) have an error
+            # instead of a result
+            ConfirmedBalance(int(results[i], 16) / 10 ** decimals)
+            if results.get(i) not in (None, "0x")
+            else NOT_FOUND
+            for i in range(len(addresses))
+        ]
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.error(f"Unexpected ERC-20 balances response: {e!r}")
+        return None
+
+
+def lookup_erc20_addresses(contract: str, decimals: int,
+                           addresses: List[str]) -> Optional[List[float]]:
     """
-    lookup the addresses using the btc.com API, which supports multiple chains
+    return the balances of the given addresses in an ERC-20 token, in whole tokens
+
+    :param contract: the address of the token's contract
+    :param decimals: the number of decimals of the token's atomic units
     """
+    return lookup_in_batches(
+        partial(_lookup_erc20_batch, contract, decimals), addresses,
+        base_url_length=0, separator_length=0, max_batch_size=ERC20_MAX_BATCH,
+        max_url_length=math.inf,  # the addresses are sent in the request body
+    )
+
+
+def btc_com_address_url(chain: str) -> str:
+    return f"{BTC_COM_URLS[chain]}/v3/address/"
+
+
+@traced(describe=lambda chain, addresses: {"chain": chain, "addresses": len(addresses)})
+def _lookup_btc_com_batch(chain: str, addresses: List[str]) -> Optional[List[float]]:
     all_addresses_concat = ",".join(addresses)
-    query = f"https://{chain}-chain.api.btc.com/v3/address/{all_addresses_concat}"
-    response = requests.get(query)
-    if not response.ok:
+    query = f"{btc_com_address_url(chain)}{all_addresses_concat}"
+    response = transport.get(query)
+    if response is None or not response.ok:
         return None
     
     response_json = response.json()
     
     if "data" not in response_json or response_json["data"] is None:
-        error = response_json["err_msg"] if "err_msg" in response_json else ""
-        logger.error(f"Failed to retrieve BCH addresses info: {error}")
+        error = str(response_json.get("err_msg", ""))
+        # the whole request fails if at least one of the addresses is invalid. other errors
+        # (e.g. rate limits, server errors) fail the lookup
+        if "invalid" in error.lower():
+            raise InvalidAddressesError(f"Invalid {chain.upper()} addresses: {error}")
+        logger.error(f"Failed to retrieve {chain.upper()} addresses info: "
+                     f"{response_json.get('err_no')} {error}")
+        return None
     
     # response_json["data"] may be a list of dictionaries, or a singe dictionary
     # if it's a single dictionary, put it in a list so the below code works as
@@ -79,11 +324,32 @@ def lookup_addresses_btc_com_api(chain: str, addresses: List[str]) -> Optional[L
         response_json["data"] = [response_json["data"]]
     
     return [
-        addr_info["balance"] / 1e8  # amount is returned in satoshis
+        _btc_com_balance(addr_info)
+        if addr_info is not None  # unknown addresses may be null
+        else NOT_FOUND
         for addr_info in response_json["data"]
     ]
 
 
+def _btc_com_balance(addr_info: dict) -> float:
+    balance = addr_info["balance"] / 1e8  # amount is returned in satoshis
+    if addr_info.get("unconfirmed_tx_count") == 0:
+        return ConfirmedBalance(balance)
+    return balance
+
+
+def lookup_addresses_btc_com_api(chain: str, addresses: List[str]) -> Optional[List[float]]:
+    """
+    lookup the addresses using the btc.com API, which supports multiple chains
+    """
+    return lookup_in_batches(
+        partial(_lookup_btc_com_batch, chain), addresses,
+        base_url_length=len(btc_com_address_url(chain)),
+        separator_length=len(","),
+        max_batch_size=BTC_COM_MAX_BATCH,
+    )
+
+
 def lookup_bch_addresses(addresses: List[str]) -> Optional[List[float]]:
     return lookup_addresses_btc_com_api(chain="bch", addresses=addresses)
 
@@ -92,57 +358,340 @@ def lookup_ltc_addresses(addresses: List[str]) -> Optional[List[float]]:
     return lookup_addresses_btc_com_api(chain="ltc", addresses=addresses)
 
 
-def lookup_addresses(coin: str, addresses: List[str]) -> Optional[List[float]]:
+def _blockchain_info_height() -> Optional[int]:
+    response = transport.get(f"{BLOCKCHAIN_INFO_URL}/q/getblockcount")
+    if response is None or not response.ok:
+        return None
+    try:
+        return int(response.text)
+    except ValueError:
+        logger.error(f"Unexpected BTC block count: {response.text!r}")
+        return None
+
+
+def _etherscan_height() -> Optional[int]:
+    response = transport.get(f"{ETHERSCAN_URL}/api?module=proxy&action=eth_blockNumber")
+    if response is None or not response.ok:
+        return None
+    try:
+        return int(response.json()["result"], 16)  # the block number is a hex string
+    except (ValueError, KeyError, TypeError):
+        logger.error(f"Unexpected ETH block number: {response.text!r}")
+        return None
+
+
+def _btc_com_height(chain: str) -> Optional[int]:
+    response = transport.get(f"{BTC_COM_URLS[chain]}/v3/block/latest")
+    if response is None or not response.ok:
+        return None
+    try:
+        return int(response.json()["data"]["height"])
+    except (ValueError, KeyError, TypeError):
+        logger.error(f"Unexpected {chain.upper()} latest block: {response.text!r}")
+        return None
+
+
+# sources of the chain height of each coin, tried in order
+chain_height_sources: Dict[str, List[Callable[[], Optional[int]]]] = {
+    "BTC": [_blockchain_info_height, partial(_btc_com_height, "btc")],
+    "ETH": [_etherscan_height],
+    "BCH": [partial(_btc_com_height, "bch")],
+    "LTC": [partial(_btc_com_height, "ltc")],
+}
+
+
+# concurrent lookups of the height of the same chain wait for a single request
+height_lookups = SingleFlight()
+
+
+def _fetch_chain_heights(coins: List[str]) -> Dict[str, int]:
+    heights = {}
+    for coin in coins:
+        for source in chain_height_sources.get(coin, []):
+            height = source()
+            if height is not None:
+                heights[coin] = height
+                break
+    return heights
+
+
+@traced(describe=lambda coin: {"coin": coin})
+def lookup_chain_height(coin: str) -> Optional[int]:
+    """
+    return the height of the tip of the given coin's chain, or None if it's unknown (the coin has
+    no height source, or all of them failed)
+    """
+    coin_symbol = coin.upper()
+    return height_lookups.lookup([coin_symbol], _fetch_chain_heights).get(coin_symbol)
+
+
+# providers of each coin. lookups go to the fastest healthy provider and fall back to the others
+provider_registry = ProviderRegistry(hedge_after=PROVIDER_HEDGE_AFTER)
+# keys are coin symbols
+electrum_backends: Dict[str, ElectrumBackend] = {}
+
+
+def register_electrum_server(coin: str, host: str, port: int,
+                             use_ssl: bool = False) -> ElectrumBackend:
     """
-    return the balance of given addresses of some coin
+    look up the balances and the chain height of the given coin in an Electrum server. The server
+    notifies when subscribed addresses change, and their cached balances are dropped then
+    """
+    coin_symbol = coin.upper()
+    backend = ElectrumBackend(
+        coin_symbol, ElectrumClient(host, port, use_ssl),
+        on_change=lambda address: forget_addresses(coin_symbol, [address]),
+    )
+    electrum_backends[coin_symbol] = backend
+    provider_registry.register(coin_symbol, backend.client.name, backend.lookup)
+    chain_height_sources.setdefault(coin_symbol, []).insert(0, backend.chain_height)
+    return backend
+
+
+# keys are token symbols. values are (contract address, decimals)
+erc20_tokens: Dict[str, Tuple[str, int]] = {}
+
+
+def register_erc20_token(symbol: str, contract: str, decimals: int):
+    """
+    look up the balances of an ERC-20 token like those of a coin: lookup_addresses(symbol, ...)
+    returns the token balances of ETH addresses, cached until the ETH chain tip advances
+    """
+    token_symbol = symbol.upper()
+    erc20_tokens[token_symbol] = (contract, decimals)
+    provider_registry.register(token_symbol, "eth-rpc",
+                               partial(lookup_erc20_addresses, contract, decimals))
+    chain_height_sources[token_symbol] = [partial(lookup_chain_height, "ETH")]
+
+
+# Electrum servers are registered first, so they are tried before the explorers
+for electrum_coin, electrum_server in ELECTRUM_SERVERS.items():
+    register_electrum_server(electrum_coin, *electrum_server)
+provider_registry.register("BTC", "blockchain.info", lookup_btc_addresses)
+provider_registry.register("BTC", "btc.com", partial(lookup_addresses_btc_com_api, "btc"))
+provider_registry.register("ETH", "etherscan", lookup_eth_addresses)
+provider_registry.register("BCH", "btc.com", lookup_bch_addresses)
+provider_registry.register("LTC", "btc.com", lookup_ltc_addresses)
+for token_symbol, (token_contract, token_decimals) in ERC20_TOKENS.items():
+    register_erc20_token(token_symbol, token_contract, token_decimals)
+
+
+def provider_urls(coin: str) -> List[str]:
+    """
+    return the base URLs of the providers of the given coin
+    """
+    coin_symbol = coin.upper()
+    if coin_symbol in erc20_tokens:
+        return [ETH_RPC_URL]
+    return {
+        "BTC": [BLOCKCHAIN_INFO_URL, BTC_COM_URLS["btc"]],
+        "ETH": [ETHERSCAN_URL],
+        "BCH": [BTC_COM_URLS["bch"]],
+        "LTC": [BTC_COM_URLS["ltc"]],
+    }.get(coin_symbol, [])
+
+
+def is_throttled(coin: str) -> bool:
+    """
+    return True if all the providers of the given coin are currently throttling our requests.
+    In this case a failed lookup means 'try again later', rather than 'no balance'
+    """
+    urls = provider_urls(coin)
+    return len(urls) > 0 and all(transport.is_throttled(url) for url in urls)
+
+
+@traced(describe=lambda coin, addresses: {"coin": coin, "addresses": len(addresses)})
+def fetch_addresses(coin: str, addresses: List[str]) -> Optional[List[float]]:
+    """
+    look up the balance of given addresses of some coin in the providers of that coin,
+    bypassing the balance cache. See lookup_addresses for the parameters and return value
+    """
+    return provider_registry.lookup(coin.upper(), addresses)
+
+
+# keys are (coin_symbol, address). values are (address balance, height of the chain tip when
+# the balance was looked up). The height is None if it couldn't be looked up, or the balance
+# had unconfirmed amounts in it
+balance_cache = TTLCache(ttl=BALANCE_TTL, keep_expired_for=BALANCE_KEEP_EXPIRED)
+# balances and tickers looked up by any of the CryptoWatch processes. Balances missing from the
+# balance cache are looked for in it before asking the providers. None if sharing is disabled
+shared_cache: Optional[SharedCache] = \
+    SharedCache(SHARED_CACHE_FULLPATH) if SHARED_CACHE_FULLPATH is not None else None
+# keys are (coin_symbol, address). an address which is being looked up (e.g. by the background
+# refresh) isn't looked up again by concurrent callers. they wait for its balance instead
+balance_lookups = SingleFlight()
+
+
+def _fetch_balances(
+    coin_symbol: str,
+    tip: Optional[int],
+    keys: List[Tuple[str, str]],
+) -> Optional[Dict[Tuple[str, str], float]]:
+    """
+    look up the balances of the given (coin_symbol, address) keys in the providers and store them
+    in the balance cache. Return a dictionary from each key to its balance, or None in case of
+    failure
+    """
+    balances = fetch_addresses(coin_symbol, [addr for _, addr in keys])
+    if balances is None:
+        return None
+    found = {
+        # balances with unconfirmed amounts may change before the next block, so only confirmed
+        # balances are stored with the tip they can be renewed by
+        key: (balance, tip if isinstance(balance, ConfirmedBalance) else None)
+        for key, balance in zip(keys, balances)
+        if balance != NOT_FOUND  # might be a temporary failure. don't remember it
+    }
+    balance_cache.put_many(found)
+    if shared_cache is not None:
+        shared_cache.put_balances(found, time.time())
+    return dict(zip(keys, balances))
+
+
+@traced(describe=lambda coin, addresses, use_cache=True, revalidate=False: {
+    "coin": coin, "addresses": len(addresses), "use_cache": use_cache, "revalidate": revalidate,
+})
+def lookup_addresses(
+    coin: str,
+    addresses: List[str],
+    use_cache: bool = True,
+    revalidate: bool = False,
+) -> Optional[List[float]]:
+    """
+    return the balance of given addresses of some coin.
+    Balances that were looked up less than BALANCE_TTL seconds ago are taken from the balance
+    cache. Balances can change only when a new block arrives, so older balances are taken from
+    the cache too if the chain tip hasn't advanced since they were looked up - this costs a
+    single chain height lookup. Balances missing from the balance cache are taken from the cache
+    shared with the other CryptoWatch processes, if another process looked them up. Only the rest
+    of the addresses are looked up in the provider
 
     :param coin the currency code (e.g. 'BTC' for bitcoin, 'ETH' for Ethereum, etc)
     :param addresses: a list of strings. each string is an address to look
+    :param use_cache: if False, all the addresses are looked up in the provider, without
+                      looking up the chain tip. The balance cache is still updated with the results
+    :param revalidate: if True, cached balances are taken only if the chain tip hasn't advanced
+                       since they were looked up, however recently that was (e.g. when polling
+                       for changes). Ignored if use_cache is False
     :return: a list of floats which correspond to the balances of the input addresses.
              If an address' balance could not be found or the address is invalid, the
              returned balance for this address is -1.
              In case of failure None is returned
     """
     coin_symbol = coin.upper()
+    # dict.fromkeys removes duplicates and keeps the order
+    keys = list(dict.fromkeys((coin_symbol, addr) for addr in addresses))
+    cached = balance_cache.get_many(keys) if use_cache and not revalidate else {}
+    missing = [key for key in keys if key not in cached]
+    if use_cache and shared_cache is not None and len(missing) > 0:
+        shared = shared_cache.get_balances(missing)
+        # seeded also when revalidating, so the chain tip check below covers the shared balances
+        balance_cache.seed(shared)
+        if not revalidate:
+            fresh = balance_cache.get_many(shared)
+            metrics.record_cache("shared balances", hits=len(fresh),
+                                 misses=len(missing) - len(fresh))
+            cached.update(fresh)
+            missing = [key for key in missing if key not in fresh]
+    if len(missing) == 0:
+        metrics.record_cache("balances", hits=len(keys), misses=0)
+        return [cached[(coin_symbol, addr)][0] for addr in addresses]
     
-    if coin_symbol == 'BTC':
-        return lookup_btc_addresses(addresses)
+    # taken before looking up the balances, so a block that arrives meanwhile is noticed by the
+    # next lookup
+    tip = lookup_chain_height(coin_symbol) if use_cache else None
+    if tip is not None:
+        expired = balance_cache.get_many(missing, include_expired=True)
+        unchanged = {key: value for key, value in expired.items() if value[1] == tip}
+        balance_cache.renew(unchanged)
+        if shared_cache is not None:
+            shared_cache.put_balances(unchanged, time.time())
+        cached.update(unchanged)
+        missing = [key for key in missing if key not in unchanged]
+    metrics.record_cache("balances", hits=len(keys) - len(missing), misses=len(missing))
     
-    if coin_symbol == 'ETH':
-        return lookup_eth_addresses(addresses)
+    if len(missing) > 0:
+        # addresses which are being looked up by another caller are not looked up again
+        fetched = balance_lookups.lookup(missing, partial(_fetch_balances, coin_symbol, tip))
+        if len(fetched) < len(missing):
+            return None  # some of the addresses couldn't be looked up
+        cached.update((key, (balance, tip)) for key, balance in fetched.items())
     
-    if coin_symbol == "BCH":
-        return lookup_bch_addresses(addresses)
-    
-    if coin_symbol == "LTC":
-        return lookup_ltc_addresses(addresses)
+    return [cached.get((coin_symbol, addr), (NOT_FOUND,))[0] for addr in addresses]
+
+
+def forget_addresses(coin: str, addresses: List[str]):
+    """
+    remove the balances of the given addresses from the balance cache, and from the cache shared
+    with the other processes
+    """
+    coin_symbol = coin.upper()
+    keys = [(coin_symbol, addr) for addr in addresses]
+    balance_cache.invalidate(keys)
+    if shared_cache is not None:
+        shared_cache.forget_balances(keys)
+
+
+@traced()
+def fetch_ticker() -> Optional[Dict[str, Quote]]:
+    """
+    download the coins ticker
+
+    :return: a dictionary from coin symbol to its (value_USD, value_BTC).
+             In case of failure None is returned
+    """
+    response = transport.get(f"{COINMARKETCAP_URL}/v1/ticker/")
+    if response is None or not response.ok:
+        return None
     
-    return None
+    quotes = {}
+    try:
+        with span("parse ticker", bytes=len(response.content)):
+            ticker = response.json()
+        for coin_info in ticker:
+            symbol = coin_info['symbol'].upper()
+            # several coins may share a symbol. the ticker is sorted by rank, so keep the first
+            if symbol in quotes or coin_info['price_usd'] is None or coin_info['price_btc'] is None:
+                continue
+            quotes[symbol] = (float(coin_info['price_usd']), float(coin_info['price_btc']))
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"Unexpected ticker response: {e!r}")
+        return None
+    return quotes
+
+
+def _load_shared_ticker() -> Optional[Tuple[Dict[str, Quote], float]]:
+    return shared_cache.get_ticker() if shared_cache is not None else None
 
 
+def _store_shared_ticker(quotes: Dict[str, Quote], fetched_at: float):
+    if shared_cache is not None:
+        shared_cache.put_ticker(quotes, fetched_at)
+
+
+price_cache = PriceCache(ttl=PRICE_TTL, fetch_ticker=fetch_ticker,
+                         load_shared=_load_shared_ticker, store_shared=_store_shared_ticker)
+
+
+@traced(describe=lambda coins: {"coins": len(coins)})
 def lookup_value(coins: List[str]) -> List[Optional[Tuple[float, float]]]:
     """
-    return the value of the given coins in USD and BTC
+    return the value of the given coins in USD and BTC.
+    Values are taken from the price cache. The ticker is downloaded only if the cached one is
+    older than PRICE_TTL, and if downloading fails the last known values are returned
 
     :param coins: a collection of coin codes.
     :return: list of tuples - each tuple is (coin_value_USD, coin_value_BTC).
              if a coin is not found, None is placed in its corresponding index in the list
     """
-    res = []
-    try:
-        all_coins = requests.get('https://api.coinmarketcap.com/v1/ticker/').json()
-        for coin in coins:
-            coin = coin.upper()
-            found = False
-            for coin_info in all_coins:
-                if coin_info['symbol'] == coin:
-                    # this is the coin
-                    found = True
-                    res.append((float(coin_info['price_usd']), float(coin_info['price_btc'])))
-                    break
-            if not found:
-                res.append(('N/A', 'N/A'))
-        return res
-    
-    except Exception:
-        return [None] * len(coins)
+    fresh = price_cache.is_fresh()
+    metrics.record_cache("prices", hits=int(fresh), misses=int(not fresh))
+    return price_cache.get_quotes(coins)
+
+
+def price_age(coin: str) -> Optional[float]:
+    """
+    return the number of seconds since the value of the given coin was downloaded, or None if
+    its value is unknown
+    """
+    return price_cache.age(coin)
@@ -0,0 +1,413 @@
+import itertools
+import json
+import socket
+import ssl
+import time
+from concurrent.futures import Future, TimeoutError
+from hashlib import sha256
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+from address_validation import (BASE58_VERSIONS, SEGWIT_HRPS, InvalidAddress, base58check_decode,
+                                cashaddr_decode, normalize_address, segwit_decode)
+from config import ELECTRUM_TIMEOUT
+from metrics import metrics
+from providers import ConfirmedBalance
+from utils import logger
+
+"""
+This module is a client of the Electrum server protocol (ElectrumX, electrs, Fulcrum), which is
+served by a full node of your own. Unlike the HTTP explorers, a single persistent connection is
+kept to the server: the balances of all the addresses are requested in one batch (one round
+trip), and the server pushes changes of the subscribed addresses and of the chain tip instead of
+being polled.
+The protocol is JSON-RPC 2.0, a message per line, over TCP or SSL. Addresses are identified by
+the hash of their output script (scripthash).
+"""
+
+CLIENT_NAME = "cryptowatch"
+PROTOCOL_VERSION = "1.4"
+SATOSHIS_PER_COIN = 10 ** 8
+NOT_FOUND = -1  # the balance of an invalid address, as in data_retriever
+
+# version bytes of the P2PKH addresses of each coin. the other versions are P2SH
+P2PKH_VERSIONS = {"BTC": 0x00, "BCH": 0x00, "LTC": 0x30}
+CASHADDR_P2PKH = 0
+
+
+class ElectrumError(Exception):
+    """
+    raised when a request fails: the server answered with an error, the connection was lost, or
+    the answer didn't arrive in time
+    """
+    pass
+
+
+def _p2pkh_script(pubkey_hash: bytes) -> bytes:
+    # OP_DUP OP_HASH160 <hash> OP_EQUALVERIFY OP_CHECKSIG
+    return bytes([0x76, 0xa9, len(pubkey_hash)]) + pubkey_hash + bytes([0x88, 0xac])
+
+
+def _p2sh_script(script_hash: bytes) -> bytes:
+    # OP_HASH160 <hash> OP_EQUAL
+    return bytes([0xa9, len(script_hash)]) + script_hash + bytes([0x87])
+
+
+def address_script(coin: str, address: str) -> bytes:
+    """
+    :return: the output script which pays to the given address
+    :raise InvalidAddress: if it isn't a valid address of the coin
+    """
+    coin_symbol = coin.upper()
+    if coin_symbol not in BASE58_VERSIONS:
+        raise InvalidAddress(f"{coin_symbol} addresses aren't supported")
+    address = normalize_address(coin_symbol, address)
+    hrp = SEGWIT_HRPS.get(coin_symbol)
+    if hrp is not None and address.startswith(hrp + "1"):
+        version, program = segwit_decode(hrp, address)
+        # OP_0 or OP_1..OP_16, followed by the program
+        return bytes([version + 0x50 if version > 0 else 0, len(program)]) + program
+    if coin_symbol == "BCH" and address[0] in "qp":
+        address_type, address_hash = cashaddr_decode(address)
+        return (_p2pkh_script if address_type == CASHADDR_P2PKH else _p2sh_script)(address_hash)
+    payload = base58check_decode(address)
+    if payload[0] == P2PKH_VERSIONS[coin_symbol]:
+        return _p2pkh_script(payload[1:])
+    return _p2sh_script(payload[1:])
+
+
+def address_to_scripthash(coin: str, address: str) -> str:
+    """
+    :return: the scripthash of the given address, by which the Electrum servers identify it
+    :raise InvalidAddress: if it isn't a valid address of the coin
+    """
+    return sha256(address_script(coin, address)).digest()[::-1].hex()
+
+
+class ElectrumClient:
+    """
+    A persistent connection to an Electrum server. The connection is opened on the first request,
+    and re-opened by the first request after it was lost. Answers and notifications are read by
+    a background thread
+    """
+    
+    def __init__(self, host: str, port: int, use_ssl: bool = False,
+                 timeout: float = ELECTRUM_TIMEOUT):
+        """
+        :param timeout: seconds to wait for the connection, and for the answers of a request
+        """
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.name = f"electrum {host}:{port}"
+        # incremented on every connection. None while disconnected. subscriptions are kept by
+        # the server only for the connection they were made on
+        self.connection_id: Optional[int] = None
+        self._connections = itertools.count(1)
+        self._socket: Optional[socket.socket] = None
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}  # keys are the ids of requests waiting for answers
+        self._handlers: Dict[str, Callable[[list], None]] = {}  # keys are notification methods
+        self._lock = Lock()  # guards the connection and the pending requests
+    
+    def on_notification(self, method: str, handler: Callable[[list], None]):
+        """
+        call the handler with the params of every notification of the given method. The handler
+        is called from the reader thread, so it shouldn't block
+        """
+        self._handlers[method] = handler
+    
+    def _connect(self) -> socket.socket:
+        # must be called while holding the lock
+        if self._socket is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            if self.use_ssl:
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+            sock.settimeout(None)  # the reader waits for notifications as long as needed
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._socket = sock
+            self.connection_id = next(self._connections)
+            Thread(target=self._read_loop, args=(sock,), name="electrum-reader",
+                   daemon=True).start()
+            # the version must be negotiated first. it's sent along with the first request, so it
+            # doesn't cost a round trip
+            self._send(sock, self._make_request("server.version",
+                                                [CLIENT_NAME, PROTOCOL_VERSION])[0])
+            logger.info(f"Connected to Electrum server {self.host}:{self.port}")
+        return self._socket
+    
+    def _make_request(self, method: str, params: list) -> Tuple[dict, Future]:
+        # must be called while holding the lock
+        request_id = next(self._ids)
+        future = Future()
+        self._pending[request_id] = future
+        return {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}, future
+    
+    def _send(self, sock: socket.socket, message):
+        sock.sendall(json.dumps(message).encode() + b"\n")
+    
+    def batch(self, calls: List[Tuple[str, list]]) -> List[object]:
+        """
+        send the given calls in a single message, and wait for all the answers
+
+        :param calls: list of (method, params)
+        :return: the results of the calls, in order
+        :raise ElectrumError: if any of the calls failed
+        """
+        if len(calls) == 0:
+            return []
+        start = time.monotonic()
+        try:
+            results = self._batch(calls)
+        except ElectrumError:
+            metrics.record_request(self.name, time.monotonic() - start, succeeded=False)
+            raise
+        metrics.record_request(self.name, time.monotonic() - start, succeeded=True)
+        return results
+    
+    def connect(self) -> int:
+        """
+        open the connection, unless it's open already
+
+        :return: the id of the connection
+        :raise ElectrumError: if the server can't be connected
+        """
+        with self._lock:
+            self._open()
+            return self.connection_id
+    
+    def _open(self) -> socket.socket:
+        # must be called while holding the lock
+        try:
+            return self._connect()
+        except OSError as e:
+            raise ElectrumError(f"can't connect to {self.host}:{self.port}: {e!r}")
+    
+    def _batch(self, calls: List[Tuple[str, list]]) -> List[object]:
+        with self._lock:
+            sock = self._open()
+            requests, futures = zip(*(self._make_request(method, params)
+                                      for method, params in calls))
+            try:
+                # a batch is a JSON array of requests
+                self._send(sock, requests[0] if len(requests) == 1 else list(requests))
+            except OSError as e:
+                self._disconnect(sock, e)
+        
+        try:
+            return [future.result(timeout=self.timeout) for future in futures]
+        except TimeoutError:
+            # a request which isn't answered leaves the connection in an unknown state
+            with self._lock:
+                if self._socket is not None:
+                    self._disconnect(self._socket, "timed out")
+            raise ElectrumError(f"{self.host}:{self.port} didn't answer in {self.timeout} seconds")
+    
+    def call(self, method: str, *params) -> object:
+        return self.batch([(method, list(params))])[0]
+    
+    def _read_loop(self, sock: socket.socket):
+        reason = "connection closed"
+        try:
+            with sock.makefile("rb") as f:
+                for line in f:
+                    message = json.loads(line)
+                    for item in message if isinstance(message, list) else [message]:
+                        if not isinstance(item, dict):
+                            raise ValueError(f"unexpected message {item!r}")
+                        self._dispatch(item)
+        except OSError as e:
+            reason = e
+        except (TypeError, ValueError) as e:  # not JSON, or not a JSON-RPC message
+            logger.error(f"Invalid message from Electrum server {self.host}:{self.port}: {e!r}")
+            reason = e
+        with self._lock:
+            self._disconnect(sock, reason)
+    
+    def _dispatch(self, message: dict):
+        if message.get("id") is not None:
+            with self._lock:
+                future = self._pending.pop(message["id"], None)
+            if future is None:
+                return
+            if message.get("error"):
+                future.set_exception(ElectrumError(message["error"]))
+            else:
+                future.set_result(message.get("result"))
+            return
+        
+        handler = self._handlers.get(message.get("method"))
+        if handler is None:
+            return
+        try:
+            handler(message.get("params", []))
+        except Exception as e:
+            logger.error(f"Electrum notification {message.get('method')} handler raised {e!r}")
+    
+    def _disconnect(self, sock: socket.socket, reason):
+        # must be called while holding the lock
+        if self._socket is not sock:
+            return  # already disconnected
+        self._socket = None
+        self.connection_id = None
+        try:
+            sock.close()
+        except OSError:
+            pass
+        for future in self._pending.values():
+            future.set_exception(ElectrumError(f"connection lost: {reason}"))
+        self._pending.clear()
+        logger.info(f"Disconnected from Electrum server {self.host}:{self.port}: {reason}")
+    
+    def close(self):
+        with self._lock:
+            if self._socket is not None:
+                self._disconnect(self._socket, "closed")
+
+
+def _electrum_balance(balance: dict) -> float:
+    amount = (balance["confirmed"] + balance["unconfirmed"]) / SATOSHIS_PER_COIN
+    return ConfirmedBalance(amount) if balance["unconfirmed"] == 0 else amount
+
+
+class ElectrumBackend:
+    """
+    Looks up the addresses of a coin in an Electrum server.
+    Looked up addresses are subscribed to, and their balances are kept until the server notifies
+    that they changed, so unchanged addresses are answered without a request. The chain tip is
+    subscribed to as well
+    """
+    
+    def __init__(self, coin: str, client: ElectrumClient,
+                 on_change: Optional[Callable[[str], None]] = None):
+        """
+        :param on_change: called with an address whose balance has changed, as notified by the
+                          server
+        """
+        self.coin = coin.upper()
+        self.client = client
+        self.on_change = on_change
+        self._connection_id: Optional[int] = None  # the connection of the subscriptions below
+        # keys are scripthashes. statuses of the subscribed addresses, as sent by the server
+        self._statuses: Dict[str, Optional[str]] = {}
+        self._balances: Dict[str, float] = {}  # of subscribed addresses, until they change
+        self._addresses: Dict[str, str] = {}  # the address of each scripthash
+        self._tip_height: Optional[int] = None
+        self._lock = Lock()
+        client.on_notification("blockchain.scripthash.subscribe", self._status_changed)
+        client.on_notification("blockchain.headers.subscribe", self._new_tip)
+    
+    def _check_connection(self):
+        # must be called while holding the lock. subscriptions don't survive reconnections
+        if self._connection_id != self.client.connection_id:
+            self._connection_id = self.client.connection_id
+            self._statuses.clear()
+            self._balances.clear()
+            self._tip_height = None
+    
+    def lookup(self, addresses: List[str]) -> Optional[List[float]]:
+        """
+        :return: the balances of the given addresses (NOT_FOUND for invalid addresses), or None
+                 in case of failure
+        """
+        scripthashes = []
+        for addr in addresses:
+            try:
+                scripthashes.append(address_to_scripthash(self.coin, addr))
+            except InvalidAddress:
+                scripthashes.append(None)
+        
+        with self._lock:
+            self._check_connection()
+            self._addresses.update((sh, addr) for sh, addr in zip(scripthashes, addresses)
+                                   if sh is not None)
+            known = {sh: self._balances[sh] for sh in scripthashes if sh in self._balances}
+            missing = list(dict.fromkeys(sh for sh in scripthashes
+                                         if sh is not None and sh not in known))
+            unsubscribed = [sh for sh in missing if sh not in self._statuses]
+            expected_statuses = {sh: self._statuses[sh] for sh in missing if sh in self._statuses}
+        
+        if len(missing) > 0:
+            try:
+                connection_id = self.client.connect()
+                # subscribing first, so changes after the balances were read are notified
+                results = self.client.batch(
+                    [("blockchain.scripthash.subscribe", [sh]) for sh in unsubscribed] +
+                    [("blockchain.scripthash.get_balance", [sh]) for sh in missing]
+                )
+                fetched = {
+                    sh: _electrum_balance(balance)
+                    for sh, balance in zip(missing, results[len(unsubscribed):])
+                }
+            except (ElectrumError, KeyError, TypeError) as e:
+                logger.error(f"Electrum lookup of {len(missing)} {self.coin} addresses failed: "
+                             f"{e!r}")
+                return None
+            known.update(fetched)
+            
+            with self._lock:
+                self._check_connection()
+                # unless it reconnected meanwhile, and the subscriptions were lost with the
+                # connection they were made on
+                if self._connection_id == connection_id:
+                    for sh, status in zip(unsubscribed, results):
+                        # unless a change was notified meanwhile
+                        self._statuses.setdefault(sh, status)
+                        expected_statuses[sh] = status
+                    # a balance is kept only if it didn't change since it was read
+                    self._balances.update((sh, balance) for sh, balance in fetched.items()
+                                          if sh in self._statuses and
+                                          self._statuses[sh] == expected_statuses[sh])
+        
+        return [known[sh] if sh is not None else NOT_FOUND for sh in scripthashes]
+    
+    def chain_height(self) -> Optional[int]:
+        """
+        return the height of the chain tip, or None in case of failure. Only the first call
+        sends a request, later tips are pushed by the server
+        """
+        with self._lock:
+            self._check_connection()
+            if self._tip_height is not None:
+                return self._tip_height
+        try:
+            connection_id = self.client.connect()
+            header = self.client.call("blockchain.headers.subscribe")
+            height = int(header["height"])
+        except (ElectrumError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Electrum {self.coin} tip subscription failed: {e!r}")
+            return None
+        with self._lock:
+            self._check_connection()
+            if self._connection_id != connection_id:
+                return height  # subscribed on a lost connection, so new tips won't be pushed
+            if self._tip_height is None:
+                self._tip_height = height
+            return self._tip_height
+    
+    def _status_changed(self, params: list):
+        scripthash, status = params
+        with self._lock:
+            # the notification may arrive before the answer of the subscription itself
+            if self._connection_id != self.client.connection_id or \
+                    scripthash not in self._addresses:
+                return
+            self._statuses[scripthash] = status
+            self._balances.pop(scripthash, None)
+            address = self._addresses.get(scripthash)
+        if self.on_change is not None and address is not None:
+            self.on_change(address)
+    
+    def _new_tip(self, params: list):
+        with self._lock:
+            if self._connection_id == self.client.connection_id:
+                self._tip_height = int(params[0]["height"])
+    
+    def subscriptions(self) -> int:
+        """
+        return the number of addresses subscribed to on the current connection
+        """
+        with self._lock:
+            self._check_connection()
+            return len(self._statuses)
@@ -0,0 +1,196 @@
+import math
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from config import HISTORY_DIR
+from tracing import traced
+
+"""
+This module keeps the history of the balances of each coin: every refreshed row is appended to
+a file of the coin, as a fixed-width record of (timestamp, amount, value_usd, value_btc).
+Appending writes a single record to the end of the file, and queries map the file to memory and
+find the records they need by bisecting the timestamps, so a query reads only the pages of the
+records it looks at, however long the history is
+"""
+
+# (timestamp, amount, value_usd, value_btc) as little endian doubles. values that weren't known
+# ('N/A' in the row) are NaN
+RECORD = struct.Struct("<4d")
+_TIMESTAMP = struct.Struct("<d")
+
+Record = Tuple[float, float, float, float]
+
+
+def _to_float(value) -> float:
+    return float('nan') if value == 'N/A' else float(value)
+
+
+class _Timestamps(Sequence[float]):
+    """
+    the timestamps of the records in a buffer, read on access, so the records can be bisected
+    without reading them into a list
+    """
+    
+    def __init__(self, buffer, count: int):
+        self._buffer = buffer
+        self._count = count
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __getitem__(self, index: int) -> float:
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return _TIMESTAMP.unpack_from(self._buffer, index * RECORD.size)[0]
+
+
+class HistoryView:
+    """
+    the records of a coin, as mapped from its history file. Records are sorted by timestamp.
+    Only valid inside the BalanceHistory.view block that returned it
+    """
+    
+    def __init__(self, buffer, count: int):
+        self._buffer = buffer
+        self._timestamps = _Timestamps(buffer, count)
+    
+    def __len__(self) -> int:
+        return len(self._timestamps)
+    
+    def record(self, index: int) -> Record:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return RECORD.unpack_from(self._buffer, index * RECORD.size)
+    
+    def latest(self) -> Optional[Record]:
+        return self.record(-1) if len(self) > 0 else None
+    
+    def at(self, timestamp: float) -> Optional[Record]:
+        """
+        return the last record at or before the given time, or None if there is no such record
+        """
+        index = bisect_right(self._timestamps, timestamp) - 1
+        return self.record(index) if index >= 0 else None
+    
+    def range(self, start: float, end: float) -> Iterator[Record]:
+        """
+        yield the records from `start` (inclusive) to `end` (exclusive), one at a time
+        """
+        first = bisect_left(self._timestamps, start)
+        last = bisect_left(self._timestamps, end)
+        for index in range(first, last):
+            yield RECORD.unpack_from(self._buffer, index * RECORD.size)
+
+
+class BalanceHistory:
+    def __init__(self, directory: str = HISTORY_DIR):
+        """
+        :param directory: the history files are kept in this directory, one file per coin
+        """
+        self.directory = directory
+        # the timestamp of the last record of each coin the history was appended to, so records
+        # stay sorted even if the clock goes back
+        self._last_timestamps: Dict[str, float] = {}
+        self._lock = Lock()
+    
+    def path(self, coin_code: str) -> str:
+        return os.path.join(self.directory, quote(coin_code, safe="") + ".bin")
+    
+    def append(self, row: List, timestamp: Optional[float] = None):
+        """
+        append a balances row, as returned by Wallet.get_balances, to the history of its coin.
+        Rows whose amount isn't known are skipped
+
+        :param timestamp: the time of the row. now by default
+        """
+        coin_code, amount, value_usd, value_btc = row
+        if amount == 'N/A':
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        path = self.path(coin_code)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "ab") as f:
+                size = f.tell()
+                if size % RECORD.size != 0:
+                    # the last append was interrupted. drop the partial record
+                    size -= size % RECORD.size
+                    f.truncate(size)
+                last_timestamp = self._last_timestamps.get(coin_code)
+                if last_timestamp is None and size > 0:
+                    with open(path, "rb") as reader:
+                        reader.seek(size - RECORD.size)
+                        last_timestamp = RECORD.unpack(reader.read(RECORD.size))[0]
+                if last_timestamp is not None:
+                    timestamp = max(timestamp, last_timestamp)
+                f.write(RECORD.pack(timestamp, float(amount), _to_float(value_usd),
+                                    _to_float(value_btc)))
+            self._last_timestamps[coin_code] = timestamp
+    
+    @contextmanager
+    def view(self, coin_code: str) -> Iterator[HistoryView]:
+        """
+        map the history of a coin to memory, for the duration of the with block. Records
+        appended meanwhile aren't seen
+        """
+        try:
+            f = open(self.path(coin_code), "rb")
+        except FileNotFoundError:
+            yield HistoryView(b"", 0)
+            return
+        with f:
+            count = os.fstat(f.fileno()).st_size // RECORD.size
+            if count == 0:
+                yield HistoryView(b"", 0)
+                return
+            with mmap.mmap(f.fileno(), count * RECORD.size, access=mmap.ACCESS_READ) as mapped:
+                buffer = memoryview(mapped)
+                try:
+                    yield HistoryView(buffer, count)
+                finally:
+                    buffer.release()
+    
+    @traced(describe=lambda self, coin_code, times: {"coin": coin_code})
+    def usd_values(self, coin_code: str, times: Sequence[float]) -> List[float]:
+        """
+        return the USD value of the coin at each of the given times: the value of its last record
+        at or before the time. NaN where it isn't known
+        """
+        with self.view(coin_code) as history:
+            values = []
+            for timestamp in times:
+                record = history.at(timestamp)
+                values.append(float('nan') if record is None else record[2])
+            return values
+    
+    def delete(self):
+        """
+        delete the history of all the coins
+        """
+        with self._lock:
+            self._last_timestamps.clear()
+            if not os.path.isdir(self.directory):
+                return
+            for filename in os.listdir(self.directory):
+                if filename.endswith(".bin"):
+                    os.remove(os.path.join(self.directory, filename))
+
+
+def change_ratio(before: float, after: float) -> Optional[float]:
+    """
+    return the relative change from `before` to `after` (e.g. 0.1 for 10% up), or None if either
+    isn't known
+    """
+    if math.isnan(before) or math.isnan(after) or before == 0:
+        return None
+    return (after - before) / before
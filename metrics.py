@@ -0,0 +1,165 @@
+import bisect
+import math
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from config import METRICS_LOG_INTERVAL
+from utils import logger
+
+"""
+This module collects metrics of the requests to each provider (counts, latency histograms,
+payload sizes, errors and throttled requests) and of the caches (hits and misses).
+The transport and the Electrum client record every request, and the data retriever records the
+cache lookups. A summary is written to the log file every METRICS_LOG_INTERVAL seconds while
+requests are recorded, and is displayed in the stats screen
+"""
+
+# upper bounds of the latency histogram buckets, in seconds. the last bucket is unbounded
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.max = 0.0
+    
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        return the upper bound of the bucket of the p-th percentile (the maximal value if it's in
+        the unbounded bucket), or None if the histogram is empty
+        """
+        if self.count == 0:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class ProviderMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0  # failed requests: no response or a failure status code
+        self.throttled = 0  # requests the provider rejected with 429, or that ran out of budget
+        self.payload_bytes = 0  # total size of the response bodies
+        self.latency = Histogram()
+
+
+class CacheMetrics:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+    
+    def hit_ratio(self) -> Optional[float]:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else None
+
+
+class Metrics:
+    def __init__(self, log_interval: Optional[float] = METRICS_LOG_INTERVAL):
+        """
+        :param log_interval: seconds between summaries written to the log. None disables them
+        """
+        self.log_interval = log_interval
+        # keys are provider names (hosts of the HTTP providers)
+        self.providers: Dict[str, ProviderMetrics] = {}
+        self.caches: Dict[str, CacheMetrics] = {}  # keys are cache names
+        self._logged_at = time.monotonic()
+        self._lock = Lock()
+    
+    def record_request(self, provider: str, seconds: float, succeeded: bool,
+                       payload_bytes: int = 0, throttled: bool = False):
+        with self._lock:
+            provider_metrics = self.providers.setdefault(provider, ProviderMetrics())
+            provider_metrics.requests += 1
+            provider_metrics.latency.add(seconds)
+            provider_metrics.payload_bytes += payload_bytes
+            if throttled:
+                provider_metrics.throttled += 1
+            elif not succeeded:
+                provider_metrics.errors += 1
+        self._maybe_log()
+    
+    def record_throttled(self, provider: str):
+        """
+        record a request that wasn't sent because the provider's request budget ran out
+        """
+        with self._lock:
+            self.providers.setdefault(provider, ProviderMetrics()).throttled += 1
+    
+    def record_cache(self, cache: str, hits: int, misses: int):
+        with self._lock:
+            cache_metrics = self.caches.setdefault(cache, CacheMetrics())
+            cache_metrics.hits += hits
+            cache_metrics.misses += misses
+    
+    def summary(
+        self,
+        budgets: Optional[Dict[str, Tuple[float, float, bool]]] = None,
+    ) -> List[str]:
+        """
+        return the metrics as lines of a table
+
+        :param budgets: if given, the request budgets of the providers are listed too. a
+                        dictionary from provider name to (remaining requests, burst size,
+                        throttled), as returned by transport.request_budgets
+        """
+        lines = [f"{'provider':<24}{'requests':>9}{'errors':>8}{'throttled':>10}"
+                 f"{'p50 ms':>8}{'p95 ms':>8}{'avg KB':>8}"]
+        with self._lock:
+            for name, provider in sorted(self.providers.items()):
+                p50 = provider.latency.percentile(50)
+                p95 = provider.latency.percentile(95)
+                avg_kb = provider.payload_bytes / provider.requests / 1024 \
+                    if provider.requests > 0 else 0
+                lines.append(
+                    f"{name[:23]:<24}{provider.requests:>9}{provider.errors:>8}"
+                    f"{provider.throttled:>10}{_format_ms(p50):>8}{_format_ms(p95):>8}"
+                    f"{avg_kb:>8.1f}"
+                )
+            lines.append("")
+            lines.append(f"{'cache':<24}{'hits':>9}{'misses':>8}{'hit ratio':>10}")
+            for name, cache in sorted(self.caches.items()):
+                ratio = cache.hit_ratio()
+                lines.append(f"{name[:23]:<24}{cache.hits:>9}{cache.misses:>8}"
+                             f"{'-' if ratio is None else f'{ratio:.0%}':>10}")
+        if budgets is not None:
+            lines.append("")
+            lines.append(f"{'request budget':<24}{'remaining':>9}{'burst':>8}")
+            for name, (remaining, capacity, throttled) in sorted(budgets.items()):
+                lines.append(f"{name[:23]:<24}{math.floor(remaining):>9}{capacity:>8.0f}"
+                             f"{'throttled' if throttled else '':>10}")
+        return lines
+    
+    def _maybe_log(self):
+        if self.log_interval is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._logged_at < self.log_interval:
+                return
+            self._logged_at = now
+        logger.info("Metrics:\n" + "\n".join(self.summary()))
+    
+    def reset(self):
+        with self._lock:
+            self.providers.clear()
+            self.caches.clear()
+
+
+def _format_ms(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+
+metrics = Metrics()
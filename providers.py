@@ -0,0 +1,144 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+from utils import logger
+
+"""
+This module keeps the providers (backends) that can look up addresses of each coin, along with
+their health statistics, and routes every lookup to the best provider
+"""
+
+# looks up the balances of a list of addresses. returns None in case of failure
+AddressesLookup = Callable[[List[str]], Optional[List[float]]]
+
+
+class ConfirmedBalance(float):
+    """
+    a balance which has no amounts of unconfirmed transactions in it, so it can't change until a
+    new block arrives. Lookups return their balances as plain floats when they can't tell
+    """
+
+# weight of the newest sample in the moving averages of latency and errors
+SMOOTHING_FACTOR = 0.2
+# providers whose moving error rate is above this are tried only after the healthy ones
+MAX_HEALTHY_ERROR_RATE = 0.5
+
+
+class Provider:
+    def __init__(self, name: str, lookup: AddressesLookup):
+        self.name = name
+        self.lookup = lookup
+        self.latency: Optional[float] = None  # moving average, in seconds. None until first used
+        self.error_rate = 0.0  # moving average of failures (0 is never fails, 1 always fails)
+        self.requests = 0
+        self.errors = 0
+        self._lock = Lock()
+    
+    def record(self, latency: float, succeeded: bool):
+        with self._lock:
+            self.requests += 1
+            if not succeeded:
+                self.errors += 1
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += SMOOTHING_FACTOR * (latency - self.latency)
+            self.error_rate += SMOOTHING_FACTOR * ((0 if succeeded else 1) - self.error_rate)
+    
+    def is_healthy(self) -> bool:
+        return self.error_rate <= MAX_HEALTHY_ERROR_RATE
+    
+    def timed_lookup(self, addresses: List[str]) -> Optional[List[float]]:
+        """
+        look up the addresses and record the latency and result
+        """
+        start = time.monotonic()
+        try:
+            balances = self.lookup(addresses)
+        except Exception as e:
+            logger.error(f"{self.name} lookup raised {e!r}")
+            balances = None
+        self.record(time.monotonic() - start, balances is not None)
+        if balances is None:
+            logger.error(f"{self.name} lookup of {len(addresses)} addresses failed")
+        return balances
+
+
+class ProviderRegistry:
+    def __init__(self, hedge_after: Optional[float] = None):
+        """
+        :param hedge_after: if the first provider didn't answer within this number of seconds,
+                            send the same lookup to the next provider as well and take the first
+                            answer. None disables hedging
+        """
+        self.hedge_after = hedge_after
+        # keys are coin symbols. providers are kept in registration order
+        self._providers: Dict[str, List[Provider]] = {}
+    
+    def register(self, coin: str, name: str, lookup: AddressesLookup) -> Provider:
+        provider = Provider(name, lookup)
+        self._providers.setdefault(coin.upper(), []).append(provider)
+        return provider
+    
+    def get_providers(self, coin: str) -> List[Provider]:
+        """
+        return the providers of the given coin, best first: healthy providers ordered by their
+        latency, then providers that were never used (in registration order), then unhealthy ones
+        """
+        providers = self._providers.get(coin.upper(), [])
+        return sorted(providers, key=lambda provider: (
+            not provider.is_healthy(),
+            provider.latency is None,
+            provider.latency or 0,
+        ))  # sorted is stable, so ties keep the registration order
+    
+    def lookup(self, coin: str, addresses: List[str]) -> Optional[List[float]]:
+        """
+        look up the addresses in the best provider of the coin, falling back to the next
+        providers on failure
+
+        :return: the balances of the addresses, or None if all providers failed or the coin has
+                 no providers
+        """
+        providers = self.get_providers(coin)
+        while len(providers) > 0:
+            if self.hedge_after is not None and len(providers) > 1:
+                balances = self._hedged_lookup(providers[0], providers[1], addresses)
+                providers = providers[2:]
+            else:
+                balances = providers[0].timed_lookup(addresses)
+                providers = providers[1:]
+            if balances is not None:
+                return balances
+        return None
+    
+    def _hedged_lookup(
+        self,
+        primary: Provider,
+        secondary: Provider,
+        addresses: List[str],
+    ) -> Optional[List[float]]:
+        """
+        look up in the primary provider. If it doesn't answer within hedge_after seconds (or
+        fails), look up in the secondary as well. The first successful answer is returned
+        """
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            futures = {executor.submit(primary.timed_lookup, addresses)}
+            done, _ = wait(futures, timeout=self.hedge_after)
+            if len(done) > 0 and next(iter(done)).result() is not None:
+                return next(iter(done)).result()
+            futures.add(executor.submit(secondary.timed_lookup, addresses))
+            
+            pending = set(futures) - done
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.result() is not None:
+                        return future.result()
+            return None
+        finally:
+            # a slower lookup is left running in the background. it still records its latency
+            executor.shutdown(wait=False)
@@ -0,0 +1,260 @@
+import time
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Set
+
+from config import HISTORY_DIR, SNAPSHOT_FULLPATH
+from data_retriever import is_throttled, lookup_value, price_cache
+from history import BalanceHistory
+from scheduler import PRICES_JOB, PollScheduler
+from snapshot import delete_snapshot, load_snapshot, save_snapshot
+from tracing import traced
+from wallet import Wallet, price_row
+
+"""
+This module runs wallet refreshes in the background, so the UI stays responsive while balances
+are looked up. The row of each coin is kept as soon as it arrives, so the UI can draw the table
+progressively.
+The last known rows are saved to a snapshot file. On startup they are displayed (marked as
+stale) until they are refreshed, and when a coin fails to refresh (e.g. there is no network)
+its last known row is kept. Every refreshed row is also appended to the balances history.
+In watch mode, the prices and the addresses of each coin are also polled by themselves, whenever
+the scheduler says they are due
+"""
+
+WATCH_SYNC_INTERVAL = 1  # seconds. how often the watcher notices coins added to the wallet
+
+
+class Refresher:
+    def __init__(self, wallet: Wallet, snapshot_path: str = SNAPSHOT_FULLPATH,
+                 history_dir: str = HISTORY_DIR):
+        self.wallet = wallet
+        self.snapshot_path = snapshot_path
+        self.history = BalanceHistory(history_dir)
+        # keys are coin symbols. values are rows as returned by Wallet.get_balances
+        self._rows: Dict[str, List] = {}
+        self._updated_at: Dict[str, float] = {}  # when each row was last refreshed successfully
+        self._refreshing: Set[str] = set()  # coins whose row wasn't updated yet in this refresh
+        self._stale: Set[str] = set()  # coins whose row is from an older refresh
+        # coins whose last refresh failed because their providers throttled our requests
+        self._throttled: Set[str] = set()
+        # incremented whenever the rows change, so the UI knows when to redraw
+        self.version = 0
+        self._lock = Lock()
+        self._cancelled = Event()
+        self._generation = 0  # identifies the current refresh
+        self._stop_watching: Optional[Event] = None  # set to stop the watcher. None if not watching
+        self._load_snapshot()
+    
+    def _load_snapshot(self):
+        rows, quotes = load_snapshot(self.snapshot_path)
+        for coin_code, (row, updated_at) in rows.items():
+            self._rows[coin_code] = row
+            self._updated_at[coin_code] = updated_at
+            self._stale.add(coin_code)
+        # the last known prices are used if the ticker can't be fetched
+        price_cache.seed(quotes)
+    
+    def _save_snapshot(self):
+        # must be called while holding the lock
+        coins = self.wallet.get_row_ids()
+        save_snapshot(
+            self.snapshot_path,
+            rows={
+                coin_code: (self._rows[coin_code], self._updated_at[coin_code])
+                for coin_code in coins if coin_code in self._updated_at
+            },
+            quotes=price_cache.export(coins),
+        )
+    
+    def start(self):
+        """
+        start refreshing all coins in the background. A refresh which is still running is
+        cancelled
+        """
+        self.cancel()
+        with self._lock:
+            self._generation += 1
+            self._cancelled = Event()
+            balances = self.wallet.iter_balances(self._cancelled)
+            self._refreshing = set(self.wallet.get_row_ids())
+            self.version += 1
+            thread = Thread(target=self._run, args=(balances, self._generation), daemon=True)
+        thread.start()
+    
+    def _update_row(self, row: List, succeeded: bool):
+        # must be called while holding the lock
+        coin_code = row[0]
+        if succeeded:
+            self._rows[coin_code] = row
+            self._updated_at[coin_code] = time.time()
+            self.history.append(row, self._updated_at[coin_code])
+            self._stale.discard(coin_code)
+            self._throttled.discard(coin_code)
+        else:
+            if is_throttled(coin_code):
+                self._throttled.add(coin_code)
+            else:
+                self._throttled.discard(coin_code)
+            if coin_code not in self._rows:
+                self._rows[coin_code] = row
+            else:
+                # keep the last known row
+                self._stale.add(coin_code)
+        self._refreshing.discard(coin_code)
+        self.version += 1
+    
+    @traced()
+    def _run(self, balances, generation: int):
+        refreshed = False
+        try:
+            for row, succeeded in balances:
+                with self._lock:
+                    if generation != self._generation:
+                        return
+                    self._update_row(row, succeeded)
+                    refreshed = refreshed or succeeded
+        finally:
+            with self._lock:
+                if generation == self._generation:
+                    self._refreshing.clear()
+                    self.version += 1
+                    if refreshed:
+                        self._save_snapshot()
+    
+    def watch(self, scheduler: PollScheduler):
+        """
+        start polling in the background: the prices and the addresses of each coin are looked up
+        again whenever the scheduler says they are due, until stop_watching() is called
+        """
+        self.stop_watching()
+        self._stop_watching = Event()
+        Thread(target=self._watch, args=(scheduler, self._stop_watching), daemon=True).start()
+    
+    def stop_watching(self):
+        if self._stop_watching is not None:
+            self._stop_watching.set()
+            self._stop_watching = None
+    
+    def is_watching(self) -> bool:
+        return self._stop_watching is not None
+    
+    def _watch(self, scheduler: PollScheduler, stopped: Event):
+        while not stopped.is_set():
+            scheduler.sync_coins(self.wallet.get_row_ids())
+            wait_time = scheduler.seconds_until_due()
+            if wait_time is None or wait_time > 0:
+                stopped.wait(WATCH_SYNC_INTERVAL if wait_time is None
+                             else min(wait_time, WATCH_SYNC_INTERVAL))
+                continue
+            due = scheduler.take_due()
+            if PRICES_JOB in due:
+                self._poll_prices(scheduler)
+            due_coins = [job for job in due if job != PRICES_JOB]
+            if len(due_coins) > 0:
+                self._poll_coins(scheduler, due_coins, stopped)
+    
+    @traced()
+    def _poll_prices(self, scheduler: PollScheduler):
+        """
+        fetch the ticker again and reprice the known rows. No address is looked up
+        """
+        coins = self.wallet.get_row_ids()
+        previous_quotes = price_cache.export(coins)
+        price_cache.invalidate()
+        quotes = lookup_value(coins)
+        changed = False
+        with self._lock:
+            for coin_code, quote in zip(coins, quotes):
+                previous_quote = previous_quotes.get(coin_code.upper())
+                if quote is None or (previous_quote is not None and previous_quote[0] == quote):
+                    continue
+                changed = True
+                row = self._rows.get(coin_code)
+                if row is None or row[1] == 'N/A':
+                    continue  # the coin amount isn't known yet
+                self._rows[coin_code] = price_row(coin_code, row[1], quote)
+                self.history.append(self._rows[coin_code])
+                self.version += 1
+            if changed:
+                self._save_snapshot()
+        scheduler.report(PRICES_JOB, changed, failed=not price_cache.is_fresh())
+    
+    @traced()
+    def _poll_coins(self, scheduler: PollScheduler, coins: List[str], stopped: Event):
+        """
+        look up the addresses of the given coins again. Cached balances are taken only if the
+        chain tip hasn't advanced since they were looked up
+        """
+        refreshed = False
+        for row, succeeded in self.wallet.iter_balances(stopped, coins=coins, revalidate=True):
+            coin_code = row[0]
+            with self._lock:
+                previous_row = self._rows.get(coin_code)
+                self._update_row(row, succeeded)
+                changed = succeeded and (previous_row is None or previous_row[1] != row[1])
+                refreshed = refreshed or succeeded
+            scheduler.report(coin_code, changed, failed=not succeeded)
+        if refreshed:
+            with self._lock:
+                self._save_snapshot()
+    
+    def cancel(self):
+        """
+        stop the current refresh. Coins that weren't refreshed yet keep their previous rows
+        """
+        with self._lock:
+            self._cancelled.set()
+            self._refreshing.clear()
+            self.version += 1
+    
+    def reset(self):
+        """
+        cancel the current refresh and forget all rows, including the saved snapshot and the
+        balances history
+        """
+        self.cancel()
+        with self._lock:
+            self._rows.clear()
+            self._updated_at.clear()
+            self._stale.clear()
+            self._throttled.clear()
+            delete_snapshot(self.snapshot_path)
+            self.history.delete()
+            self.version += 1
+    
+    def is_refreshing(self) -> bool:
+        return len(self._refreshing) > 0
+    
+    def get_rows(self) -> List[List]:
+        """
+        return the rows of all the coins (and tokens) in the wallet. Coins that were never
+        refreshed get a row with 'N/A' values
+        """
+        with self._lock:
+            return [
+                list(self._rows.get(coin_code, [coin_code, 'N/A', 'N/A', 'N/A']))
+                for coin_code in self.wallet.get_row_ids()
+            ]
+    
+    def get_refreshing(self) -> Set[str]:
+        """
+        return the coins which are being refreshed and whose rows weren't updated yet
+        """
+        with self._lock:
+            return set(self._refreshing)
+    
+    def get_throttled(self) -> Set[str]:
+        """
+        return the coins whose last refresh failed because their providers throttled our
+        requests. Their rows are the last known ones (or empty), not a real zero balance
+        """
+        with self._lock:
+            return set(self._throttled)
+    
+    def get_stale(self) -> Set[str]:
+        """
+        return the coins whose rows are from an older refresh (e.g. loaded from the snapshot, or
+        the last refresh failed)
+        """
+        with self._lock:
+            return set(self._stale)
@@ -1,7 +1,15 @@
 import curses
-from typing import List
+import math
+import time
+from typing import List, Optional, Tuple
 
+from address_validation import split_addresses
 from data_retriever import lookup_addresses
+from history import BalanceHistory, change_ratio
+from metrics import metrics
+from refresher import Refresher
+from tracing import traced
+from transport import request_budgets
 from wallet import Wallet
 
 # to be initialized by init_render
@@ -10,9 +18,11 @@ attributes = {}
 ADD = 0
 MANAGE_COIN = 1
 REFRESH = 2
-DELETE_WALLET = 3
-EXIT = 4
-MAIN_OPTIONS = ["Add coin", "Manage coin", "Refresh", "Delete wallet", "Exit"]
+HISTORY = 3
+STATS = 4
+DELETE_WALLET = 5
+EXIT = 6
+MAIN_OPTIONS = ["Add coin", "Manage coin", "Refresh", "History", "Stats", "Delete wallet", "Exit"]
 
 REMOVE_ADDRESSES = 0
 REMOVE_MANUAL_BALANCE = 1
@@ -25,6 +35,8 @@ MAX_ADDRESS_LEN = 45
 ENTER = 10
 ESCAPE = 27
 
+REDRAW_INTERVAL_MS = 100  # how often the main screen checks for refreshed rows
+
 Y = 0
 X = 1
 HEADER_START = (2, 5)
@@ -53,6 +65,7 @@ def init_render(stdscr):
     stdscr.refresh()
 
 
+@traced()
 def main_header(stdscr):
     stdscr.erase()
     stdscr.border()
@@ -60,6 +73,7 @@ def main_header(stdscr):
                   "CryptoWatch - Multi Cryptocurrency watch-only wallet", curses.A_UNDERLINE)
 
 
+@traced()
 def display_options_bar(stdscr, y, x, options, highlight=-1, layout='vertical'):
     """
     Display options bar in row y starting from cell x
@@ -96,13 +110,15 @@ ASCII_1 = 49
 ASCII_9 = 57
 
 
-def read_option(stdscr, option, num_options, layout='vertical'):
+def read_option(stdscr, option, num_options, layout='vertical', page_size=None):
     """
     track the user clicks to navigate between options on screen
 
     :param option the currently chosen option
     :param num_options total number of options in the options bar
     :param layout 'vertical' or 'horizontal'. determines the navigation keys (up/down or left/right)
+    :param page_size if given, page up/down move this number of options, and home/end move to the
+                     first/last option
     :return: a tuple (c, p) where c is the last pressed button, and p is the new current option
     """
     
@@ -123,34 +139,179 @@ def read_option(stdscr, option, num_options, layout='vertical'):
     elif ASCII_1 <= c <= ASCII_9 and c - ASCII_1 < num_options:
         # user click a number between 1 and 9 and this is a legal option
         return c, c - ASCII_1
+    elif page_size is not None and num_options > 0:
+        if c == curses.KEY_NPAGE:
+            return c, min(num_options - 1, option + page_size)
+        elif c == curses.KEY_PPAGE:
+            return c, max(0, option - page_size)
+        elif c == curses.KEY_HOME:
+            return c, 0
+        elif c == curses.KEY_END:
+            return c, num_options - 1
     return c, option
 
 
-COLUMNS_SPACE = 12
+def available_lines(stdscr, y, lines_below):
+    """
+    return the number of screen lines from row y, leaving `lines_below` lines at the bottom of
+    the screen (at least 1)
+    """
+    max_y, _ = stdscr.getmaxyx()
+    return max(1, max_y - y - lines_below)
 
 
-def display_coins_table(stdscr, y, x, coins):
-    """
-    Display the coins table starting from row y and column x.
+_UNKNOWN = object()  # the content of a viewport line which has to be drawn
 
-    :param coins List of lists. each inner list is
-                [coin_id, amount, value_usd, value_btc, unit_value_usd]
 
-    number of lines written to screen is len(coins)+3
+class ListViewport:
+    """
+    A window of `height` lines into a list of rows, drawn from row y and column x. Only the rows
+    inside the window are drawn, so lists of any length fit on the screen, and the window scrolls
+    to keep the highlighted row visible.
+    The viewport remembers what each of its lines shows, so drawing it again writes only the
+    lines whose row or highlight changed
     """
-    coins.sort(key=lambda coin: coin[0])  # sort by coin_id alphabetically
     
-    stdscr.addstr(y, x, "Coin        Amount      USD-value   BTC-value",
-                  attributes['highlighted'])
-    if len(coins) == 0:
-        stdscr.addstr(y + 1, x, "Your wallet is empty. Choose 'Add' to add new coin")
-        return
+    def __init__(self, y, x, height, width, draw_row):
+        """
+        :param width: the width of a line. blank lines are cleared up to it
+        :param draw_row: function (stdscr, y, x, row, highlighted) which draws a single row. It
+                         must overwrite the whole line, since lines aren't erased before drawing
+        """
+        self.y = y
+        self.x = x
+        self.height = max(1, height)
+        self.width = width
+        self.draw_row = draw_row
+        self.top = 0  # index of the first visible row
+        self._drawn = []  # (row, highlighted) shown in each line. None for a blank line
+        self.invalidate()
+    
+    def invalidate(self):
+        """
+        forget what is on the screen (e.g. after it was erased), so the next draw writes all lines
+        """
+        self._drawn = [_UNKNOWN] * self.height
     
-    for i, coin in enumerate(coins):
-        # print line for a single coin
-        for j in range(len(coin)):
-            stdscr.addstr(y + 1 + i, x + (j * COLUMNS_SPACE), str(coin[j]))
+    def visible_lines(self, count):
+        """
+        return the number of lines a list of `count` rows takes on the screen
+        """
+        return min(count, self.height)
     
+    def scroll(self, count, lines):
+        """
+        scroll a list of `count` rows by the given number of lines (negative scrolls up)
+        """
+        self.top = max(0, min(self.top + lines, count - self.height))
+    
+    def scroll_to(self, index, count):
+        """
+        scroll a list of `count` rows the least needed to make the row at `index` visible
+        """
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self.height:
+            self.top = index - self.height + 1
+        self.scroll(count, 0)
+    
+    def position(self, count):
+        """
+        return a description of the visible part of a list of `count` rows, e.g. '21-40 of 500',
+        or an empty string if all the rows are visible
+        """
+        if count <= self.height:
+            return ""
+        return f"{self.top + 1}-{self.top + self.visible_lines(count)} of {count}"
+    
+    @traced()
+    def draw(self, stdscr, rows, highlight=-1):
+        """
+        draw the visible part of the rows list
+
+        :param rows: a sequence of rows. each row is passed to draw_row as is, and is compared to
+                     the row drawn before in the same line, so rows should be comparable values
+        :param highlight: index of a row to highlight (and scroll to). by default no row is
+                          highlighted
+        :return: the number of lines that were written
+        """
+        if 0 <= highlight < len(rows):
+            self.scroll_to(highlight, len(rows))
+        else:
+            self.scroll(len(rows), 0)
+        written = 0
+        for line in range(self.height):
+            index = self.top + line
+            state = (rows[index], index == highlight) if index < len(rows) else None
+            if state == self._drawn[line]:
+                continue
+            if state is None:
+                stdscr.addstr(self.y + line, self.x, " " * self.width)
+            else:
+                self.draw_row(stdscr, self.y + line, self.x, *state)
+            self._drawn[line] = state
+            written += 1
+        return written
+
+
+
+def scroll_viewport(viewport, c, count):
+    """
+    scroll the viewport of a list of `count` rows if c is the up/down or page up/down key
+
+    :return: True if the viewport was scrolled
+    """
+    lines = {
+        curses.KEY_UP: -1,
+        curses.KEY_DOWN: 1,
+        curses.KEY_PPAGE: -viewport.height,
+        curses.KEY_NPAGE: viewport.height,
+    }.get(c)
+    if lines is None:
+        return False
+    viewport.scroll(count, lines)
+    return True
+
+
+COLUMNS_SPACE = 12
+REFRESHING_MARK = "refreshing..."
+STALE_MARK = "stale"
+THROTTLED_MARK = "throttled"
+
+
+ROW_WIDTH = 4 * COLUMNS_SPACE + len(REFRESHING_MARK)  # wide enough for any row and mark
+
+
+def coin_mark(coin_id, refreshing=(), stale=(), throttled=()):
+    """
+    return the mark displayed next to the row of a coin (or an empty string)
+    """
+    if coin_id in refreshing:
+        return REFRESHING_MARK
+    elif coin_id in throttled:
+        return THROTTLED_MARK
+    elif coin_id in stale:
+        return STALE_MARK
+    return ""
+
+
+def display_coin_row(stdscr, y, x, coin, mark=""):
+    """
+    Display the row of a single coin in row y starting from column x.
+    The row is padded with spaces, so it overwrites whatever row was displayed there before
+
+    :param coin list of the row values. values longer than a column are cut
+    :param mark displayed after the row values
+    """
+    line = "".join(str(value)[:COLUMNS_SPACE - 1].ljust(COLUMNS_SPACE) for value in coin)
+    stdscr.addstr(y, x, (line + mark).ljust(ROW_WIDTH))
+
+
+@traced()
+def display_total(stdscr, y, x, coins):
+    """
+    Display the total balance of the given coins rows in row y starting from column x
+    """
     total_usd = 0
     total_btc = 0
     for i in range(len(coins)):
@@ -163,48 +324,249 @@ def display_coins_table(stdscr, y, x, coins):
     total_usd = float('%.3f' % total_usd)
     total_btc = float('%.8f' % total_btc)
     
-    stdscr.addstr(y + len(coins) + 2, x, "Total Balance: ")
-    stdscr.addstr("{0} USD, {1} BTC".format(total_usd, total_btc))
+    line = "Total Balance: {0} USD, {1} BTC".format(total_usd, total_btc)
+    stdscr.addstr(y, x, line.ljust(ROW_WIDTH))
+
 
+# lines of the main screen below the coins table rows: a blank line, the total balance, two
+# blank lines, the options bar and the border
+MAIN_SCR_LINES_BELOW_TABLE = 6
 
-def display_main_scr(stdscr, coins, option=0):
+
+def _draw_coin_row(stdscr, y, x, row, highlighted):
+    coin, mark = row
+    display_coin_row(stdscr, y, x, coin, mark)
+
+
+def coins_table_viewport(stdscr, y, x):
     """
-    Display the main screen - a table with all coins and amounts, and list of options
+    return a viewport for the rows of a coins table whose header is displayed in row y, sized to
+    the lines left on the main screen
+    """
+    height = available_lines(stdscr, y + 1, MAIN_SCR_LINES_BELOW_TABLE)
+    return ListViewport(y + 1, x, height, ROW_WIDTH, _draw_coin_row)
+
+
+@traced()
+def display_coins_table(stdscr, viewport, coins, refreshing=(), stale=(), throttled=()):
+    """
+    Display the coins table. The header is displayed in the line above the viewport, the rows
+    which fit in the viewport in it, and the total balance below it.
+
+    :param viewport ListViewport of the table rows, as returned by coins_table_viewport
+    :param coins List of lists. each inner list is
+                [coin_id, amount, value_usd, value_btc]
+    :param refreshing coin ids whose values are being refreshed. their rows are marked
+    :param stale coin ids whose values are from an older refresh. their rows are marked
+    :param throttled coin ids whose providers throttled the last refresh. their rows are marked
 
-    :param coins: list of lists. Each inner list correspond to a single coin
-                  and looks like this: [coin_code, amount, value_in_usd, value_in_btc]
+    number of lines written to screen is viewport.visible_lines(len(coins))+3
+    """
+    coins.sort(key=lambda coin: coin[0])  # sort by coin_id alphabetically
+    
+    y = viewport.y - 1
+    x = viewport.x
+    stdscr.addstr(y, x, "Coin        Amount      USD-value   BTC-value",
+                  attributes['highlighted'])
+    # e.g. '1-20 of 50' if not all rows fit on the screen
+    stdscr.addstr(y, x + 4 * COLUMNS_SPACE,
+                  viewport.position(len(coins)).ljust(ROW_WIDTH - 4 * COLUMNS_SPACE))
+    if len(coins) == 0:
+        stdscr.addstr(y + 1, x, "Your wallet is empty. Choose 'Add' to add new coin")
+        return
+    
+    rows = [(tuple(coin), coin_mark(coin[0], refreshing, stale, throttled)) for coin in coins]
+    viewport.draw(stdscr, rows)
+    display_total(stdscr, y + viewport.visible_lines(len(coins)) + 2, x, coins)
+
+
+def display_main_scr(stdscr, refresher: Refresher, option=0):
+    """
+    Display the main screen - a table with all coins and amounts, and list of options.
+    The table is redrawn whenever the refresher updates a row, while the user keeps navigating.
+    Only the lines that changed are redrawn: a row update redraws its row and the total, and
+    moving between the options redraws the options bar. If the table doesn't fit on the screen,
+    the up/down and page up/down keys scroll it.
+    Pressing Escape cancels the refresh
+
+    :param refresher: the refresher of the wallet. the table shows its rows
     :param option the option to be initially chosen
     :return: the option chosen by the user
     """
     
     c = 0  # last character read
     should_render = True
+    drawn_version = -1  # the refresher version that is drawn on the screen
+    drawn_coins = None  # ids of the coins drawn on the screen, in the displayed order
+    viewport = None
+    coins = []
     
-    while c != ENTER:
-        if should_render:
-            main_header(stdscr)
-            display_coins_table(stdscr, SUB_MENU_START[Y], SUB_MENU_START[X], coins)
-            display_options_bar(stdscr, SUB_MENU_START[Y] + len(coins) + 5, SUB_MENU_START[X],
-                                MAIN_OPTIONS, highlight=option, layout='horizontal')
-            should_render = False
-        
-        c, new_option = read_option(stdscr, option, len(MAIN_OPTIONS), 'horizontal')
-        if new_option != option or c == curses.KEY_RESIZE:
-            option = new_option
-            should_render = True
+    # don't block on getch, so changes in the table are drawn while waiting for input
+    stdscr.timeout(REDRAW_INTERVAL_MS)
+    try:
+        while c != ENTER:
+            if should_render or refresher.version != drawn_version:
+                drawn_version = refresher.version
+                coins = refresher.get_rows()
+                coins.sort(key=lambda coin: coin[0])
+                coin_ids = [coin[0] for coin in coins]
+                # when the coins change, the table changes its size and the options bar moves
+                render_all = should_render or coin_ids != drawn_coins
+                if render_all:
+                    main_header(stdscr)
+                    top = 0 if viewport is None else viewport.top
+                    viewport = coins_table_viewport(stdscr, SUB_MENU_START[Y], SUB_MENU_START[X])
+                    viewport.top = top
+                display_coins_table(stdscr, viewport, coins, refresher.get_refreshing(),
+                                    refresher.get_stale(), refresher.get_throttled())
+                if render_all:
+                    display_options_bar(stdscr, main_options_y(viewport, coins),
+                                        SUB_MENU_START[X], MAIN_OPTIONS, highlight=option,
+                                        layout='horizontal')
+                drawn_coins = coin_ids
+                should_render = False
+            
+            c, new_option = read_option(stdscr, option, len(MAIN_OPTIONS), 'horizontal')
+            if c == ESCAPE:
+                refresher.cancel()
+            elif scroll_viewport(viewport, c, len(coins)):
+                drawn_version = -1  # redraw the table
+            elif c == curses.KEY_RESIZE:
+                should_render = True
+            elif new_option != option:
+                option = new_option
+                display_options_bar(stdscr, main_options_y(viewport, coins), SUB_MENU_START[X],
+                                    MAIN_OPTIONS, highlight=option, layout='horizontal')
+    finally:
+        stdscr.timeout(-1)  # back to blocking input for the other screens
     
     return option
 
 
+def main_options_y(viewport, coins):
+    """
+    return the row of the main screen options bar, below the coins table
+    """
+    return viewport.y + viewport.visible_lines(len(coins)) + MAIN_SCR_LINES_BELOW_TABLE - 2
+
+
+# the periods whose change is displayed in the history screen: (column title, seconds)
+HISTORY_PERIODS = [("24h", 24 * 60 * 60), ("7d", 7 * 24 * 60 * 60), ("30d", 30 * 24 * 60 * 60)]
+
+
+def _format_usd(value: float) -> str:
+    return 'N/A' if math.isnan(value) else f"{value:.2f}"
+
+
+def _format_change(ratio: Optional[float]) -> str:
+    return "-" if ratio is None else f"{ratio:+.2%}"
+
+
+@traced()
+def history_rows(history: BalanceHistory, coins: List[str], now: Optional[float] = None):
+    """
+    return the rows of the history screen: (coin, value_usd, change over each of HISTORY_PERIODS)
+    of each coin, and a row of their total. The values are looked up in the mapped history
+    files, a record per coin and period
+
+    :param now: the time the changes are computed up to. now by default
+    :return: (coins rows, total row)
+    """
+    if now is None:
+        now = time.time()
+    times = [now] + [now - seconds for _, seconds in HISTORY_PERIODS]
+    total = float('nan')
+    # the total values before and now of each period, of the coins known both before and now.
+    # a coin missing at either time would make the total change look like a gain or a loss
+    period_totals = [[0.0, 0.0] for _ in HISTORY_PERIODS]
+    rows = []
+    for coin_code in coins:
+        values = history.usd_values(coin_code, times)
+        rows.append((coin_code, _format_usd(values[0]),
+                     *(_format_change(change_ratio(value, values[0])) for value in values[1:])))
+        if math.isnan(values[0]):
+            continue
+        total = values[0] if math.isnan(total) else total + values[0]
+        for period_total, value in zip(period_totals, values[1:]):
+            if not math.isnan(value):
+                period_total[0] += value
+                period_total[1] += values[0]
+    total_row = ("Total", _format_usd(total),
+                 *(_format_change(change_ratio(before, after)) for before, after in period_totals))
+    return rows, total_row
+
+
+def display_history_scr(stdscr, refresher: Refresher):
+    """
+    Display the USD value of each coin and its change over the last day, week and month, as
+    recorded in the balances history, until Escape or Enter is pressed. If the table doesn't fit
+    on the screen, the up/down and page up/down keys scroll it
+
+    :param refresher: the refresher of the wallet. its history is displayed
+    """
+    main_header(stdscr)
+    x = SUB_MENU_START[X]
+    title = "History (press Escape to return):"
+    stdscr.addstr(SUB_MENU_START[Y], x, title)
+    y = SUB_MENU_START[Y] + 2
+    coins = sorted(row[0] for row in refresher.get_rows())
+    rows, total_row = history_rows(refresher.history, coins)
+    stdscr.addstr(y, x, "".join(title.ljust(COLUMNS_SPACE) for title in
+                                ["Coin", "USD-value"] + [title for title, _ in HISTORY_PERIODS]),
+                  attributes['highlighted'])
+    rows = [(row, "") for row in rows]
+    # the total is displayed below the rows, and the last lines are for it and the border
+    viewport = ListViewport(y + 1, x, min(len(rows), available_lines(stdscr, y + 1, 4)),
+                            ROW_WIDTH, _draw_coin_row)
+    display_coin_row(stdscr, y + 2 + viewport.visible_lines(len(rows)), x, total_row)
+    c = 0
+    while c != ESCAPE and c != ENTER:
+        viewport.draw(stdscr, rows)
+        # e.g. '1-20 of 50' if not all rows fit on the screen
+        stdscr.addstr(SUB_MENU_START[Y], x + len(title) + 1,
+                      viewport.position(len(rows)).ljust(COLUMNS_SPACE * 2))
+        stdscr.refresh()
+        c = stdscr.getch()
+        scroll_viewport(viewport, c, len(rows))
+
+
+STATS_REDRAW_INTERVAL_MS = 1000
+
+
+def display_stats_scr(stdscr):
+    """
+    Display the metrics of the providers and the caches, and the providers request budgets,
+    updated every second, until Escape or Enter is pressed
+    """
+    main_header(stdscr)
+    stdscr.addstr(SUB_MENU_START[Y], SUB_MENU_START[X], "Stats (press Escape to return):")
+    y = SUB_MENU_START[Y] + 2
+    _, max_x = stdscr.getmaxyx()
+    width = max_x - SUB_MENU_START[X] - 1
+    drawn = []  # the lines on the screen. only lines that changed are redrawn
+    c = 0
+    stdscr.timeout(STATS_REDRAW_INTERVAL_MS)
+    try:
+        while c != ESCAPE and c != ENTER:
+            lines = metrics.summary(request_budgets())[:available_lines(stdscr, y, 2)]
+            lines += [""] * (len(drawn) - len(lines))  # clear lines that were removed
+            for i, line in enumerate(lines):
+                if i >= len(drawn) or drawn[i] != line:
+                    stdscr.addstr(y + i, SUB_MENU_START[X], line[:width].ljust(width))
+            drawn = lines
+            stdscr.refresh()
+            c = stdscr.getch()
+    finally:
+        stdscr.timeout(-1)
+
+
 def read_address_from_user(stdscr):
     """
     read comma separated addresses from the user.
 
     :return: list of all the addresses
     """
-    addresses = stdscr.getstr().decode("utf-8")
-    addresses = "".join(addresses.split())  # remove any whitespaces
-    return addresses.split(',')
+    return split_addresses(stdscr.getstr().decode("utf-8"))
 
 
 def add_menu_header(stdscr):
@@ -216,6 +578,25 @@ def add_menu_header(stdscr):
     stdscr.refresh()
 
 
+def display_rejected_addresses(stdscr, y, x, rejected: List[Tuple[int, str, str]]):
+    """
+    display the addresses which were rejected when adding addresses, and wait for a key
+
+    :param rejected: list of (line, address, reason), as in ImportReport.rejected
+    """
+    _, max_x = stdscr.getmaxyx()
+    stdscr.addstr(y, x, f"{len(rejected)} invalid addresses were not added:")
+    # the last line is for the 'press any key' message
+    shown = rejected[:available_lines(stdscr, y + 1, 4)]
+    for i, (_, address, reason) in enumerate(shown):
+        stdscr.addstr(y + 1 + i, x, f"{address}: {reason}"[:max_x - x - 1])
+    if len(shown) < len(rejected):
+        stdscr.addstr(y + 1 + len(shown), x, f"and {len(rejected) - len(shown)} more")
+    stdscr.addstr(y + 3 + len(shown), x, "Press any key to continue")
+    stdscr.refresh()
+    stdscr.getch()
+
+
 def display_add_scr(stdscr, wallet: Wallet):
     """
     Display the 'add coin' screen to the user and handles adding new coin
@@ -253,8 +634,13 @@ def display_add_scr(stdscr, wallet: Wallet):
             last_line += 2
             stdscr.move(last_line + 1, SUB_MENU_START[X])
             last_line += 1
-            addresses = read_address_from_user(stdscr)
-            wallet.add_addresses(coin_code, addresses)
+            # invalid addresses are rejected before they are stored or looked up
+            report = wallet.import_addresses(coin_code, read_address_from_user(stdscr))
+            if len(report.rejected) > 0:
+                curses.curs_set(0)
+                curses.noecho()
+                display_rejected_addresses(stdscr, last_line + 2, SUB_MENU_START[X],
+                                           report.rejected)
         else:
             # manually add balance
             stdscr.addstr(last_line + 2, SUB_MENU_START[X], "Enter amount to add: ")
@@ -270,35 +656,52 @@ def display_add_scr(stdscr, wallet: Wallet):
         return None
 
 
-def display_addresses_list(stdscr, addresses, balances, base_y, base_x, highlight=-1):
+BALANCE_WIDTH = 20
+ADDRESS_LINE_WIDTH = MAX_ADDRESS_LEN + 2 + BALANCE_WIDTH
+
+
+def _draw_address_row(stdscr, y, x, row, highlighted):
+    addr, balance = row
+    attr = attributes['highlighted'] if highlighted else attributes['normal']
+    addr = addr[:MAX_ADDRESS_LEN]
+    stdscr.addstr(y, x, addr, attr)
+    stdscr.addstr(" " * (MAX_ADDRESS_LEN + 2 - len(addr)))
+    stdscr.addstr(('N/A' if balance < 0 else '%.8f' % balance).ljust(BALANCE_WIDTH))
+
+
+def addresses_viewport(stdscr, y, x, lines_below):
+    """
+    return a viewport for the rows of an addresses list whose header is displayed in row y,
+    leaving `lines_below` lines at the bottom of the screen
+    """
+    height = available_lines(stdscr, y + 1, lines_below)
+    return ListViewport(y + 1, x, height, ADDRESS_LINE_WIDTH, _draw_address_row)
+
+
+@traced()
+def display_addresses_list(stdscr, viewport, rows, highlight=-1):
     """
-    Display a list of addresses and their balances, starting from point (base_y, base_x)
-    writes exactly len(addresses)+1 lines
+    Display a list of addresses and their balances. The header is displayed in the line above the
+    viewport, and the rows which fit in the viewport in it.
+    writes at most viewport.visible_lines(len(rows))+1 lines. Drawing the same viewport again
+    writes only the lines that changed
 
     :param stdscr:
-    :param addresses: the addresses to print
-    :param balances: the balances correspond to the addresses
+    :param viewport: ListViewport of the list rows, as returned by addresses_viewport
+    :param rows: list of (address, balance) tuples
     :param highlight index of an address to highlight. by default no address is highlighted
 
     """
     # write the head of the table:   Address                  Balance
+    base_y = viewport.y - 1
+    base_x = viewport.x
     stdscr.addstr(base_y, base_x, "Address", curses.A_UNDERLINE)
     stdscr.addstr(base_y, base_x + MAX_ADDRESS_LEN + 2, "Balance",
                   curses.A_UNDERLINE)
-    
-    y = base_y + 1  # the next line to write to
-    # write all addresses with their balances
-    for i, (addr, balance) in enumerate(zip(addresses, balances)):
-        if i == highlight:
-            attr = attributes['highlighted']
-        else:
-            attr = attributes['normal']
-        stdscr.addstr(y, base_x, addr, attr)
-        if balance < 0:
-            stdscr.addstr(y, base_x + MAX_ADDRESS_LEN + 2, 'N/A')
-        else:
-            stdscr.addstr(y, base_x + MAX_ADDRESS_LEN + 2, '%.8f' % balance)
-        y += 1
+    # e.g. '1-20 of 500' if not all rows fit on the screen
+    stdscr.addstr(base_y, base_x + len("Address") + 2,
+                  viewport.position(len(rows)).ljust(MAX_ADDRESS_LEN - len("Address") - 2))
+    viewport.draw(stdscr, rows, highlight)
 
 
 def remove_addresses_scr(
@@ -318,6 +721,8 @@ def remove_addresses_scr(
     option = 0
     base_y = SUB_MENU_START[Y]
     base_x = SUB_MENU_START[X]
+    rows = list(zip(addresses, balances))
+    viewport = None
     should_render = True
     while True:
         while c != ENTER and c != ESCAPE:
@@ -325,26 +730,27 @@ def remove_addresses_scr(
                 main_header(stdscr)
                 stdscr.addstr(base_y, base_x, "Remove " + coin + " addresses:")
                 stdscr.addstr(base_y + 1, base_x, "Click on an address to remove it")
-                display_addresses_list(stdscr, addresses, balances, base_y + 2, base_x, option)
-                
-                # the Done 'button'
-                if option == len(addresses):
-                    # the Done button is marked
-                    attr = attributes['highlighted']
-                else:
-                    attr = attributes['normal']
-                stdscr.addstr(base_y + 2 + len(addresses) + 2, base_x, "Done", attr)
-                
+                # a blank line, the Done button and the border are below the list
+                viewport = addresses_viewport(stdscr, base_y + 2, base_x, lines_below=3)
                 should_render = False
+            # only the lines whose highlight changed are redrawn
+            display_addresses_list(stdscr, viewport, rows, option)
             
-            c, new_option = read_option(stdscr, option, len(addresses) + 1, layout='vertical')
-            # the +1 in num_options is for the 'Done' button
+            # the Done 'button'
+            if option == len(rows):
+                # the Done button is marked
+                attr = attributes['highlighted']
+            else:
+                attr = attributes['normal']
+            stdscr.addstr(viewport.y + viewport.visible_lines(len(rows)) + 1, base_x, "Done", attr)
             
-            if new_option != option:
-                option = new_option
+            c, option = read_option(stdscr, option, len(rows) + 1, layout='vertical',
+                                    page_size=viewport.height)
+            # the +1 in num_options is for the 'Done' button
+            if c == curses.KEY_RESIZE:
                 should_render = True
         
-        if c == ESCAPE or option == len(addresses):
+        if c == ESCAPE or option == len(rows):
             # escaped pressed or 'Done' button clicked
             return
         else:
@@ -352,11 +758,13 @@ def remove_addresses_scr(
             wallet.remove_watch_address(coin, [addresses[option]])
             addresses.pop(option)
             balances.pop(option)
+            rows.pop(option)
             if len(addresses) == 0:  # all addresses were removed
                 return
             elif len(addresses) == option:
                 # the last address was removed, so mark the one above it
                 option -= 1
+            # the rows below the removed one move up, and the Done button may move as well
             should_render = True
         
         c = 0
@@ -364,7 +772,8 @@ def remove_addresses_scr(
 
 def manage_coin(stdscr, coin: str, wallet: Wallet):
     """
-    Display a manage screen for a specific coin
+    Display a manage screen for a specific coin.
+    If the addresses list doesn't fit on the screen, the up/down and page up/down keys scroll it
 
     :param coin: the coin to manage
     :param wallet: wallet object
@@ -374,40 +783,52 @@ def manage_coin(stdscr, coin: str, wallet: Wallet):
     tracked_coin = wallet.get_coin_info(coin)
     addresses_list = list(tracked_coin.addresses)
     balances = lookup_addresses(coin, addresses_list)
+    if balances is None:
+        balances = [-1] * len(addresses_list)
     manual_balance = tracked_coin.manual_balance
     base_x = SUB_MENU_START[X]
     base_y = SUB_MENU_START[Y]
     
     while True:
         should_render = True
+        rows = list(zip(addresses_list, balances))
+        viewport = None
+        options_y = 0
         while c != ENTER and c != ESCAPE:
             if should_render:
                 main_header(stdscr)
                 stdscr.addstr(base_y, base_x, coin + " in wallet:")
-                if balances is None:
-                    balances = [-1] * len(addresses_list)
-                display_addresses_list(stdscr, addresses_list, balances, base_y + 2, base_x)
-                y = base_y + 2 + len(addresses_list) + 2  # the next line to write to
+                # a blank line, the manual balance and a blank line, the options bar and the
+                # border are below the list
+                lines_below = 5 if manual_balance != 0 else 3
+                viewport = addresses_viewport(stdscr, base_y + 2, base_x, lines_below)
+                display_addresses_list(stdscr, viewport, rows)
+                y = viewport.y + viewport.visible_lines(len(rows)) + 1  # the next line to write to
                 if manual_balance != 0:
                     stdscr.addstr(y, base_x, "Manual balance: " + ('%.8f' % manual_balance))
                     y += 2
-                display_options_bar(stdscr, y, base_x, MANAGE_COIN_OPTIONS,
+                options_y = y
+                display_options_bar(stdscr, options_y, base_x, MANAGE_COIN_OPTIONS,
                                     highlight=option, layout='horizontal')
                 should_render = False
             
             c, new_option = read_option(stdscr, option, len(MANAGE_COIN_OPTIONS), 'horizontal')
-            if new_option != option:
-                option = new_option
+            if c == curses.KEY_RESIZE:
                 should_render = True
+            elif scroll_viewport(viewport, c, len(rows)):
+                display_addresses_list(stdscr, viewport, rows)
+            elif new_option != option:
+                option = new_option
+                display_options_bar(stdscr, options_y, base_x, MANAGE_COIN_OPTIONS,
+                                    highlight=option, layout='horizontal')
         
         if c == ESCAPE or option == RETURN:
             return
         
         if option == REMOVE_ADDRESSES:
+            # removing addresses doesn't change the balance of the others, and
+            # remove_addresses_scr updates addresses_list and balances in place
             remove_addresses_scr(stdscr, coin, addresses_list, balances, wallet)
-            # addresses may have changed. get updated info
-            tracked_coin = wallet.get_coin_info(coin)
-            balances = lookup_addresses(coin, list(tracked_coin.addresses))
         elif option == REMOVE_MANUAL_BALANCE:
             wallet.remove_manual_balance(coin)
             manual_balance = 0
@@ -417,19 +838,36 @@ def manage_coin(stdscr, coin: str, wallet: Wallet):
         c = 0
 
 
+def _draw_coin_option(stdscr, y, x, row, highlighted):
+    number, coin = row
+    attr = attributes['highlighted'] if highlighted else attributes['normal']
+    stdscr.addstr(y, x, f"{number}. ")
+    stdscr.addstr(coin, attr)
+
+
 def manage_scr(stdscr, wallet):
     """
     Display the manage coins screen
     """
     coins = wallet.get_coins_ids()
+    rows = [(i + 1, coin) for i, coin in enumerate(coins)]
     c = 0
     option = 0
+    should_render = True
+    viewport = None
     while c != ENTER and c != ESCAPE:
-        main_header(stdscr)
-        stdscr.addstr(SUB_MENU_START[Y], SUB_MENU_START[X], "Choose coin to manage:")
-        display_options_bar(stdscr, SUB_MENU_START[Y] + 2, SUB_MENU_START[X],
-                            coins, highlight=option, layout='vertical')
-        c, option = read_option(stdscr, option, len(coins), 'vertical')
+        if should_render:
+            main_header(stdscr)
+            stdscr.addstr(SUB_MENU_START[Y], SUB_MENU_START[X], "Choose coin to manage:")
+            height = available_lines(stdscr, SUB_MENU_START[Y] + 2, 1)  # leave the border
+            viewport = ListViewport(SUB_MENU_START[Y] + 2, SUB_MENU_START[X], height,
+                                    ROW_WIDTH, _draw_coin_option)
+            should_render = False
+        # only the lines whose highlight changed are redrawn
+        viewport.draw(stdscr, rows, option)
+        c, option = read_option(stdscr, option, len(coins), 'vertical', page_size=viewport.height)
+        if c == curses.KEY_RESIZE:
+            should_render = True
     
     if c == ESCAPE:
         return
@@ -0,0 +1,132 @@
+import time
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+"""
+This module decides when each part of the wallet should be polled in watch mode. Prices and the
+addresses of each coin are separate jobs, each with its own adaptive interval
+"""
+
+PRICES_JOB = "prices"
+
+
+class AdaptiveInterval:
+    """
+    A polling interval that shrinks after a change was detected, grows while nothing changes,
+    and backs off on errors. It always stays between `minimum` and `maximum`
+    """
+    
+    def __init__(
+        self,
+        base: float,
+        minimum: float,
+        maximum: float,
+        speedup: float = 0.5,
+        slowdown: float = 1.5,
+        error_backoff: float = 2.0,
+    ):
+        """
+        :param base: the initial interval, in seconds
+        :param speedup: the interval is multiplied by this after a change
+        :param slowdown: the interval is multiplied by this when nothing changed
+        :param error_backoff: the interval is multiplied by this after an error
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.error_backoff = error_backoff
+        self.current = self._bound(base)
+    
+    def _bound(self, interval: float) -> float:
+        return min(self.maximum, max(self.minimum, interval))
+    
+    def update(self, changed: bool, failed: bool = False) -> float:
+        """
+        adapt the interval to the result of the last poll, and return the new interval
+        """
+        if failed:
+            self.current = self._bound(self.current * self.error_backoff)
+        elif changed:
+            self.current = self._bound(self.current * self.speedup)
+        else:
+            self.current = self._bound(self.current * self.slowdown)
+        return self.current
+
+
+class PollScheduler:
+    """
+    Keeps the next due time of every job: the prices (PRICES_JOB), and the addresses of each
+    coin (the job name is the coin symbol)
+    """
+    
+    def __init__(
+        self,
+        price_interval: Tuple[float, float, float],
+        address_interval: Tuple[float, float, float],
+    ):
+        """
+        :param price_interval: (base, minimum, maximum) interval of polling the prices, in seconds
+        :param address_interval: (base, minimum, maximum) interval of polling the addresses of
+                                 each coin, in seconds
+        """
+        self._address_interval = address_interval
+        now = time.monotonic()
+        # values are (interval, next due time). None means the job is running right now
+        self._jobs: Dict[str, Tuple[AdaptiveInterval, Optional[float]]] = {
+            PRICES_JOB: (AdaptiveInterval(*price_interval), now + price_interval[0]),
+        }
+        self._lock = Lock()
+    
+    def sync_coins(self, coins: Iterable[str]):
+        """
+        add jobs of new coins and remove jobs of coins that are no longer in the wallet
+        """
+        coins = set(coins)
+        now = time.monotonic()
+        with self._lock:
+            for job in list(self._jobs):
+                if job != PRICES_JOB and job not in coins:
+                    del self._jobs[job]
+            for coin in coins:
+                if coin not in self._jobs:
+                    interval = AdaptiveInterval(*self._address_interval)
+                    self._jobs[coin] = (interval, now + interval.current)
+    
+    def take_due(self) -> List[str]:
+        """
+        return the jobs that are due, and mark them as running. They won't be due again until
+        their result is reported with report()
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [job for job, (_, due_at) in self._jobs.items()
+                   if due_at is not None and due_at <= now]
+            for job in due:
+                self._jobs[job] = (self._jobs[job][0], None)
+        return due
+    
+    def report(self, job: str, changed: bool, failed: bool = False):
+        """
+        report the result of a poll, and schedule the next one according to the adapted interval
+        """
+        with self._lock:
+            if job not in self._jobs:  # the coin was removed while it was polled
+                return
+            interval = self._jobs[job][0]
+            self._jobs[job] = (interval, time.monotonic() + interval.update(changed, failed))
+    
+    def seconds_until_due(self) -> Optional[float]:
+        """
+        return the number of seconds until the next job is due (0 if a job is due already), or
+        None if all jobs are running
+        """
+        with self._lock:
+            due_times = [due_at for _, due_at in self._jobs.values() if due_at is not None]
+        if len(due_times) == 0:
+            return None
+        return max(0.0, min(due_times) - time.monotonic())
+    
+    def get_interval(self, job: str) -> Optional[float]:
+        with self._lock:
+            return self._jobs[job][0].current if job in self._jobs else None
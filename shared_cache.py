@@ -0,0 +1,169 @@
+import os
+import sqlite3
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import Quote
+from config import SHARED_CACHE_TIMEOUT
+from utils import logger
+
+"""
+This module keeps the looked up address balances and the coins ticker in an SQLite database
+that all the CryptoWatch processes of the user share, so a process (e.g. a cron job, or another
+terminal) gets the answers another process fetched a moment ago, instead of asking the providers
+again and using up their rate limits.
+The database is in WAL mode, so readers don't wait for writers, and SQLite locks the file for
+every write transaction. The cache is best effort: if the database can't be used, lookups behave
+as if it was empty
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS balances (
+    coin TEXT NOT NULL,
+    address TEXT NOT NULL,
+    balance REAL NOT NULL,
+    tip INTEGER,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (coin, address)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quotes (
+    symbol TEXT PRIMARY KEY,
+    usd REAL NOT NULL,
+    btc REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ticker (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    fetched_at REAL NOT NULL
+);
+"""
+
+# maximum number of addresses in a single query, below SQLite's limit of query parameters
+MAX_QUERY_ADDRESSES = 500
+
+# (coin_symbol, address)
+BalanceKey = Tuple[str, str]
+# (balance, height of the chain tip when the balance was looked up)
+BalanceEntry = Tuple[float, Optional[int]]
+
+
+class SharedCache:
+    def __init__(self, path: str):
+        """
+        :param path: the database file. It is created (along with its directory) on the first
+                     access
+        """
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        # must be called while holding the lock
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # writers of other processes are waited for up to the timeout
+            connection = sqlite3.connect(self.path, timeout=SHARED_CACHE_TIMEOUT,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # losing the last transactions in a power failure only loses cached answers
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+    
+    def get_balances(
+        self,
+        keys: List[BalanceKey],
+    ) -> Dict[BalanceKey, Tuple[BalanceEntry, float]]:
+        """
+        :return: a dictionary from each of the given keys that is in the cache to its
+                 ((balance, tip), time the balance was stored). Expired balances are returned
+                 too - their age is for the caller to judge
+        """
+        res = {}
+        by_coin: Dict[str, List[str]] = {}
+        for coin_symbol, address in keys:
+            by_coin.setdefault(coin_symbol, []).append(address)
+        try:
+            with self._lock:
+                connection = self._connect()
+                for coin_symbol, addresses in by_coin.items():
+                    for i in range(0, len(addresses), MAX_QUERY_ADDRESSES):
+                        chunk = addresses[i:i + MAX_QUERY_ADDRESSES]
+                        rows = connection.execute(
+                            "SELECT address, balance, tip, stored_at FROM balances "
+                            f"WHERE coin = ? AND address IN ({', '.join('?' * len(chunk))})",
+                            (coin_symbol, *chunk)
+                        )
+                        for address, balance, tip, stored_at in rows:
+                            res[(coin_symbol, address)] = ((balance, tip), stored_at)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache lookup failed: {e!r}")
+        return res
+    
+    def put_balances(self, entries: Dict[BalanceKey, BalanceEntry], stored_at: float):
+        self._write(
+            "INSERT OR REPLACE INTO balances (coin, address, balance, tip, stored_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(coin_symbol, address, balance, tip, stored_at)
+             for (coin_symbol, address), (balance, tip) in entries.items()],
+        )
+    
+    def forget_balances(self, keys: Iterable[BalanceKey]):
+        if self._connection is None and not os.path.isfile(self.path):
+            return  # nothing was shared yet
+        self._write("DELETE FROM balances WHERE coin = ? AND address = ?", list(keys))
+    
+    def _write(self, statement: str, parameters: List[tuple]):
+        if len(parameters) == 0:
+            return
+        try:
+            with self._lock, self._connect() as connection:
+                connection.executemany(statement, parameters)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache update failed: {e!r}")
+    
+    def get_ticker(self) -> Optional[Tuple[Dict[str, Quote], float]]:
+        """
+        :return: (a dictionary from coin symbol to its quote, time the ticker was fetched), or
+                 None if no ticker was stored
+        """
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute("SELECT fetched_at FROM ticker WHERE id = 0").fetchone()
+                if row is None:
+                    return None
+                rows = connection.execute("SELECT symbol, usd, btc FROM quotes")
+                quotes = {symbol: (usd, btc) for symbol, usd, btc in rows}
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache lookup failed: {e!r}")
+            return None
+        return quotes, row[0]
+    
+    def put_ticker(self, quotes: Dict[str, Quote], fetched_at: float):
+        """
+        replace the stored ticker, unless a newer one was stored meanwhile
+        """
+        try:
+            with self._lock, self._connect() as connection:
+                # take the write lock before reading, so another process can't store its ticker
+                # between the check and the write
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute("SELECT fetched_at FROM ticker WHERE id = 0").fetchone()
+                if row is not None and row[0] >= fetched_at:
+                    return
+                connection.execute("DELETE FROM quotes")
+                connection.executemany(
+                    "INSERT INTO quotes (symbol, usd, btc) VALUES (?, ?, ?)",
+                    ((symbol, usd, btc) for symbol, (usd, btc) in quotes.items())
+                )
+                connection.execute("INSERT OR REPLACE INTO ticker (id, fetched_at) VALUES (0, ?)",
+                                   (fetched_at,))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache update failed: {e!r}")
+    
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,82 @@
+from concurrent.futures import Future
+from threading import Lock
+from typing import Callable, Dict, Hashable, Iterable, Optional
+
+from utils import logger
+
+"""
+This module coalesces concurrent identical lookups (single-flight): a caller that asks for keys
+which another caller is already looking up waits for that lookup's result, instead of sending
+the same request again
+"""
+
+
+class SingleFlight:
+    """
+    Tracks the keys that are being looked up. Each key is looked up by at most one caller at a
+    time. Callers asking for overlapping sets of keys look up only the keys nobody else is
+    looking up, and wait for the rest
+    """
+    
+    def __init__(self):
+        # keys are the keys being looked up. values are the futures of the lookups fetching them
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = Lock()
+    
+    def lookup(
+        self,
+        keys: Iterable[Hashable],
+        fetch: Callable[[list], Optional[Dict[Hashable, object]]],
+    ) -> Dict[Hashable, object]:
+        """
+        look up the given keys
+
+        :param fetch: a function that looks up a list of keys and returns a dictionary from each
+                      key to its value, or None in case of failure. It is called at most once,
+                      with the keys which are not being looked up already
+        :return: a dictionary with the values of the keys which were looked up successfully
+                 (by this caller or another one). Keys whose lookup failed, here or in the
+                 caller that was looking them up, are missing from it - they are not looked up
+                 again, so a provider that is down gets a single request. If fetch raises an
+                 exception, it is raised here as well, while the callers waiting for it see its
+                 keys as failed
+        """
+        keys = list(dict.fromkeys(keys))
+        future = Future()
+        with self._lock:
+            waiting = {key: self._in_flight[key] for key in keys if key in self._in_flight}
+            own_keys = [key for key in keys if key not in waiting]
+            for key in own_keys:
+                self._in_flight[key] = future
+        
+        res = {}
+        if len(own_keys) > 0:
+            try:
+                fetched = fetch(own_keys)
+                future.set_result(fetched)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for key in own_keys:
+                        del self._in_flight[key]
+            if fetched is not None:
+                res.update((key, fetched[key]) for key in own_keys if key in fetched)
+        
+        for other_future in set(waiting.values()):
+            try:
+                fetched = other_future.result()
+            except Exception as e:
+                logger.error(f"Coalesced lookup failed: {e!r}")
+                continue
+            if fetched is not None:
+                res.update((key, fetched[key]) for key, key_future in waiting.items()
+                           if key_future is other_future and key in fetched)
+        return res
+    
+    def in_flight(self) -> int:
+        """
+        return the number of keys being looked up right now
+        """
+        return len(self._in_flight)
@@ -0,0 +1,70 @@
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+from cache import Quote
+from utils import logger
+
+"""
+This module saves and loads the last known balances of the wallet, so they can be displayed on
+startup (and when there is no network) before they are refreshed
+"""
+
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(
+    path: str,
+    rows: Dict[str, Tuple[List, float]],
+    quotes: Dict[str, Tuple[Quote, float]],
+):
+    """
+    write the snapshot atomically, so a crash while writing leaves the previous snapshot
+
+    :param rows: a dictionary from coin symbol to (row, time the row was refreshed). rows are
+                 as returned by Wallet.get_balances
+    :param quotes: a dictionary from coin symbol to (quote, time the quote was fetched)
+    """
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "rows": {coin_code: [row, updated_at] for coin_code, (row, updated_at) in rows.items()},
+        "quotes": {symbol: [quote, fetched_at] for symbol, (quote, fetched_at) in quotes.items()},
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> Tuple[Dict[str, Tuple[List, float]], Dict[str, Tuple[Quote, float]]]:
+    """
+    :return: a tuple (rows, quotes) in the format given to save_snapshot. If there is no valid
+             snapshot, both are empty
+    """
+    if not os.path.isfile(path):
+        return {}, {}
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return {}, {}
+        rows = {
+            coin_code: (row, updated_at)
+            for coin_code, (row, updated_at) in snapshot["rows"].items()
+        }
+        quotes = {
+            symbol: (tuple(quote), fetched_at)
+            for symbol, (quote, fetched_at) in snapshot["quotes"].items()
+        }
+        return rows, quotes
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error(f"Failed to load snapshot {path}: {e!r}")
+        return {}, {}
+
+
+def delete_snapshot(path: str):
+    if os.path.isfile(path):
+        os.remove(path)
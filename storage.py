@@ -0,0 +1,127 @@
+import os
+import sqlite3
+from threading import Lock
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+"""
+This module is responsible for persisting the wallet on the disk.
+The wallet is kept in an SQLite database in WAL mode. Every change is a single atomic
+transaction that writes only the changed records, so a crash can't leave a half-written wallet
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS coins (
+    symbol TEXT PRIMARY KEY,
+    manual_balance REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS addresses (
+    coin TEXT NOT NULL REFERENCES coins(symbol),
+    address TEXT NOT NULL,
+    PRIMARY KEY (coin, address)
+) WITHOUT ROWID;
+"""
+
+
+class WalletStorage:
+    def __init__(self, path: str):
+        """
+        :param path: the database file. It is created (along with its directory) on the first
+                     access
+        """
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        # must be called while holding the lock
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # in WAL mode, NORMAL is still atomic and durable enough for a wallet of watched
+            # addresses, and saves an fsync per transaction
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+    
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+    
+    def load(self) -> Dict[str, Tuple[Set[str], float]]:
+        """
+        :return: a dictionary from coin symbol to (addresses, manual_balance) of that coin
+        """
+        with self._lock:
+            connection = self._connect()
+            coins = {
+                symbol: (set(), manual_balance)
+                for symbol, manual_balance in connection.execute(
+                    "SELECT symbol, manual_balance FROM coins"
+                )
+            }
+            for coin, address in connection.execute("SELECT coin, address FROM addresses"):
+                coins[coin][0].add(address)
+        return coins
+    
+    def add_addresses(self, coin_symbol: str, addresses: Iterable[str]):
+        with self._lock, self._connect() as connection:
+            connection.execute("INSERT OR IGNORE INTO coins (symbol) VALUES (?)", (coin_symbol,))
+            connection.executemany(
+                "INSERT OR IGNORE INTO addresses (coin, address) VALUES (?, ?)",
+                ((coin_symbol, address) for address in addresses)
+            )
+    
+    def remove_addresses(self, coin_symbol: str, addresses: Iterable[str]):
+        with self._lock, self._connect() as connection:
+            connection.executemany(
+                "DELETE FROM addresses WHERE coin = ? AND address = ?",
+                ((coin_symbol, address) for address in addresses)
+            )
+    
+    def set_manual_balance(self, coin_symbol: str, balance: float):
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT INTO coins (symbol, manual_balance) VALUES (?, ?) "
+                "ON CONFLICT(symbol) DO UPDATE SET manual_balance = excluded.manual_balance",
+                (coin_symbol, balance)
+            )
+    
+    def remove_coin(self, coin_symbol: str):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM addresses WHERE coin = ?", (coin_symbol,))
+            connection.execute("DELETE FROM coins WHERE symbol = ?", (coin_symbol,))
+    
+    def import_coins(self, coins: Dict[str, Tuple[Iterable[str], float]]):
+        """
+        write the given coins in a single transaction. Manual balances of existing coins are
+        overwritten, so importing the same data twice has no effect
+
+        :param coins: a dictionary from coin symbol to (addresses, manual_balance) of that coin
+        """
+        with self._lock, self._connect() as connection:
+            for coin_symbol, (addresses, manual_balance) in coins.items():
+                connection.execute(
+                    "INSERT INTO coins (symbol, manual_balance) VALUES (?, ?) "
+                    "ON CONFLICT(symbol) DO UPDATE SET manual_balance = excluded.manual_balance",
+                    (coin_symbol, manual_balance)
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO addresses (coin, address) VALUES (?, ?)",
+                    ((coin_symbol, address) for address in addresses)
+                )
+    
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+    
+    def delete(self):
+        """
+        close the database and delete its files from the disk
+        """
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.isfile(self.path + suffix):
+                os.remove(self.path + suffix)
@@ -0,0 +1,61 @@
+import unittest
+
+from address_validation import InvalidAddress, keccak256, normalize_address
+
+# addresses from the BIP-173, BIP-350, CashAddr and EIP-55 specifications
+VALID_ADDRESSES = [
+    ("BTC", "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa", "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"),
+    ("BTC", "3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy", "3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy"),
+    ("BTC", "BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4",
+     "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4"),
+    ("BTC", "bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0",
+     "bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0"),
+    ("LTC", "LVg2kJoFNg45Nbpy53h7Fe1wKyeXVRhMH9", "LVg2kJoFNg45Nbpy53h7Fe1wKyeXVRhMH9"),
+    ("BCH", "bitcoincash:qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6a",
+     "qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6a"),
+    ("BCH", "QPM2QSZNHKS23Z7629MMS6S4CWEF74VCWVY22GDX6A",
+     "qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6a"),
+    ("BCH", "1BpEi6DfDAUFd7GtittLSdBeYJvcoaVggu", "1BpEi6DfDAUFd7GtittLSdBeYJvcoaVggu"),
+    ("ETH", "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed",
+     "0x5aaeb6053f3e94c9b9a09f33669435e7ef1beaed"),
+    ("ETH", "0xD1220A0CF47C7B9BE7A2E6BA89F429762E7B9ADB",
+     "0xd1220a0cf47c7b9be7a2e6ba89f429762e7b9adb"),
+    ("XMR", " any-address ", "any-address"),  # no validator
+]
+
+INVALID_ADDRESSES = [
+    ("BTC", "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb"),  # typo
+    ("BTC", "1A1zP1eP5QGefi2DMPTfTL5SLmv7Div0Na"),  # not Base58
+    ("BTC", "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5"),  # typo
+    ("BTC", "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7KV8F3T4"),  # mixed case
+    ("BTC", "LVg2kJoFNg45Nbpy53h7Fe1wKyeXVRhMH9"),  # LTC address
+    ("BTC", "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"),  # ETH address
+    ("LTC", "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"),  # BTC address
+    ("BCH", "bitcoincash:qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6b"),
+    ("BCH", "bitcoincash:qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6A"),
+    ("ETH", "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAeD"),  # wrong checksum
+    ("ETH", "0x5aaeb6053f3e94c9b9a09f33669435e7ef1bea"),  # too short
+    ("ETH", ""),
+]
+
+
+class AddressValidationTest(unittest.TestCase):
+    
+    def test_keccak256(self):
+        self.assertEqual(keccak256(b"").hex(),
+                         "c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470")
+    
+    def test_valid_addresses(self):
+        for coin, address, normalized in VALID_ADDRESSES:
+            with self.subTest(coin=coin, address=address):
+                self.assertEqual(normalize_address(coin, address), normalized)
+    
+    def test_invalid_addresses(self):
+        for coin, address in INVALID_ADDRESSES:
+            with self.subTest(coin=coin, address=address):
+                with self.assertRaises(InvalidAddress):
+                    normalize_address(coin, address)
+
+
+if __name__ == '__main__':
+    unittest.main()
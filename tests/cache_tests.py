@@ -0,0 +1,120 @@
+import time
+import unittest
+
+from cache import PriceCache, TTLCache
+
+
+class PriceCacheTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.fetches = 0
+        self.ticker = {"BTC": (10000.0, 1.0), "ETH": (500.0, 0.05)}
+    
+    def fetch_ticker(self):
+        self.fetches += 1
+        return self.ticker
+    
+    def test_lookup_by_symbol(self):
+        cache = PriceCache(ttl=60, fetch_ticker=self.fetch_ticker)
+        quotes = cache.get_quotes(["eth", "BTC", "XYZ"])
+        self.assertListEqual(quotes, [(500.0, 0.05), (10000.0, 1.0), None])
+    
+    def test_fetch_once_within_ttl(self):
+        cache = PriceCache(ttl=60, fetch_ticker=self.fetch_ticker)
+        cache.get_quotes(["BTC"])
+        cache.get_quotes(["ETH"])
+        self.assertEqual(self.fetches, 1)
+    
+    def test_invalidate(self):
+        cache = PriceCache(ttl=60, fetch_ticker=self.fetch_ticker)
+        cache.get_quotes(["BTC"])
+        cache.invalidate()
+        cache.get_quotes(["BTC"])
+        self.assertEqual(self.fetches, 2)
+    
+    def test_stale_quotes_kept_on_failure(self):
+        cache = PriceCache(ttl=0, fetch_ticker=self.fetch_ticker)
+        cache.get_quotes(["BTC"])
+        self.ticker = None  # fetching fails from now on
+        self.assertListEqual(cache.get_quotes(["BTC"]), [(10000.0, 1.0)])
+        self.assertGreaterEqual(cache.age("BTC"), 0)
+        self.assertIsNone(cache.age("XYZ"))
+    
+    def test_shared_ticker(self):
+        shared = []  # the tickers stored by all the processes, as (quotes, fetched_at)
+        cache = PriceCache(ttl=60, fetch_ticker=self.fetch_ticker,
+                           load_shared=lambda: shared[-1] if shared else None,
+                           store_shared=lambda *ticker: shared.append(ticker))
+        cache.get_quotes(["BTC"])
+        self.assertEqual(len(shared), 1)
+        # a ticker this cache shared isn't taken back after it's invalidated
+        cache.invalidate()
+        cache.get_quotes(["BTC"])
+        self.assertEqual(self.fetches, 2)
+        # a newer ticker of another process is used instead of fetching
+        shared.append(({"BTC": (11000.0, 1.0)}, time.time() + 1))
+        cache.invalidate()
+        self.assertListEqual(cache.get_quotes(["BTC"]), [(11000.0, 1.0)])
+        self.assertEqual(self.fetches, 2)
+
+
+class TTLCacheTest(unittest.TestCase):
+    
+    def test_get_many(self):
+        cache = TTLCache(ttl=60)
+        cache.put_many({("BTC", "a"): 1.0, ("BTC", "b"): 0.0})
+        self.assertDictEqual(cache.get_many([("BTC", "a"), ("BTC", "b"), ("BTC", "c")]),
+                             {("BTC", "a"): 1.0, ("BTC", "b"): 0.0})
+    
+    def test_expired_entries_are_evicted(self):
+        cache = TTLCache(ttl=0)
+        cache.put(("BTC", "a"), 1.0)
+        self.assertIsNone(cache.get(("BTC", "a")))
+        cache.put(("BTC", "b"), 1.0)
+        cache.evict_expired()
+        self.assertEqual(len(cache), 0)
+    
+    def test_evicted_when_storing(self):
+        cache = TTLCache(ttl=0, keep_expired_for=60)
+        cache.put(("BTC", "a"), 1.0)
+        cache.put(("BTC", "b"), 1.0)
+        self.assertEqual(len(cache), 2)  # expired, but kept so they can be renewed
+        cache.keep_expired_for = 0
+        cache.put(("BTC", "c"), 1.0)
+        self.assertDictEqual(cache.get_many([("BTC", "c")], include_expired=True),
+                             {("BTC", "c"): 1.0})
+        self.assertEqual(len(cache), 1)
+    
+    def test_renew_expired(self):
+        cache = TTLCache(ttl=0)
+        cache.put_many({("BTC", "a"): 1.0, ("BTC", "b"): 2.0})
+        self.assertDictEqual(cache.get_many([("BTC", "a")]), {})
+        self.assertDictEqual(cache.get_many([("BTC", "a"), ("BTC", "c")], include_expired=True),
+                             {("BTC", "a"): 1.0})
+        cache.ttl = 60
+        cache.renew([("BTC", "a"), ("BTC", "c")])
+        self.assertEqual(cache.get(("BTC", "a")), 1.0)
+        self.assertIsNone(cache.get(("BTC", "c")))
+        self.assertLess(cache.age(("BTC", "a")), cache.age(("BTC", "b")))
+    
+    def test_seed(self):
+        cache = TTLCache(ttl=60)
+        cache.put(("BTC", "a"), 1.0)
+        now = time.time()
+        cache.seed({("BTC", "a"): (2.0, now - 10), ("BTC", "b"): (3.0, now - 10)})
+        self.assertEqual(cache.get(("BTC", "a")), 1.0)  # the cached value is newer
+        self.assertEqual(cache.get(("BTC", "b")), 3.0)
+        self.assertGreaterEqual(cache.age(("BTC", "b")), 10)
+    
+    def test_invalidate(self):
+        cache = TTLCache(ttl=60)
+        cache.put_many({("BTC", "a"): 1.0, ("BTC", "b"): 2.0})
+        cache.invalidate([("BTC", "a")])
+        self.assertIsNone(cache.get(("BTC", "a")))
+        self.assertEqual(cache.get(("BTC", "b")), 2.0)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from config import WALLET_DB_FILENAME
+from storage import WalletStorage
+
+CRYPTOWATCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "cryptowatch.py")
+
+
+class BatchModeTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.env = dict(os.environ, HOME=self.home.name)
+    
+    def tearDown(self):
+        self.home.cleanup()
+    
+    def run_cryptowatch(self, *args) -> subprocess.CompletedProcess:
+        return subprocess.run([sys.executable, CRYPTOWATCH, *args], env=self.env, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    
+    def test_empty_wallet(self):
+        self.assertListEqual(json.loads(self.run_cryptowatch("--json").stdout), [])
+        self.assertEqual(self.run_cryptowatch("--csv").stdout.strip(),
+                         "coin,amount,value_usd,value_btc")
+    
+    def test_import(self):
+        addresses = "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa\ninvalid-address\n"
+        result = subprocess.run([sys.executable, CRYPTOWATCH, "--import", "btc", "-"],
+                                env=self.env, input=addresses, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True)
+        self.assertEqual(result.returncode, 1)  # an address was rejected
+        self.assertIn("-:2: invalid-address", result.stderr)
+        storage = WalletStorage(os.path.join(self.home.name, ".cryptowatch", WALLET_DB_FILENAME))
+        self.assertDictEqual(storage.load(), {"BTC": ({"1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"}, 0)})
+        storage.close()
+    
+    def test_profile(self):
+        self.run_cryptowatch("--json", "--profile", "cprofile")
+        profiles_dir = os.path.join(self.home.name, ".cryptowatch", "profiles")
+        files = sorted(os.listdir(profiles_dir))
+        self.assertEqual(len(files), 2)
+        self.assertTrue(files[0].startswith("profile-") and files[0].endswith(".prof"))
+        with open(os.path.join(profiles_dir, files[1])) as f:
+            span_names = {event["name"] for event in json.load(f)["traceEvents"]}
+        self.assertIn("Wallet.get_balances", span_names)
+    
+    def test_no_curses_or_network_stack(self):
+        result = subprocess.run([sys.executable, "-X", "importtime", CRYPTOWATCH, "--json"],
+                                env=self.env, check=True, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True)
+        modules = {line.rsplit("|", 1)[1].strip().split(".")[0]
+                   for line in result.stderr.splitlines() if line.startswith("import time:")}
+        self.assertIn("wallet", modules)
+        self.assertNotIn("curses", modules)
+        self.assertNotIn("requests", modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,304 @@
+import os
+import tempfile
+import unittest
+from threading import Barrier, Thread
+from unittest.mock import Mock, patch
+
+import data_retriever
+from config import BALANCE_TTL
+from metrics import metrics
+from data_retriever import NOT_FOUND, lookup_addresses, lookup_chain_height, lookup_value
+from mock_provider_server import (MockConfig, MockProviderServer, TICKER, TOKEN_DECIMALS,
+                                  clear_caches, expected_balance, expected_token_balance)
+from providers import ProviderRegistry
+from shared_cache import SharedCache
+from wallet import Wallet
+
+
+class DataRetrieverMockTest(unittest.TestCase):
+    """
+    tests of the data retriever against the local mock providers server (no network access)
+    """
+    
+    def setUp(self):
+        self.server = MockProviderServer(MockConfig()).start()
+        self.server.patch_data_retriever()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def assertBalances(self, balances, addresses):
+        self.assertEqual(len(balances), len(addresses))
+        for balance, addr in zip(balances, addresses):
+            self.assertAlmostEqual(balance, expected_balance(addr), places=8)
+    
+    def test_lookup_all_coins(self):
+        for coin in ["BTC", "ETH", "BCH", "LTC"]:
+            addresses = [f"{coin}-address-{i}" for i in range(3)]
+            self.assertBalances(lookup_addresses(coin, addresses), addresses)
+            # a single address is answered differently by btc.com
+            self.assertBalances(lookup_addresses(coin, addresses[:1]), addresses[:1])
+    
+    def test_batches(self):
+        addresses = [f"0x{i:040x}" for i in range(45)]
+        self.assertBalances(lookup_addresses("ETH", addresses), addresses)
+        self.assertEqual(self.server.request_counts["etherscan"], 3)
+    
+    def test_invalid_addresses_bisected(self):
+        for coin in ["BTC", "ETH", "LTC"]:
+            addresses = [f"{coin}-address-{i}" for i in range(8)]
+            addresses[5] = "invalid-address"
+            balances = lookup_addresses(coin, addresses)
+            self.assertEqual(balances[5], NOT_FOUND)
+            self.assertBalances(balances[:5] + balances[6:], addresses[:5] + addresses[6:])
+    
+    def test_provider_errors_not_bisected(self):
+        addresses = [f"address-{i}" for i in range(16)]
+        replies = [
+            # btc.com answers errors other than invalid addresses with no data, too
+            (data_retriever.lookup_ltc_addresses, Mock(ok=True, status_code=200, json=lambda: {
+                "err_no": 2, "err_msg": "API rate limit exceeded", "data": None,
+            })),
+            (data_retriever.lookup_btc_addresses,
+             Mock(ok=False, status_code=503, text="invalid upstream response")),
+        ]
+        for lookup, reply in replies:
+            with patch.object(data_retriever.transport, "get", return_value=reply) as get:
+                self.assertIsNone(lookup(addresses))
+            # the failure wasn't taken for invalid addresses, so the batch wasn't bisected
+            self.assertEqual(get.call_count, 1)
+    
+    def test_balance_cache(self):
+        addresses = ["address-1", "address-2"]
+        lookup_addresses("BTC", addresses)
+        self.server.reset_counts()
+        self.assertBalances(lookup_addresses("BTC", addresses), addresses)
+        self.assertEqual(self.server.total_requests(), 0)
+    
+    def test_unchanged_tip_skips_lookup(self):
+        addresses = [f"0x{i:040x}" for i in range(2)]
+        lookup_addresses("ETH", addresses)
+        data_retriever.balance_cache.ttl = 0  # the cached balances expire immediately
+        try:
+            self.server.reset_counts()
+            self.assertBalances(lookup_addresses("ETH", addresses), addresses)
+            self.assertEqual(self.server.total_requests(), 0)
+            self.assertEqual(self.server.height_requests, 1)
+            
+            self.server.mine()
+            self.assertBalances(lookup_addresses("ETH", addresses), addresses)
+            self.assertEqual(self.server.request_counts["etherscan"], 1)
+        finally:
+            data_retriever.balance_cache.ttl = BALANCE_TTL
+    
+    def test_unconfirmed_balances_not_renewed(self):
+        self.server.config.unconfirmed_addresses = {"address-2"}
+        addresses = ["address-1", "address-2"]
+        lookup_addresses("LTC", addresses)
+        lookup_addresses("BTC", addresses)
+        data_retriever.balance_cache.ttl = 0
+        try:
+            self.server.reset_counts()
+            # at the same tip, only the balance with no unconfirmed amounts is taken from the cache
+            self.assertBalances(lookup_addresses("LTC", addresses), addresses)
+            self.assertEqual(self.server.request_counts["btc.com"], 1)
+            # blockchain.info balances may include unconfirmed amounts
+            self.assertBalances(lookup_addresses("BTC", addresses), addresses)
+            self.assertEqual(self.server.request_counts["blockchain.info"], 1)
+        finally:
+            data_retriever.balance_cache.ttl = BALANCE_TTL
+    
+    def test_revalidate(self):
+        addresses = [f"0x{i:040x}" for i in range(2)]
+        lookup_addresses("ETH", addresses)
+        self.server.reset_counts()
+        # the balances are fresh, but they are taken only after checking the chain tip
+        self.assertBalances(lookup_addresses("ETH", addresses, revalidate=True), addresses)
+        self.assertEqual(self.server.total_requests(), 0)
+        self.assertEqual(self.server.height_requests, 1)
+        
+        self.server.mine()
+        self.assertBalances(lookup_addresses("ETH", addresses, revalidate=True), addresses)
+        self.assertEqual(self.server.request_counts["etherscan"], 1)
+    
+    def test_no_cache(self):
+        addresses = ["address-1", "address-2"]
+        lookup_addresses("BTC", addresses)
+        self.server.reset_counts()
+        self.assertBalances(lookup_addresses("BTC", addresses, use_cache=False), addresses)
+        self.assertEqual(self.server.request_counts["blockchain.info"], 1)
+        self.assertEqual(self.server.height_requests, 0)  # the tip isn't needed
+    
+    def test_shared_cache(self):
+        addresses = ["address-1", "address-2"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_retriever.shared_cache = SharedCache(os.path.join(tmp_dir, "cache.db"))
+            try:
+                lookup_addresses("BTC", addresses)
+                lookup_value(["BTC"])
+                # another process, whose own caches are empty
+                clear_caches()
+                self.server.reset_counts()
+                self.assertBalances(lookup_addresses("BTC", addresses), addresses)
+                self.assertEqual(lookup_value(["BTC"]), [TICKER["BTC"]])
+                self.assertEqual(self.server.total_requests(), 0)
+                self.assertEqual(self.server.height_requests, 0)
+            finally:
+                data_retriever.shared_cache.close()
+                data_retriever.shared_cache = None
+    
+    def test_concurrent_lookups_coalesced(self):
+        self.server.config.latency = 0.2
+        addresses = [f"address-{i}" for i in range(10)]
+        barrier = Barrier(4)
+        results = []
+        
+        def lookup():
+            barrier.wait()
+            results.append(lookup_addresses("BTC", addresses))
+        
+        threads = [Thread(target=lookup) for _ in range(barrier.parties)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for balances in results:
+            self.assertBalances(balances, addresses)
+        # the lookups started together. the first one looked up the chain tip and the balances,
+        # and the others waited for its results
+        self.assertEqual(self.server.request_counts["blockchain.info"], 1)
+        self.assertEqual(self.server.height_requests, 1)
+        self.assertEqual(data_retriever.balance_lookups.in_flight(), 0)
+    
+    def test_overlapping_failed_lookups(self):
+        self.server.config.latency = 0.2
+        self.server.config.error_rate = 1
+        addresses = [f"address-{i}" for i in range(10)]
+        barrier = Barrier(2)
+        results = []
+        
+        def lookup(addresses_part):
+            barrier.wait()
+            results.append(lookup_addresses("BTC", addresses_part))
+        
+        threads = [Thread(target=lookup, args=(part,)) for part in (addresses[:6], addresses[4:])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the addresses one lookup waited for failed in the other, so neither has all balances
+        self.assertListEqual(results, [None, None])
+    
+    def test_metrics(self):
+        metrics.reset()
+        addresses = ["address-1", "address-2"]
+        lookup_addresses("BTC", addresses)
+        lookup_addresses("BTC", addresses)
+        lookup_value(["BTC"])
+        provider = metrics.providers[self.server.url.split("//")[1]]
+        # a balance request, a chain height request and the ticker
+        self.assertEqual(provider.requests, 3)
+        self.assertEqual(provider.errors, 0)
+        self.assertGreater(provider.payload_bytes, 0)
+        self.assertEqual(metrics.caches["balances"].hits, 2)
+        self.assertEqual(metrics.caches["balances"].misses, 2)
+        self.assertEqual(metrics.caches["prices"].misses, 1)
+    
+    def test_lookup_chain_height(self):
+        self.server.mine(5)
+        for coin in ["BTC", "ETH", "BCH", "LTC"]:
+            self.assertEqual(lookup_chain_height(coin), self.server.chain_height)
+        self.assertIsNone(lookup_chain_height("XMR"))
+    
+    def test_lookup_value(self):
+        self.assertListEqual(lookup_value(["btc", "ETH", "NOSUCHCOIN"]),
+                             [TICKER["BTC"], TICKER["ETH"], None])
+        lookup_value(["LTC"])
+        self.assertEqual(self.server.request_counts["coinmarketcap"], 1)
+    
+    def test_wallet_balances(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wallet = Wallet(storage_path=os.path.join(tmp_dir, "wallet.db"),
+                            legacy_path=os.path.join(tmp_dir, "wallet"))
+            wallet.add_addresses("LTC", ["address-1", "address-2"])
+            wallet.add_manual_balance("XMR", 2)
+            balances = {row[0]: row for row in wallet.get_balances()}
+        
+        ltc_amount = round(expected_balance("address-1") + expected_balance("address-2"), 8)
+        self.assertAlmostEqual(balances["LTC"][1], ltc_amount)
+        self.assertAlmostEqual(balances["LTC"][2], round(ltc_amount * TICKER["LTC"][0], 3))
+        self.assertListEqual(balances["XMR"], ["XMR", 2, 300.0, 0.03])
+
+
+class ERC20MockTest(unittest.TestCase):
+    """
+    token balances of ETH addresses, looked up in the mock Ethereum node
+    """
+    
+    CONTRACT = "0x" + "ab" * 20
+    
+    def setUp(self):
+        self.server = MockProviderServer().start()
+        self.server.patch_data_retriever()
+        self.original = (data_retriever.provider_registry, data_retriever.chain_height_sources,
+                         dict(data_retriever.erc20_tokens))
+        data_retriever.provider_registry = ProviderRegistry()
+        data_retriever.chain_height_sources = dict(self.original[1])
+        data_retriever.provider_registry.register("ETH", "etherscan",
+                                                  data_retriever.lookup_eth_addresses)
+        data_retriever.register_erc20_token("usdt", self.CONTRACT, TOKEN_DECIMALS)
+    
+    def tearDown(self):
+        (data_retriever.provider_registry, data_retriever.chain_height_sources,
+         erc20_tokens) = self.original
+        data_retriever.erc20_tokens.clear()
+        data_retriever.erc20_tokens.update(erc20_tokens)
+        self.server.stop()
+    
+    def test_batched_lookup(self):
+        addresses = [f"0x{i:040x}" for i in range(150)] + ["0xinvalid"]
+        balances = lookup_addresses("USDT", addresses)
+        self.assertEqual(balances[-1], NOT_FOUND)
+        for balance, addr in zip(balances, addresses[:-1]):
+            self.assertAlmostEqual(balance, expected_token_balance(self.CONTRACT, addr))
+        self.assertEqual(self.server.request_counts["eth-rpc"], 2)  # batches of 100 calls
+        # cached like the balances of a coin
+        self.server.reset_counts()
+        lookup_addresses("USDT", addresses[:-1])
+        self.assertEqual(self.server.total_requests(), 0)
+    
+    def test_token_rows(self):
+        addresses = ["0x" + "12" * 20, "0x" + "34" * 20]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wallet = Wallet(storage_path=os.path.join(tmp_dir, "wallet.db"),
+                            legacy_path=os.path.join(tmp_dir, "wallet"), tokens=["USDT"])
+            self.assertListEqual(wallet.get_row_ids(), [])
+            wallet.add_addresses("ETH", addresses)
+            self.assertListEqual(wallet.get_row_ids(), ["ETH", "USDT"])
+            rows = wallet.get_balances()
+        
+        amount = round(sum(expected_token_balance(self.CONTRACT, addr) for addr in addresses), 8)
+        self.assertEqual(rows[1][0], "USDT")
+        self.assertAlmostEqual(rows[1][1], amount)
+        self.assertAlmostEqual(rows[1][2], round(amount * TICKER["USDT"][0], 3))
+
+
+class ProviderFailureMockTest(unittest.TestCase):
+    
+    def test_server_errors(self):
+        with MockProviderServer(MockConfig(error_rate=1)) as server:
+            server.patch_data_retriever()
+            self.assertIsNone(lookup_addresses("ETH", ["address"]))
+            self.assertListEqual(lookup_value(["BTC"]), [None])
+    
+    def test_btc_fallback_provider(self):
+        with MockProviderServer() as server:
+            server.patch_data_retriever()
+            # blockchain.info is unreachable. btc.com answers instead
+            data_retriever.BLOCKCHAIN_INFO_URL = f"{server.url}/unreachable"
+            balances = lookup_addresses("BTC", ["address"])
+            self.assertAlmostEqual(balances[0], expected_balance("address"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
 
-from data_retriever import NOT_FOUND, lookup_addresses
+from data_retriever import (
+    InvalidAddressesError, NOT_FOUND, lookup_addresses, lookup_bisecting, lookup_in_batches,
+    split_to_batches,
+)
 
 
 class DataRetrieverTest(unittest.TestCase):
@@ -77,5 +80,71 @@ class DataRetrieverTest(unittest.TestCase):
         self.assertListEqual(balances, expected_balances)
 
 
+class BatchLookupTest(unittest.TestCase):
+    """
+    tests of the batching layer. batches are looked up by a fake provider, so these tests
+    don't need network access
+    """
+    
+    def setUp(self):
+        self.requests = []
+    
+    def lookup_batch(self, addresses):
+        """
+        a provider that rejects any batch with an address starting with 'bad', and returns the
+        length of each address as its balance
+        """
+        self.requests.append(addresses)
+        if any(addr.startswith("bad") for addr in addresses):
+            raise InvalidAddressesError()
+        return [len(addr) for addr in addresses]
+    
+    def test_split_by_batch_size(self):
+        batches = split_to_batches(["a"] * 45, base_url_length=10, separator_length=1,
+                                   max_batch_size=20)
+        self.assertListEqual([len(batch) for batch in batches], [20, 20, 5])
+    
+    def test_split_by_url_length(self):
+        addresses = ["a" * 10] * 5
+        # base (10) + 3 addresses with 2 separators (32) fit in 45
+        batches = split_to_batches(addresses, base_url_length=10, separator_length=1,
+                                   max_batch_size=100, max_url_length=45)
+        self.assertListEqual([len(batch) for batch in batches], [3, 2])
+    
+    def test_batches_merged_in_order(self):
+        addresses = ["a" * (i + 1) for i in range(30)]
+        balances = lookup_in_batches(self.lookup_batch, addresses, base_url_length=0,
+                                     separator_length=1, max_batch_size=7)
+        self.assertListEqual(balances, list(range(1, 31)))
+        self.assertEqual(len(self.requests), 5)
+    
+    def test_bisect_invalid_addresses(self):
+        addresses = ["a", "bb", "bad1", "ccc", "dddd", "eeeee", "bad2", "f"]
+        balances = lookup_bisecting(self.lookup_batch, addresses)
+        self.assertListEqual(balances, [1, 2, NOT_FOUND, 3, 4, 5, NOT_FOUND, 1])
+    
+    def test_failed_batch(self):
+        balances = lookup_in_batches(lambda batch: None, ["a", "b"], base_url_length=0,
+                                     separator_length=1, max_batch_size=1)
+        self.assertIsNone(balances)
+    
+    def test_partially_failed_batches(self):
+        def lookup_batch(addresses):
+            return None if "a" in addresses else [len(addr) for addr in addresses]
+        
+        # the other batches succeeded, but the total would be missing the failed batch
+        self.assertIsNone(lookup_in_batches(lookup_batch, ["a", "b", "cc", "ddd"],
+                                            base_url_length=0, separator_length=1,
+                                            max_batch_size=2))
+        
+        def bisected_lookup_batch(addresses):
+            if "a" in addresses and not any(addr.startswith("bad") for addr in addresses):
+                return None
+            return self.lookup_batch(addresses)
+        
+        # the batch was rejected for the invalid address, and then a half of it failed
+        self.assertIsNone(lookup_bisecting(bisected_lookup_batch, ["a", "b", "bad", "c"]))
+
+
 if __name__ == '__main__':
     unittest.main()
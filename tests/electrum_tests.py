@@ -0,0 +1,192 @@
+import time
+import unittest
+
+import data_retriever
+from data_retriever import NOT_FOUND, lookup_addresses, lookup_chain_height
+from electrum_client import (ElectrumBackend, ElectrumClient, ElectrumError, address_script,
+                             address_to_scripthash)
+from mock_electrum_server import SATOSHIS_PER_COIN, MockElectrumServer
+from mock_provider_server import MockProviderServer, clear_caches, expected_balance
+from providers import ConfirmedBalance, ProviderRegistry
+
+ADDRESSES = [
+    "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa",
+    "3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy",
+    "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4",
+]
+
+
+def wait_until(condition, timeout: float = 2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class ElectrumTest(unittest.TestCase):
+    """
+    tests of the Electrum backend against the local mock Electrum server
+    """
+    
+    def setUp(self):
+        self.server = MockElectrumServer().start()
+        self.client = ElectrumClient(self.server.host, self.server.port, timeout=2)
+        self.changed = []
+        self.backend = ElectrumBackend("BTC", self.client, on_change=self.changed.append)
+    
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+    
+    def expected_balances(self, addresses):
+        return [expected_balance(address_to_scripthash("BTC", addr)) for addr in addresses]
+    
+    def assertBalances(self, balances, expected):
+        self.assertEqual(len(balances), len(expected))
+        for balance, expected_balance in zip(balances, expected):
+            self.assertAlmostEqual(balance, expected_balance, places=8)
+    
+    def test_scripts(self):
+        self.assertEqual(address_script("BTC", ADDRESSES[0]).hex(),
+                         "76a91462e907b15cbf27d5425399ebf6f0fb50ebb88f1888ac")
+        self.assertEqual(address_script("BTC", ADDRESSES[2]).hex(),
+                         "0014751e76e8199196d454941c45d1b3a323f1433bd6")
+        # the same script in both formats
+        self.assertEqual(address_script("BCH", "1BpEi6DfDAUFd7GtittLSdBeYJvcoaVggu"),
+                         address_script("BCH", "qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6a"))
+    
+    def test_batched_lookup(self):
+        addresses = ADDRESSES + ["invalid-address"]
+        balances = self.backend.lookup(addresses)
+        self.assertBalances(balances[:3], self.expected_balances(ADDRESSES))
+        self.assertEqual(balances[3], NOT_FOUND)
+        # the version, 3 subscriptions and 3 balances, in 2 messages over 1 connection
+        self.assertEqual(self.server.messages, 2)
+        self.assertEqual(self.server.calls["blockchain.scripthash.get_balance"], 3)
+        self.assertEqual(self.backend.subscriptions(), 3)
+    
+    def test_unchanged_addresses_not_requested(self):
+        self.backend.lookup(ADDRESSES)
+        self.server.reset_counts()
+        self.assertBalances(self.backend.lookup(ADDRESSES), self.expected_balances(ADDRESSES))
+        self.assertEqual(self.server.messages, 0)
+    
+    def test_status_change_notified(self):
+        self.backend.lookup(ADDRESSES)
+        self.server.reset_counts()
+        self.server.set_balance(address_to_scripthash("BTC", ADDRESSES[1]), SATOSHIS_PER_COIN, 5)
+        self.assertTrue(wait_until(lambda: self.changed == [ADDRESSES[1]]))
+        balances = self.backend.lookup(ADDRESSES)
+        self.assertAlmostEqual(balances[1], 1.00000005, places=8)
+        # the new balance has an unconfirmed amount, so it may change before the next block
+        self.assertNotIsInstance(balances[1], ConfirmedBalance)
+        self.assertIsInstance(balances[0], ConfirmedBalance)
+        self.assertEqual(self.server.calls["blockchain.scripthash.get_balance"], 1)
+        self.assertEqual(self.server.calls["blockchain.scripthash.subscribe"], 0)
+    
+    def test_chain_height_pushed(self):
+        self.assertEqual(self.backend.chain_height(), self.server.chain_height)
+        self.server.mine(3)
+        self.assertTrue(wait_until(lambda: self.backend.chain_height() == 1003))
+        self.assertEqual(self.server.calls["blockchain.headers.subscribe"], 1)
+    
+    def test_reconnect(self):
+        self.backend.lookup(ADDRESSES)
+        self.server.disconnect_all()
+        self.assertTrue(wait_until(lambda: self.client.connection_id is None))
+        # the subscriptions were lost with the connection, so the balances are requested again
+        self.server.reset_counts()
+        self.assertBalances(self.backend.lookup(ADDRESSES), self.expected_balances(ADDRESSES))
+        self.assertEqual(self.server.calls["blockchain.scripthash.get_balance"], 3)
+        self.assertEqual(self.backend.subscriptions(), 3)
+    
+    def test_reconnect_during_lookup(self):
+        batch = self.client.batch
+        
+        def batch_then_reconnect(calls):
+            results = batch(calls)
+            # another request reconnects after the connection was lost
+            self.client.close()
+            self.client.connect()
+            return results
+        
+        self.client.batch = batch_then_reconnect
+        self.assertBalances(self.backend.lookup(ADDRESSES), self.expected_balances(ADDRESSES))
+        del self.client.batch
+        # the subscriptions were made on the lost connection, so they aren't kept
+        self.assertEqual(self.backend.subscriptions(), 0)
+        self.server.reset_counts()
+        self.assertBalances(self.backend.lookup(ADDRESSES), self.expected_balances(ADDRESSES))
+        self.assertEqual(self.server.calls["blockchain.scripthash.get_balance"], 3)
+        self.assertEqual(self.server.calls["blockchain.scripthash.subscribe"], 3)
+        self.assertEqual(self.backend.subscriptions(), 3)
+    
+    def test_invalid_message(self):
+        self.client.call("server.version")
+        self.server.send_all(5)  # valid JSON, but not a JSON-RPC message
+        self.assertTrue(wait_until(lambda: self.client.connection_id is None))
+        # the next request connects again
+        self.assertEqual(self.client.call("server.version"), ["MockElectrum 1.0", "1.4"])
+        self.assertIsNotNone(self.client.connection_id)
+    
+    def test_server_down(self):
+        self.server.stop()
+        self.client.close()
+        self.assertIsNone(self.backend.lookup(ADDRESSES))
+        with self.assertRaises(ElectrumError):
+            self.client.call("server.version")
+
+
+class ElectrumDataRetrieverTest(unittest.TestCase):
+    """
+    lookup_addresses with an Electrum server registered before the HTTP providers
+    """
+    
+    def setUp(self):
+        self.providers = MockProviderServer().start()
+        self.providers.patch_data_retriever()
+        self.server = MockElectrumServer().start()
+        self.original = (data_retriever.provider_registry, data_retriever.chain_height_sources,
+                         dict(data_retriever.electrum_backends))
+        data_retriever.provider_registry = ProviderRegistry()
+        data_retriever.chain_height_sources = {
+            coin: list(sources) for coin, sources in self.original[1].items()
+        }
+        self.backend = data_retriever.register_electrum_server("btc", self.server.host,
+                                                               self.server.port)
+        data_retriever.provider_registry.register("BTC", "blockchain.info",
+                                                  data_retriever.lookup_btc_addresses)
+    
+    def tearDown(self):
+        self.backend.client.close()
+        (data_retriever.provider_registry, data_retriever.chain_height_sources,
+         electrum_backends) = self.original
+        data_retriever.electrum_backends.clear()
+        data_retriever.electrum_backends.update(electrum_backends)
+        self.server.stop()
+        self.providers.stop()
+        clear_caches()
+    
+    def test_lookup_addresses(self):
+        balances = lookup_addresses("BTC", ADDRESSES)
+        for balance, addr in zip(balances, ADDRESSES):
+            self.assertAlmostEqual(balance, expected_balance(address_to_scripthash("BTC", addr)),
+                                   places=8)
+        self.assertEqual(lookup_chain_height("BTC"), self.server.chain_height)
+        self.assertEqual(self.providers.total_requests(), 0)
+        self.assertEqual(self.providers.height_requests, 0)
+    
+    def test_change_drops_cached_balance(self):
+        lookup_addresses("BTC", ADDRESSES)
+        self.server.set_balance(address_to_scripthash("BTC", ADDRESSES[0]), 2 * SATOSHIS_PER_COIN)
+        self.assertTrue(wait_until(lambda: lookup_addresses("BTC", ADDRESSES)[0] == 2))
+    
+    def test_fallback_to_explorer(self):
+        self.server.stop()
+        balances = lookup_addresses("BTC", ADDRESSES)
+        for balance, addr in zip(balances, ADDRESSES):
+            self.assertAlmostEqual(balance, expected_balance(addr), places=8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import curses
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Union
+
+import renderer
+from history import BalanceHistory
+
+"""
+A headless stand-in for the curses standard screen, so the renderer module can be driven by a
+scripted sequence of keys without a terminal. The screen keeps the text written to it and counts
+the drawing calls of every frame. A frame is the work done between two getch calls: the initial
+drawing of a screen, or the handling of a key and the redraw that follows it.
+
+usage:
+    init_fake_render()
+    screen = FakeScreen([curses.KEY_DOWN, curses.KEY_DOWN, renderer.ESCAPE])
+    renderer.remove_addresses_scr(screen, "BTC", addresses, balances, wallet)
+    screen.frames  # FrameStats of every frame
+"""
+
+NO_KEY = -1  # returned by getch when no key was pressed before the timeout
+
+
+class ScriptEnded(Exception):
+    """
+    raised by getch when all the scripted keys were read
+    """
+    pass
+
+
+@dataclass
+class FrameStats:
+    seconds: float = 0.0
+    addstr_calls: int = 0
+    cell_writes: int = 0  # number of characters written
+    erases: int = 0  # number of times the whole screen was erased (full redraws)
+
+
+class FakeScreen:
+    def __init__(self, keys: Iterable[Union[int, Callable[[], None]]], lines: int = 24,
+                 cols: int = 80):
+        """
+        :param keys: the keys returned by getch, in order. NO_KEY simulates a timeout. A callable
+                     is called instead (e.g. to change the rows of a FakeRefresher) and getch
+                     returns NO_KEY
+        """
+        self.lines = lines
+        self.cols = cols
+        self._keys = deque(keys)
+        self._cells = [[" "] * cols for _ in range(lines)]
+        self._y = 0
+        self._x = 0
+        self.frames: List[FrameStats] = []
+        self._frame = FrameStats()
+        self._frame_start = time.perf_counter()
+    
+    def getmaxyx(self):
+        return self.lines, self.cols
+    
+    def addstr(self, *args):
+        """
+        addstr([y, x,] text[, attr]). Like curses, writing outside the screen raises curses.error
+        """
+        if len(args) >= 3 and isinstance(args[0], int):
+            self._y, self._x = args[0], args[1]
+            text = args[2]
+        else:
+            text = args[0]
+        if not 0 <= self._y < self.lines or not 0 <= self._x or self._x + len(text) > self.cols:
+            raise curses.error(f"addstr() returned ERR: {text!r} at ({self._y}, {self._x})")
+        self._cells[self._y][self._x:self._x + len(text)] = text
+        self._x += len(text)
+        self._frame.addstr_calls += 1
+        self._frame.cell_writes += len(text)
+    
+    def erase(self):
+        for line in self._cells:
+            line[:] = " " * self.cols
+        self._frame.erases += 1
+    
+    def border(self):
+        for line in self._cells:
+            line[0] = line[-1] = "|"
+        self._cells[0][:] = self._cells[-1][:] = "-" * self.cols
+    
+    def move(self, y, x):
+        self._y, self._x = y, x
+    
+    def bkgd(self, *args):
+        pass
+    
+    def refresh(self):
+        pass
+    
+    def timeout(self, delay):
+        pass
+    
+    def getch(self) -> int:
+        self._end_frame()
+        if len(self._keys) == 0:
+            raise ScriptEnded()
+        key = self._keys.popleft()
+        if callable(key):
+            key()
+            return NO_KEY
+        return key
+    
+    def _end_frame(self):
+        self._frame.seconds = time.perf_counter() - self._frame_start
+        self.frames.append(self._frame)
+        self._frame = FrameStats()
+        self._frame_start = time.perf_counter()
+    
+    def line(self, y) -> str:
+        """
+        return the text displayed in row y
+        """
+        return "".join(self._cells[y])
+    
+    def text(self) -> str:
+        return "\n".join(self.line(y) for y in range(self.lines))
+
+
+class FakeRefresher:
+    """
+    A refresher whose rows are set by the caller instead of being looked up, for drawing the
+    main screen
+    """
+    
+    def __init__(self, rows: List[List], history: Optional[BalanceHistory] = None):
+        """
+        :param history: the balances history, for drawing the history screen
+        """
+        self.rows = rows
+        self.history = history
+        self.version = 0
+    
+    def update_row(self, index: int, row: List):
+        """
+        replace a row, as if it was refreshed
+        """
+        self.rows[index] = row
+        self.version += 1
+    
+    def get_rows(self) -> List[List]:
+        return [list(row) for row in self.rows]
+    
+    def get_refreshing(self):
+        return set()
+    
+    def get_stale(self):
+        return set()
+    
+    def get_throttled(self):
+        return set()
+    
+    def cancel(self):
+        pass
+
+
+def init_fake_render():
+    """
+    set up the renderer attributes which init_render takes from curses, without a terminal
+    """
+    renderer.attributes['normal'] = curses.A_NORMAL
+    renderer.attributes['highlighted'] = curses.A_REVERSE
@@ -0,0 +1,73 @@
+import math
+import os
+import tempfile
+import unittest
+
+from history import RECORD, BalanceHistory, change_ratio
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.history = BalanceHistory(os.path.join(self.tmp_dir.name, "history"))
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def test_append_and_query(self):
+        for i in range(100):
+            self.history.append(["BTC", i, i * 10.0, i / 10], timestamp=1000 + i * 60)
+        with self.history.view("BTC") as history:
+            self.assertEqual(len(history), 100)
+            self.assertEqual(history.latest(), (1000 + 99 * 60, 99, 990.0, 9.9))
+            self.assertEqual(history.at(1000 + 30 * 60 + 59)[1], 30)
+            self.assertIsNone(history.at(999))
+            records = history.range(1000 + 10 * 60, 1000 + 13 * 60)
+            self.assertEqual([record[1] for record in records], [10, 11, 12])
+        self.assertEqual(os.path.getsize(self.history.path("BTC")), 100 * RECORD.size)
+    
+    def test_unknown_values(self):
+        self.history.append(["BTC", 'N/A', 'N/A', 'N/A'], timestamp=1000)
+        self.history.append(["BTC", 1.5, 'N/A', 'N/A'], timestamp=1001)
+        with self.history.view("BTC") as history:
+            self.assertEqual(len(history), 1)
+            self.assertTrue(math.isnan(history.latest()[2]))
+        with self.history.view("ETH") as history:
+            self.assertEqual(len(history), 0)
+            self.assertIsNone(history.latest())
+    
+    def test_records_stay_sorted(self):
+        self.history.append(["BTC", 1, 1.0, 1], timestamp=2000)
+        # the clock went back
+        BalanceHistory(self.history.directory).append(["BTC", 2, 2.0, 1], timestamp=1000)
+        with self.history.view("BTC") as history:
+            self.assertEqual(history.latest(), (2000, 2, 2.0, 1))
+    
+    def test_interrupted_append(self):
+        self.history.append(["BTC", 1, 1.0, 1], timestamp=1000)
+        with open(self.history.path("BTC"), "ab") as f:
+            f.write(b"\0" * 5)
+        with self.history.view("BTC") as history:
+            self.assertEqual(len(history), 1)
+        self.history.append(["BTC", 2, 2.0, 1], timestamp=2000)
+        with self.history.view("BTC") as history:
+            self.assertEqual([record[1] for record in history.range(0, 3000)], [1, 2])
+    
+    def test_usd_values(self):
+        self.history.append(["BTC", 1, 100.0, 1], timestamp=1000)
+        self.history.append(["BTC", 1, 150.0, 1], timestamp=2000)
+        values = self.history.usd_values("BTC", [3000, 1500, 500])
+        self.assertEqual(values[:2], [150.0, 100.0])
+        self.assertTrue(math.isnan(values[2]))
+        self.assertAlmostEqual(change_ratio(values[1], values[0]), 0.5)
+        self.assertIsNone(change_ratio(values[2], values[0]))
+    
+    def test_delete(self):
+        self.history.append(["BTC", 1, 1.0, 1], timestamp=1000)
+        self.history.delete()
+        self.assertFalse(os.path.exists(self.history.path("BTC")))
+        self.assertTrue(math.isnan(self.history.usd_values("BTC", [1000])[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
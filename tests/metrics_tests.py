@@ -0,0 +1,44 @@
+import unittest
+
+from metrics import Histogram, Metrics
+
+
+class HistogramTest(unittest.TestCase):
+    
+    def test_percentiles(self):
+        histogram = Histogram(bounds=(0.1, 1))
+        self.assertIsNone(histogram.percentile(50))
+        for value in [0.05] * 90 + [0.5] * 9 + [3]:
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(50), 0.1)
+        self.assertEqual(histogram.percentile(95), 1)
+        # the last bucket is unbounded. its values are bounded by the maximal value
+        self.assertEqual(histogram.percentile(100), 3)
+
+
+class MetricsTest(unittest.TestCase):
+    
+    def test_summary(self):
+        metrics = Metrics(log_interval=None)
+        metrics.record_request("blockchain.info", 0.2, succeeded=True, payload_bytes=2048)
+        metrics.record_request("blockchain.info", 0.3, succeeded=False)
+        metrics.record_request("blockchain.info", 0.01, succeeded=False, throttled=True)
+        metrics.record_throttled("blockchain.info")
+        metrics.record_cache("balances", hits=3, misses=1)
+        provider = metrics.providers["blockchain.info"]
+        self.assertEqual((provider.requests, provider.errors, provider.throttled), (3, 1, 2))
+        
+        lines = metrics.summary()
+        self.assertListEqual(lines[1].split(), ["blockchain.info", "3", "1", "2", "250", "300",
+                                                "0.7"])
+        self.assertListEqual(lines[-1].split(), ["balances", "3", "1", "75%"])
+        self.assertTrue(all(len(line) < 78 for line in lines))  # fits in the stats screen
+        
+        lines = metrics.summary({"blockchain.info": (2.6, 5, False), "etherscan.io": (0, 5, True)})
+        self.assertListEqual(lines[-2].split(), ["blockchain.info", "2", "5"])
+        self.assertListEqual(lines[-1].split(), ["etherscan.io", "0", "5", "throttled"])
+        self.assertTrue(all(len(line) < 78 for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
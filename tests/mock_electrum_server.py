@@ -0,0 +1,198 @@
+import hashlib
+import json
+import socket
+import socketserver
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from mock_provider_server import expected_balance
+
+"""
+A local Electrum server that answers the requests of electrum_client, so the Electrum backend
+can be tested without a full node.
+Every scripthash has a deterministic balance (expected_balance of the scripthash, confirmed),
+which can be changed with set_balance. Changes and new blocks are pushed to the connections
+that subscribed to them. Every received message (a request or a batch of requests) is counted
+in `messages`, and every call in `calls`, by method.
+
+usage:
+    with MockElectrumServer() as server:
+        client = ElectrumClient(server.host, server.port)
+"""
+
+SATOSHIS_PER_COIN = 10 ** 8
+
+
+class MockElectrumServer:
+    def __init__(self):
+        self.chain_height = 1000
+        self.messages = 0
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._balances: Dict[str, Tuple[int, int]] = {}  # (confirmed, unconfirmed) satoshis
+        self._connections: Set["socketserver.StreamRequestHandler"] = set()
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={
+            "poll_interval": 0.05,
+        }, daemon=True)
+    
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+    
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+    
+    def start(self) -> "MockElectrumServer":
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.disconnect_all()
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def __enter__(self) -> "MockElectrumServer":
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def reset_counts(self):
+        with self._lock:
+            self.messages = 0
+            self.calls.clear()
+    
+    def balance(self, scripthash: str) -> Tuple[int, int]:
+        with self._lock:
+            return self._balances.get(
+                scripthash, (round(expected_balance(scripthash) * SATOSHIS_PER_COIN), 0)
+            )
+    
+    def status(self, scripthash: str) -> Optional[str]:
+        """
+        the status of a scripthash changes whenever its balance changes. In a real server it's
+        the hash of the scripthash's history
+        """
+        return hashlib.sha256(repr(self.balance(scripthash)).encode()).hexdigest()
+    
+    def set_balance(self, scripthash: str, confirmed: int, unconfirmed: int = 0):
+        """
+        set the balance of a scripthash, in satoshis, and notify its subscribers
+        """
+        with self._lock:
+            self._balances[scripthash] = (confirmed, unconfirmed)
+            connections = [c for c in self._connections if scripthash in c.subscriptions]
+        for connection in connections:
+            connection.notify("blockchain.scripthash.subscribe",
+                              [scripthash, self.status(scripthash)])
+    
+    def mine(self, blocks: int = 1):
+        """
+        advance the tip of the chain, and notify the subscribers
+        """
+        with self._lock:
+            self.chain_height += blocks
+            connections = [c for c in self._connections if c.headers_subscribed]
+        for connection in connections:
+            connection.notify("blockchain.headers.subscribe", [self.header()])
+    
+    def header(self) -> dict:
+        return {"height": self.chain_height, "hex": "00" * 80}
+    
+    def disconnect_all(self):
+        """
+        close all the client connections, as if the server restarted
+        """
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.close()
+    
+    def send_all(self, message):
+        """
+        send the given message to all the client connections as is
+        """
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.send(message)
+    
+    def _call(self, handler, method: str, params: list):
+        with self._lock:
+            self.calls[method] += 1
+        if method == "server.version":
+            return ["MockElectrum 1.0", "1.4"]
+        if method == "blockchain.scripthash.get_balance":
+            confirmed, unconfirmed = self.balance(params[0])
+            return {"confirmed": confirmed, "unconfirmed": unconfirmed}
+        if method == "blockchain.scripthash.subscribe":
+            handler.subscriptions.add(params[0])
+            return self.status(params[0])
+        if method == "blockchain.headers.subscribe":
+            handler.headers_subscribed = True
+            return self.header()
+        raise KeyError(method)
+    
+    def _answer(self, handler, request: dict) -> dict:
+        try:
+            result = self._call(handler, request["method"], request.get("params", []))
+            return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+        except KeyError:
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": -32601, "message": "unknown method"}}
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                self.subscriptions: Set[str] = set()
+                self.headers_subscribed = False
+                self._write_lock = threading.Lock()
+                with server._lock:
+                    server._connections.add(self)
+            
+            def finish(self):
+                with server._lock:
+                    server._connections.discard(self)
+                try:
+                    super().finish()
+                except OSError:
+                    pass
+            
+            def send(self, message):
+                with self._write_lock:
+                    try:
+                        self.wfile.write(json.dumps(message).encode() + b"\n")
+                        self.wfile.flush()
+                    except (OSError, ValueError):
+                        pass  # the connection was closed
+            
+            def notify(self, method: str, params: list):
+                self.send({"jsonrpc": "2.0", "method": method, "params": params})
+            
+            def close(self):
+                try:
+                    self.request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            
+            def handle(self):
+                try:
+                    for line in self.rfile:
+                        message = json.loads(line)
+                        with server._lock:
+                            server.messages += 1
+                        if isinstance(message, list):
+                            self.send([server._answer(self, request) for request in message])
+                        else:
+                            self.send(server._answer(self, message))
+                except (OSError, ValueError):
+                    pass
+        
+        return Handler
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import data_retriever
+import transport
+
+"""
+A local HTTP server that reproduces the responses of the providers used by data_retriever
+(blockchain.info, etherscan, btc.com and coinmarketcap) and of an Ethereum JSON-RPC node, so
+lookups can be tested and benchmarked without network access.
+Every address has a deterministic balance (see expected_balance), so wallets of any size can be
+generated, and so are the ERC-20 token balances (see expected_token_balance). Latency, error
+rate and rate limits are configurable.
+All chains share a single tip height, which advances when mine() is called. Chain height requests
+are counted in height_requests, apart from the balance and ticker requests in request_counts.
+
+usage:
+    with MockProviderServer(MockConfig(latency=0.05)) as server:
+        server.patch_data_retriever()
+        data_retriever.lookup_addresses("BTC", [...])
+"""
+
+PROVIDERS = ("blockchain.info", "etherscan", "btc.com", "coinmarketcap", "eth-rpc")
+
+ETHERSCAN_MAX_BATCH = 20
+
+# coins in the mock ticker: symbol -> (price_usd, price_btc)
+TICKER = {
+    "BTC": (10000.0, 1.0),
+    "ETH": (500.0, 0.05),
+    "BCH": (300.0, 0.03),
+    "LTC": (100.0, 0.01),
+    "XMR": (150.0, 0.015),
+    "USDT": (1.0, 0.0001),
+}
+
+TOKEN_DECIMALS = 6  # the atomic units of the ERC-20 balances the mock node answers with
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.0  # seconds added to every response
+    latency_jitter: float = 0.0  # a random number of seconds up to this is added to the latency
+    per_address_latency: float = 0.0  # seconds added per address in the request
+    error_rate: float = 0.0  # probability of answering with an HTTP 500
+    # maximum number of requests per second to each provider. above it, the provider answers
+    # with 429 and a Retry-After header. None means unlimited
+    rate_limit: Optional[float] = None
+    invalid_addresses: Set[str] = field(default_factory=set)  # rejected by the providers
+    # have an unconfirmed transaction, as reported by btc.com
+    unconfirmed_addresses: Set[str] = field(default_factory=set)
+    seed: int = 0  # seed of the random errors and jitter
+
+
+def expected_balance(address: str) -> float:
+    """
+    the balance the mock providers report for the given address, in coins
+    """
+    digest = hashlib.sha256(address.encode()).digest()
+    return int.from_bytes(digest[:4], "big") % 10 ** 8 / 1e8
+
+
+def expected_token_balance(contract: str, address: str) -> float:
+    """
+    the balance of the given address in the ERC-20 token of the given contract, in whole tokens
+    """
+    balance = expected_balance(f"{contract.lower()}/{address.lower()}")
+    return round(balance * 10 ** TOKEN_DECIMALS) / 10 ** TOKEN_DECIMALS
+
+
+def is_invalid(address: str, config: MockConfig) -> bool:
+    return address in config.invalid_addresses or address.startswith("invalid")
+
+
+class MockProviderServer:
+    def __init__(self, config: MockConfig = None):
+        self.config = config if config is not None else MockConfig()
+        self.request_counts: Dict[str, int] = {provider: 0 for provider in PROVIDERS}
+        self.height_requests = 0
+        self.chain_height = 1000
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._last_requests: Dict[str, list] = {provider: [] for provider in PROVIDERS}
+        self._original_urls = None
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={
+            "poll_interval": 0.05,  # how long stop() may wait for the server to shut down
+        }, daemon=True)
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+    
+    def start(self) -> "MockProviderServer":
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.restore_data_retriever()
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def __enter__(self) -> "MockProviderServer":
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def total_requests(self) -> int:
+        """
+        return the number of balance and ticker requests. Chain height requests are not included
+        """
+        with self._lock:
+            return sum(self.request_counts.values())
+    
+    def reset_counts(self):
+        with self._lock:
+            for provider in PROVIDERS:
+                self.request_counts[provider] = 0
+            self.height_requests = 0
+    
+    def mine(self, blocks: int = 1):
+        """
+        advance the tip of all chains
+        """
+        with self._lock:
+            self.chain_height += blocks
+    
+    def patch_data_retriever(self):
+        """
+        point the providers URLs of data_retriever to this server and clear its caches. The cache
+        shared with other processes is disabled, so the user's cached answers aren't used (set
+        data_retriever.shared_cache to test it)
+        """
+        if self._original_urls is None:
+            self._original_urls = (
+                data_retriever.BLOCKCHAIN_INFO_URL, data_retriever.ETHERSCAN_URL,
+                dict(data_retriever.BTC_COM_URLS), data_retriever.COINMARKETCAP_URL,
+                data_retriever.shared_cache, data_retriever.ETH_RPC_URL,
+            )
+        data_retriever.shared_cache = None
+        data_retriever.ETH_RPC_URL = f"{self.url}/eth-rpc"
+        data_retriever.BLOCKCHAIN_INFO_URL = f"{self.url}/blockchain.info"
+        data_retriever.ETHERSCAN_URL = f"{self.url}/etherscan"
+        for chain in data_retriever.BTC_COM_URLS:
+            data_retriever.BTC_COM_URLS[chain] = f"{self.url}/btc.com/{chain}"
+        data_retriever.COINMARKETCAP_URL = f"{self.url}/coinmarketcap"
+        clear_caches()
+    
+    def restore_data_retriever(self):
+        if self._original_urls is None:
+            return
+        (data_retriever.BLOCKCHAIN_INFO_URL, data_retriever.ETHERSCAN_URL, btc_com_urls,
+         data_retriever.COINMARKETCAP_URL, data_retriever.shared_cache,
+         data_retriever.ETH_RPC_URL) = self._original_urls
+        data_retriever.BTC_COM_URLS.update(btc_com_urls)
+        self._original_urls = None
+        clear_caches()
+    
+    def _is_throttled(self, provider: str) -> bool:
+        # must be called while holding the lock
+        if self.config.rate_limit is None:
+            return False
+        now = time.monotonic()
+        recent = [t for t in self._last_requests[provider] if now - t < 1]
+        self._last_requests[provider] = recent
+        if len(recent) >= self.config.rate_limit:
+            return True
+        recent.append(now)
+        return False
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep connections alive, like the real providers
+            # headers and body are written separately. don't let Nagle's algorithm delay the body
+            disable_nagle_algorithm = True
+            
+            def log_message(self, *args):
+                pass  # keep the tests output clean
+            
+            def send(self, status: int, body, headers: Dict[str, str] = None):
+                payload = body if isinstance(body, str) else json.dumps(body)
+                payload = payload.encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                path = parts.path.strip("/").split("/")
+                provider = path[0]
+                if provider not in PROVIDERS:
+                    self.send(404, "not found")
+                    return
+                
+                query = parse_qs(parts.query)
+                is_height_request = (
+                    path[-2:] == ["q", "getblockcount"] or path[-2:] == ["block", "latest"] or
+                    query.get("action") == ["eth_blockNumber"]
+                )
+                with server._lock:
+                    if is_height_request:
+                        server.height_requests += 1
+                    else:
+                        server.request_counts[provider] += 1
+                    throttled = server._is_throttled(provider)
+                    error = server._random.random() < server.config.error_rate
+                    jitter = server._random.random() * server.config.latency_jitter
+                
+                if throttled:
+                    self.send(429, "rate limit exceeded", {"Retry-After": "1"})
+                    return
+                if error:
+                    self.send(500, "internal server error")
+                    return
+                
+                if is_height_request:
+                    addresses = []
+                    response = server.height(provider)
+                elif provider == "blockchain.info":
+                    addresses = query.get("active", [""])[0].split("|")
+                    response = server.blockchain_info(addresses)
+                elif provider == "etherscan":
+                    addresses = query.get("address", [""])[0].split(",")
+                    response = server.etherscan(addresses)
+                elif provider == "btc.com":
+                    addresses = unquote(path[-1]).split(",")
+                    response = server.btc_com(addresses)
+                else:
+                    addresses = []
+                    response = server.coinmarketcap()
+                
+                time.sleep(server.config.latency + jitter +
+                           server.config.per_address_latency * len(addresses))
+                self.send(*response)
+            
+            def do_POST(self):
+                provider = urlsplit(self.path).path.strip("/")
+                if provider != "eth-rpc":
+                    self.send(404, "not found")
+                    return
+                calls = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.request_counts[provider] += 1
+                    throttled = server._is_throttled(provider)
+                    error = server._random.random() < server.config.error_rate
+                    jitter = server._random.random() * server.config.latency_jitter
+                
+                if throttled:
+                    self.send(429, "rate limit exceeded", {"Retry-After": "1"})
+                    return
+                if error:
+                    self.send(500, "internal server error")
+                    return
+                time.sleep(server.config.latency + jitter +
+                           server.config.per_address_latency * len(calls))
+                self.send(200, [server.eth_call(call) for call in calls])
+        
+        return Handler
+    
+    def height(self, provider):
+        with self._lock:
+            height = self.chain_height
+        if provider == "blockchain.info":
+            return 200, str(height)
+        elif provider == "etherscan":
+            return 200, {"jsonrpc": "2.0", "id": 83, "result": hex(height)}
+        return 200, {"err_no": 0, "data": {"height": height, "hash": f"{height:064x}"}}
+    
+    def blockchain_info(self, addresses):
+        if any(is_invalid(addr, self.config) for addr in addresses):
+            return 400, "Invalid Bitcoin Address"
+        return 200, {
+            addr: {
+                "final_balance": round(expected_balance(addr) * 1e8),
+                "n_tx": 1,
+                "total_received": round(expected_balance(addr) * 1e8),
+            }
+            for addr in addresses
+        }
+    
+    def etherscan(self, addresses):
+        if len(addresses) > ETHERSCAN_MAX_BATCH:
+            return 200, {"status": "0", "message": "NOTOK",
+                         "result": f"Maximum of {ETHERSCAN_MAX_BATCH} addresses per request"}
+        if any(is_invalid(addr, self.config) for addr in addresses):
+            return 200, {"status": "0", "message": "NOTOK",
+                         "result": "Error! Invalid address format"}
+        return 200, {"status": "1", "message": "OK", "result": [
+            {"account": addr, "balance": str(round(expected_balance(addr) * 1e8) * 10 ** 10)}
+            for addr in addresses
+        ]}
+    
+    def btc_com(self, addresses):
+        if any(is_invalid(addr, self.config) for addr in addresses):
+            return 200, {"err_no": 1, "err_msg": "invalid address", "data": None}
+        data = [
+            {"address": addr, "balance": round(expected_balance(addr) * 1e8), "tx_count": 1,
+             "unconfirmed_tx_count": int(addr in self.config.unconfirmed_addresses)}
+            for addr in addresses
+        ]
+        # a single address is returned as a dictionary instead of a list
+        return 200, {"err_no": 0, "data": data[0] if len(data) == 1 else data}
+    
+    def eth_call(self, call: dict) -> dict:
+        """
+        answer a JSON-RPC call of the ERC-20 balanceOf function
+        """
+        params = call["params"][0]
+        data = params["data"]
+        # balanceOf of an address, padded to 32 bytes
+        if call["method"] != "eth_call" or not re.fullmatch("0x70a08231[0-9a-f]{64}", data):
+            return {"jsonrpc": "2.0", "id": call["id"],
+                    "error": {"code": -32000, "message": "execution reverted"}}
+        balance = round(expected_token_balance(params["to"], "0x" + data[-40:]) *
+                        10 ** TOKEN_DECIMALS)
+        return {"jsonrpc": "2.0", "id": call["id"], "result": f"0x{balance:064x}"}
+    
+    def coinmarketcap(self):
+        return 200, [
+            {"symbol": symbol, "price_usd": str(usd), "price_btc": str(btc)}
+            for symbol, (usd, btc) in TICKER.items()
+        ]
+
+
+def clear_caches():
+    """
+    clear the caches of data_retriever, along with the providers health and throttling state it
+    learned, so tests don't depend on the lookups of earlier tests
+    """
+    data_retriever.balance_cache.invalidate()
+    data_retriever.price_cache.clear()
+    # the providers are ranked in registration order again
+    for providers in data_retriever.provider_registry._providers.values():
+        for provider in providers:
+            provider.latency = None
+            provider.error_rate = 0.0
+            provider.requests = 0
+            provider.errors = 0
+    transport._buckets.clear()
+    transport._throttled_until.clear()
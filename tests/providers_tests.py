@@ -0,0 +1,59 @@
+import time
+import unittest
+
+from providers import ProviderRegistry
+
+
+def make_lookup(delay=0.0, fails=False, balance=1.0, calls=None):
+    """
+    return a fake provider lookup that takes `delay` seconds and either fails or returns
+    `balance` for every address
+    """
+    def lookup(addresses):
+        if calls is not None:
+            calls.append(balance)
+        time.sleep(delay)
+        return None if fails else [balance] * len(addresses)
+    return lookup
+
+
+class ProviderRegistryTest(unittest.TestCase):
+    
+    def test_fallback_on_failure(self):
+        registry = ProviderRegistry()
+        registry.register("BTC", "down", make_lookup(fails=True))
+        registry.register("BTC", "up", make_lookup(balance=2.0))
+        self.assertListEqual(registry.lookup("btc", ["a", "b"]), [2.0, 2.0])
+        self.assertIsNone(registry.lookup("XMR", ["a"]))
+    
+    def test_failing_provider_is_demoted(self):
+        registry = ProviderRegistry()
+        registry.register("BTC", "down", make_lookup(fails=True))
+        # slower than the failing provider, so the failing one keeps being tried first until
+        # it's unhealthy
+        registry.register("BTC", "up", make_lookup(delay=0.01))
+        for _ in range(5):
+            registry.lookup("BTC", ["a"])
+        self.assertListEqual([p.name for p in registry.get_providers("BTC")], ["up", "down"])
+    
+    def test_fastest_provider_first(self):
+        registry = ProviderRegistry()
+        registry.register("BTC", "slow", make_lookup(delay=0.05))
+        registry.register("BTC", "fast", make_lookup())
+        for provider in registry.get_providers("BTC"):
+            provider.timed_lookup(["a"])
+        self.assertListEqual([p.name for p in registry.get_providers("BTC")], ["fast", "slow"])
+    
+    def test_hedging(self):
+        calls = []
+        registry = ProviderRegistry(hedge_after=0.05)
+        registry.register("BTC", "hanging", make_lookup(delay=1, balance=1.0, calls=calls))
+        registry.register("BTC", "backup", make_lookup(balance=2.0, calls=calls))
+        start = time.monotonic()
+        self.assertListEqual(registry.lookup("BTC", ["a"]), [2.0])
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertListEqual(calls, [1.0, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
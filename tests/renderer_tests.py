@@ -0,0 +1,100 @@
+import curses
+import os
+import tempfile
+import time
+import unittest
+
+import renderer
+import transport
+from fake_screen import NO_KEY, FakeRefresher, FakeScreen, ScriptEnded, init_fake_render
+from history import BalanceHistory
+from metrics import metrics
+from wallet import Wallet
+
+
+class RendererTest(unittest.TestCase):
+    """
+    tests of the curses screens on a fake screen. Besides what is displayed, they check the
+    drawing budget of every keypress, so rendering doesn't regress to full redraws
+    """
+    
+    def setUp(self):
+        init_fake_render()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.wallet = Wallet(storage_path=os.path.join(self.tmp_dir.name, "wallet.db"),
+                             legacy_path=os.path.join(self.tmp_dir.name, "wallet"))
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def test_main_screen(self):
+        refresher = FakeRefresher([["BTC", 1.5, 15000.0, 1.5], ["ETH", 2, 1000.0, 0.1]])
+        screen = FakeScreen([curses.KEY_RIGHT, curses.KEY_RIGHT, renderer.ENTER])
+        self.assertEqual(renderer.display_main_scr(screen, refresher), renderer.REFRESH)
+        self.assertIn("BTC         1.5         15000.0     1.5", screen.text())
+        self.assertIn("Total Balance: 16000.0 USD, 1.6 BTC", screen.text())
+        for frame in screen.frames[1:]:
+            self.assertEqual(frame.erases, 0)
+            self.assertLess(frame.cell_writes, 100)  # only the options bar
+    
+    def test_main_screen_row_update(self):
+        refresher = FakeRefresher([[f"C{i:03d}", 1, 1.0, 0.1] for i in range(100)])
+        screen = FakeScreen([lambda: refresher.update_row(1, ["C001", 2, 2.0, 0.2])])
+        with self.assertRaises(ScriptEnded):
+            renderer.display_main_scr(screen, refresher)
+        self.assertIn("1-13 of 100", screen.line(4))
+        self.assertIn("C001        2           2.0         0.2", screen.line(6))
+        # the updated row, the total and the table header
+        self.assertEqual(screen.frames[-1].erases, 0)
+        self.assertLessEqual(screen.frames[-1].addstr_calls, 4)
+    
+    def test_stats_screen(self):
+        metrics.reset()
+        metrics.record_request("blockchain.info", 0.2, succeeded=True)
+        transport.get_bucket("blockchain.info").pause(60)  # its budget is used up
+        try:
+            screen = FakeScreen([NO_KEY, renderer.ESCAPE])
+            renderer.display_stats_scr(screen)
+        finally:
+            transport._buckets.pop("blockchain.info")
+        self.assertIn("blockchain.info", screen.text())
+        self.assertRegex(screen.text(), r"blockchain\.info +0 +5")
+        self.assertEqual(screen.frames[1].addstr_calls, 0)  # nothing changed
+    
+    def test_history_screen(self):
+        history = BalanceHistory(os.path.join(self.tmp_dir.name, "history"))
+        now = time.time()
+        history.append(["BTC", 1, 10000.0, 1], timestamp=now - 2 * 24 * 60 * 60)
+        history.append(["BTC", 1, 12000.0, 1], timestamp=now - 60)
+        history.append(["ETH", 2, 1000.0, 0.1], timestamp=now - 60)
+        refresher = FakeRefresher([["BTC", 1, 12000.0, 1], ["ETH", 2, 1000.0, 0.1]], history)
+        screen = FakeScreen([renderer.ESCAPE])
+        renderer.display_history_scr(screen, refresher)
+        self.assertIn("BTC         12000.00    +20.00%     -           -", screen.text())
+        self.assertIn("ETH         1000.00     -           -           -", screen.text())
+        self.assertIn("Total       13000.00    +20.00%     -           -", screen.text())
+    
+    def test_long_addresses_list(self):
+        addresses = [f"address-{i}" for i in range(10000)]
+        balances = [0.5] * len(addresses)
+        self.wallet.add_addresses("BTC", addresses)
+        # the last option is the Done button. the address above it is the last address
+        screen = FakeScreen([curses.KEY_DOWN] * 20 + [curses.KEY_END, curses.KEY_UP,
+                                                      renderer.ENTER, renderer.ESCAPE])
+        renderer.remove_addresses_scr(screen, "BTC", addresses, balances, self.wallet)
+        # the last address was removed
+        self.assertEqual(len(addresses), 9999)
+        self.assertNotIn("address-9999", self.wallet.get_coin_info("BTC").addresses)
+        self.assertIn("address-9998", screen.text())
+        self.assertIn("Done", screen.text())
+        for i, frame in enumerate(screen.frames[1:21]):
+            self.assertEqual(frame.erases, 0)
+            # the whole list scrolls once the highlight reaches the bottom of the screen. until
+            # then, only the two lines whose highlight changed are redrawn
+            self.assertLess(frame.cell_writes, screen.lines * screen.cols)
+            if i < 10:
+                self.assertLess(frame.addstr_calls, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
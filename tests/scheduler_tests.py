@@ -0,0 +1,128 @@
+import os
+import tempfile
+import time
+import unittest
+
+from mock_provider_server import MockConfig, MockProviderServer, expected_balance
+from refresher import Refresher
+from scheduler import PRICES_JOB, AdaptiveInterval, PollScheduler
+from wallet import Wallet
+
+
+class AdaptiveIntervalTest(unittest.TestCase):
+    
+    def test_adapts_within_bounds(self):
+        interval = AdaptiveInterval(base=10, minimum=5, maximum=30)
+        self.assertEqual(interval.update(changed=True), 5)
+        self.assertEqual(interval.update(changed=True), 5)
+        self.assertEqual(interval.update(changed=False), 7.5)
+        self.assertEqual(interval.update(changed=False, failed=True), 15)
+        self.assertEqual(interval.update(changed=False, failed=True), 30)
+        self.assertEqual(interval.update(changed=False), 30)
+    
+    def test_base_is_bounded(self):
+        self.assertEqual(AdaptiveInterval(base=100, minimum=5, maximum=30).current, 30)
+
+
+class PollSchedulerTest(unittest.TestCase):
+    
+    def test_due_jobs(self):
+        scheduler = PollScheduler(price_interval=(0, 0, 10), address_interval=(0, 0, 10))
+        scheduler.sync_coins(["BTC", "ETH"])
+        self.assertSetEqual(set(scheduler.take_due()), {PRICES_JOB, "BTC", "ETH"})
+        # running jobs aren't due until they are reported
+        self.assertListEqual(scheduler.take_due(), [])
+        self.assertIsNone(scheduler.seconds_until_due())
+        
+        scheduler.report("BTC", changed=False, failed=True)
+        self.assertListEqual(scheduler.take_due(), ["BTC"])
+    
+    def test_sync_coins(self):
+        scheduler = PollScheduler(price_interval=(10, 10, 10), address_interval=(20, 20, 20))
+        scheduler.sync_coins(["BTC", "ETH"])
+        scheduler.sync_coins(["ETH", "LTC"])
+        self.assertIsNone(scheduler.get_interval("BTC"))
+        self.assertEqual(scheduler.get_interval("LTC"), 20)
+        self.assertEqual(scheduler.get_interval(PRICES_JOB), 10)
+        self.assertAlmostEqual(scheduler.seconds_until_due(), 10, places=1)
+        # reporting a removed coin is ignored
+        scheduler.report("BTC", changed=True)
+        self.assertIsNone(scheduler.get_interval("BTC"))
+
+
+class WatchTest(unittest.TestCase):
+    """
+    tests of the refresher watch mode against the local mock providers server
+    """
+    
+    def setUp(self):
+        self.server = MockProviderServer(MockConfig()).start()
+        self.server.patch_data_retriever()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.wallet = Wallet(storage_path=os.path.join(self.tmp_dir.name, "wallet.db"),
+                             legacy_path=os.path.join(self.tmp_dir.name, "wallet"))
+        self.refresher = Refresher(self.wallet,
+                                   snapshot_path=os.path.join(self.tmp_dir.name, "snapshot.json"),
+                                   history_dir=os.path.join(self.tmp_dir.name, "history"))
+    
+    def tearDown(self):
+        self.refresher.stop_watching()
+        self.server.stop()
+        self.tmp_dir.cleanup()
+    
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out")
+            time.sleep(0.01)
+    
+    def test_polls_due_jobs(self):
+        addresses = ["address-1", "address-2"]
+        self.wallet.add_addresses("BTC", addresses)
+        self.wallet.add_manual_balance("ETH", 2)
+        self.refresher.watch(PollScheduler(price_interval=(0.05, 0.05, 0.05),
+                                           address_interval=(0.05, 0.05, 0.05)))
+        # the addresses are polled by checking the chain tip, and looked up again once it
+        # advances
+        self.wait_for(lambda: self.server.height_requests >= 3)
+        self.server.mine()
+        self.wait_for(lambda: self.server.request_counts["blockchain.info"] >= 2)
+        self.wait_for(lambda: self.server.request_counts["coinmarketcap"] >= 3)
+        rows = {row[0]: row for row in self.refresher.get_rows()}
+        self.assertAlmostEqual(rows["BTC"][1], sum(map(expected_balance, addresses)), places=8)
+        self.assertEqual(rows["ETH"][1], 2)
+        self.assertNotEqual(rows["ETH"][2], 'N/A')
+    
+    def test_polls_skip_unchanged_tip(self):
+        addresses = [f"0x{i:040x}" for i in range(2)]
+        self.wallet.add_addresses("ETH", addresses)
+        self.refresher.watch(PollScheduler(price_interval=(60, 60, 60),
+                                           address_interval=(0.05, 0.05, 0.05)))
+        # the addresses are looked up once, and then only the chain tip is polled
+        self.wait_for(lambda: self.server.height_requests >= 3)
+        self.assertEqual(self.server.request_counts["etherscan"], 1)
+        self.server.mine()
+        self.wait_for(lambda: self.server.request_counts["etherscan"] >= 2)
+    
+    def test_refresh_appends_history(self):
+        self.wallet.add_addresses("BTC", ["address-1"])
+        self.refresher.start()
+        self.wait_for(lambda: not self.refresher.is_refreshing())
+        with self.refresher.history.view("BTC") as history:
+            self.assertEqual(len(history), 1)
+            self.assertAlmostEqual(history.latest()[1], expected_balance("address-1"), places=8)
+    
+    def test_stop_watching(self):
+        self.wallet.add_addresses("BTC", ["address-1"])
+        self.refresher.watch(PollScheduler(price_interval=(0.05, 0.05, 0.05),
+                                           address_interval=(0.05, 0.05, 0.05)))
+        self.wait_for(lambda: self.server.request_counts["blockchain.info"] >= 1)
+        self.refresher.stop_watching()
+        time.sleep(0.2)  # let a running poll finish
+        self.server.reset_counts()
+        time.sleep(0.3)
+        self.assertEqual(self.server.total_requests(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
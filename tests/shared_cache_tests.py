@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from shared_cache import SharedCache
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# stores balances in the shared cache from another process
+WRITER = """
+import sys
+from shared_cache import SharedCache
+cache = SharedCache(sys.argv[1])
+for i in range(50):
+    cache.put_balances({("BTC", f"address-{sys.argv[2]}-{i}"): (i / 10, 1000)}, stored_at=1000)
+"""
+
+
+class SharedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cache.db")
+        self.cache = SharedCache(self.path)
+    
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+    
+    def test_balances(self):
+        entries = {("BTC", "address-1"): (1.5, 1000), ("ETH", "address-1"): (2, None)}
+        self.cache.put_balances(entries, stored_at=1234)
+        other = SharedCache(self.path)  # e.g. in another process
+        try:
+            self.assertDictEqual(other.get_balances([*entries, ("BTC", "unknown")]),
+                                 {key: (entry, 1234) for key, entry in entries.items()})
+            other.forget_balances([("BTC", "address-1")])
+        finally:
+            other.close()
+        self.assertDictEqual(self.cache.get_balances([("BTC", "address-1")]), {})
+    
+    def test_many_balances(self):
+        keys = [("BTC", f"address-{i}") for i in range(2000)]
+        self.cache.put_balances({key: (1, 1000) for key in keys}, stored_at=1234)
+        self.assertEqual(len(self.cache.get_balances(keys)), len(keys))
+    
+    def test_ticker(self):
+        self.assertIsNone(self.cache.get_ticker())
+        self.cache.put_ticker({"BTC": (10000.0, 1.0)}, fetched_at=2000)
+        # an older ticker doesn't replace a newer one
+        self.cache.put_ticker({"BTC": (9000.0, 1.0)}, fetched_at=1000)
+        self.assertEqual(self.cache.get_ticker(), ({"BTC": (10000.0, 1.0)}, 2000))
+    
+    def test_forget_without_database(self):
+        self.cache.forget_balances([("BTC", "address-1")])
+        self.assertFalse(os.path.exists(self.path))
+    
+    def test_concurrent_processes(self):
+        env = dict(os.environ, PYTHONPATH=ROOT_DIR, HOME=self.tmp_dir.name)
+        writers = [subprocess.Popen([sys.executable, "-c", WRITER, self.path, str(i)], env=env)
+                   for i in range(4)]
+        for writer in writers:
+            self.assertEqual(writer.wait(timeout=30), 0)
+        # no write was lost to the locking
+        keys = [("BTC", f"address-{i}-{j}") for i in range(4) for j in range(50)]
+        self.assertEqual(len(self.cache.get_balances(keys)), len(keys))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from threading import Event, Thread
+
+from singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.single_flight = SingleFlight()
+        self.fetched = []  # the keys of every fetch call
+        self.started = Event()
+        self.release = Event()
+    
+    def slow_fetch(self, keys):
+        """
+        a fetch that doesn't return until it's released, so other lookups overlap with it
+        """
+        self.fetched.append(keys)
+        self.started.set()
+        self.release.wait()
+        return {key: key * 10 for key in keys}
+    
+    def start_slow_lookup(self, keys, fetch=None):
+        results = {}
+        thread = Thread(target=lambda: results.update(
+            self.single_flight.lookup(keys, fetch or self.slow_fetch)))
+        thread.start()
+        self.started.wait()
+        return thread, results
+    
+    def test_lookup(self):
+        res = self.single_flight.lookup([1, 2, 2], lambda keys: {key: key * 10 for key in keys})
+        self.assertDictEqual(res, {1: 10, 2: 20})
+        self.assertEqual(self.single_flight.in_flight(), 0)
+    
+    def test_overlapping_keys_fetched_once(self):
+        thread, first_res = self.start_slow_lookup([1, 2, 3])
+        self.assertEqual(self.single_flight.in_flight(), 3)
+        
+        def fetch(keys):
+            self.fetched.append(keys)
+            self.release.set()
+            return {key: key * 10 for key in keys}
+        
+        res = self.single_flight.lookup([2, 3, 4], fetch)
+        thread.join()
+        self.assertListEqual(self.fetched, [[1, 2, 3], [4]])
+        self.assertDictEqual(res, {2: 20, 3: 30, 4: 40})
+        self.assertDictEqual(first_res, {1: 10, 2: 20, 3: 30})
+        self.assertEqual(self.single_flight.in_flight(), 0)
+    
+    def test_failed_lookup(self):
+        def failing_fetch(keys):
+            self.started.set()
+            self.release.wait()
+            return None
+        
+        thread, first_res = self.start_slow_lookup([1, 2], failing_fetch)
+        self.release.set()
+        res = self.single_flight.lookup([2], self.slow_fetch)
+        thread.join()
+        self.assertDictEqual(first_res, {})
+        # the key is either waited for (and failed) or looked up again after the first lookup
+        self.assertIn(res, [{}, {2: 20}])
+    
+    def test_overlapping_failed_lookup(self):
+        def failing_fetch(keys):
+            self.fetched.append(keys)
+            self.started.set()
+            self.release.wait()
+            return None
+        
+        thread, first_res = self.start_slow_lookup([1, 2], failing_fetch)
+        
+        def fetch(keys):
+            self.fetched.append(keys)
+            self.release.set()  # the first lookup fails while this caller waits for key 2
+            return {key: key * 10 for key in keys}
+        
+        res = self.single_flight.lookup([2, 3], fetch)
+        thread.join()
+        # key 2 was waited for, and failed along with the first lookup instead of being looked
+        # up again
+        self.assertListEqual(self.fetched, [[1, 2], [3]])
+        self.assertDictEqual(res, {3: 30})
+        self.assertDictEqual(first_res, {})
+        self.assertEqual(self.single_flight.in_flight(), 0)
+    
+    def test_exception(self):
+        def raising_fetch(keys):
+            self.started.set()
+            self.release.wait()
+            raise ValueError("lookup failed")
+        
+        errors = []
+        
+        def lookup():
+            try:
+                self.single_flight.lookup([1], raising_fetch)
+            except ValueError as e:
+                errors.append(e)
+        
+        thread = Thread(target=lookup)
+        thread.start()
+        self.started.wait()
+        waiter_res = []
+        waiter = Thread(target=lambda: waiter_res.append(
+            self.single_flight.lookup([1], self.slow_fetch)))
+        waiter.start()
+        self.release.set()
+        thread.join()
+        waiter.join()
+        # the exception is raised only in the caller whose fetch raised it
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(len(waiter_res), 1)
+        self.assertEqual(self.single_flight.in_flight(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import os
+import tempfile
+import unittest
+
+from snapshot import load_snapshot, save_snapshot
+
+
+class SnapshotTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "snapshot.json")
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def test_round_trip(self):
+        rows = {"BTC": (["BTC", 1.5, 15000.0, 1.5], 1000.0)}
+        quotes = {"BTC": ((10000.0, 1.0), 990.0)}
+        save_snapshot(self.path, rows, quotes)
+        self.assertTupleEqual(load_snapshot(self.path), (rows, quotes))
+    
+    def test_missing_or_corrupted(self):
+        self.assertTupleEqual(load_snapshot(self.path), ({}, {}))
+        with open(self.path, 'w') as f:
+            f.write('{"version": 1, "rows": ')
+        self.assertTupleEqual(load_snapshot(self.path), ({}, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
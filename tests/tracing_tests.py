@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import tracing
+from tracing import span, traced
+
+
+@traced(describe=lambda coin: {"coin": coin})
+def lookup(coin):
+    with span("parse", size=10):
+        return coin
+
+
+class TracingTest(unittest.TestCase):
+    
+    def tearDown(self):
+        tracing.stop_tracing()
+    
+    def test_disabled(self):
+        self.assertEqual(lookup("BTC"), "BTC")
+        self.assertIsNone(tracing.stop_tracing())
+    
+    def test_spans(self):
+        tracer = tracing.start_tracing()
+        lookup("BTC")
+        thread = threading.Thread(target=lookup, args=("ETH",), name="worker")
+        thread.start()
+        thread.join()
+        self.assertIs(tracing.stop_tracing(), tracer)
+        lookup("LTC")  # not recorded
+        
+        spans = [event for event in tracer.events() if event["ph"] == "X"]
+        self.assertListEqual([(event["name"], event.get("args")) for event in spans], [
+            ("parse", {"size": 10}), ("lookup", {"coin": "BTC"}),
+            ("parse", {"size": 10}), ("lookup", {"coin": "ETH"}),
+        ])
+        # the inner span is within the outer one
+        parse, outer = spans[:2]
+        self.assertGreaterEqual(parse["ts"], outer["ts"])
+        self.assertLessEqual(parse["ts"] + parse["dur"], outer["ts"] + outer["dur"])
+        thread_names = {event["args"]["name"] for event in tracer.events() if event["ph"] == "M"}
+        self.assertIn("worker", thread_names)
+    
+    def test_export(self):
+        tracer = tracing.start_tracing()
+        lookup("BTC")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "trace.json")
+            tracer.export(path)
+            with open(path) as f:
+                trace = json.load(f)
+        self.assertEqual(len([e for e in trace["traceEvents"] if e["ph"] == "X"]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
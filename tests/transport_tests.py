@@ -0,0 +1,89 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import transport
+from metrics import metrics
+from mock_provider_server import MockConfig, MockProviderServer
+from transport import TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+    
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=20, capacity=5)
+        start = time.monotonic()
+        for _ in range(5):
+            self.assertTrue(bucket.acquire())
+        self.assertLess(time.monotonic() - start, 0.05)  # the burst doesn't wait
+        for _ in range(4):
+            self.assertTrue(bucket.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)  # 4 more at 20 per second
+    
+    def test_timeout(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0.1))
+        self.assertLess(bucket.remaining(), 1)
+    
+    def test_pause(self):
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.pause(0.1)
+        self.assertTrue(bucket.is_paused())
+        self.assertEqual(bucket.remaining(), 0)
+        start = time.monotonic()
+        self.assertTrue(bucket.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class ThrottlingTest(unittest.TestCase):
+    
+    def setUp(self):
+        # the mock allows 2 requests per second and answers the rest with Retry-After: 1
+        self.server = MockProviderServer(MockConfig(rate_limit=2)).start()
+        self.host = self.server.url.split("//")[1]
+        self.url = f"{self.server.url}/coinmarketcap/v1/ticker/"
+        self.bucket = TokenBucket(rate=100, capacity=10)
+        transport._buckets[self.host] = self.bucket
+        metrics.reset()
+    
+    def tearDown(self):
+        transport._buckets.pop(self.host, None)
+        transport._throttled_until.pop(self.host, None)
+        self.server.stop()
+    
+    def test_retry_after(self):
+        start = time.monotonic()
+        responses = [transport.get(self.url) for _ in range(3)]
+        self.assertTrue(all(response.ok for response in responses))
+        self.assertEqual(self.server.request_counts["coinmarketcap"], 4)  # one was throttled
+        # the throttled request was sent again by the transport, after the host's Retry-After
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+        self.assertEqual(metrics.providers[self.host].requests, 4)
+        self.assertEqual(metrics.providers[self.host].throttled, 1)
+        self.assertFalse(transport.is_throttled(self.url))
+    
+    def test_throttled_state(self):
+        with patch.object(transport, "HTTP_MAX_THROTTLED_RETRIES", 0):
+            responses = [transport.get(self.url) for _ in range(3)]
+        self.assertEqual(responses[2].status_code, transport.TOO_MANY_REQUESTS)
+        self.assertEqual(self.server.request_counts["coinmarketcap"], 3)  # it wasn't retried
+        self.assertEqual(metrics.providers[self.host].throttled, 1)
+        # the Retry-After window is open
+        self.assertTrue(transport.is_throttled(self.url))
+        self.assertTrue(self.bucket.is_paused())
+        self.assertEqual(transport.remaining_budget(self.url), (0, 10))
+    
+    def test_post_retry_after(self):
+        url = f"{self.server.url}/eth-rpc"
+        call = {"jsonrpc": "2.0", "id": 0, "method": "eth_call",
+                "params": [{"to": "0x" + "ab" * 20, "data": "0x70a08231" + "0" * 64}]}
+        responses = [transport.post(url, [call]) for _ in range(3)]
+        self.assertTrue(all(response.ok for response in responses))
+        self.assertEqual(responses[2].json()[0]["id"], 0)
+        self.assertEqual(self.server.request_counts["eth-rpc"], 4)  # one was throttled
+        self.assertEqual(metrics.providers[self.host].throttled, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import pickle
+import tempfile
+import unittest
+from collections import defaultdict
+
+from wallet import MIGRATED_SUFFIX, TrackedCoin, Wallet
+
+
+class WalletStorageTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "wallet.db")
+        self.legacy_path = os.path.join(self.tmp_dir.name, "wallet")
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def open_wallet(self) -> Wallet:
+        return Wallet(storage_path=self.db_path, legacy_path=self.legacy_path)
+    
+    def test_changes_persist(self):
+        wallet = self.open_wallet()
+        wallet.add_addresses("BTC", ["addr1", "addr2", "addr3"])
+        wallet.add_manual_balance("XMR", 1.5)
+        wallet.add_manual_balance("XMR", 1)
+        wallet.remove_watch_address("BTC", ["addr2"])
+        wallet.add_addresses("LTC", ["addr4"])
+        wallet.remove_coin("LTC")
+        
+        reopened = self.open_wallet()
+        self.assertListEqual(sorted(reopened.get_coins_ids()), ["BTC", "XMR"])
+        self.assertSetEqual(reopened.get_coin_info("BTC").addresses, {"addr1", "addr3"})
+        self.assertEqual(reopened.get_coin_info("XMR").manual_balance, 2.5)
+    
+    def test_import_addresses(self):
+        wallet = self.open_wallet()
+        wallet.add_addresses("BTC", ["1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"])
+        report = wallet.import_addresses("BTC", [
+            "3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy, 1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa",
+            "",
+            "BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4,bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4",
+            "3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLz",
+        ])
+        self.assertListEqual(report.added, ["3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy",
+                                            "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4"])
+        self.assertEqual(report.duplicates, 2)
+        self.assertListEqual([(line, address) for line, address, _ in report.rejected],
+                             [(4, "3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLz")])
+        self.assertEqual(len(self.open_wallet().get_coin_info("BTC").addresses), 3)
+        
+        # nothing is stored if all the addresses are invalid
+        report = wallet.import_addresses("ETH", ["0x1234"])
+        self.assertEqual(len(report.rejected), 1)
+        self.assertNotIn("ETH", self.open_wallet().get_coins_ids())
+    
+    def test_delete(self):
+        wallet = self.open_wallet()
+        wallet.add_addresses("BTC", ["addr1"])
+        wallet.delete()
+        self.assertListEqual(wallet.get_coins_ids(), [])
+        self.assertListEqual(self.open_wallet().get_coins_ids(), [])
+    
+    def test_migrate_legacy_wallet(self):
+        legacy_wallet = defaultdict(TrackedCoin.get_empty_tracked_coin)
+        legacy_wallet["BTC"] = TrackedCoin({"addr1", "addr2"}, 0.5)
+        legacy_wallet["XMR"].manual_balance = 3
+        with open(self.legacy_path, 'wb') as f:
+            pickle.dump(legacy_wallet, f)
+        
+        wallet = self.open_wallet()
+        self.assertListEqual(sorted(wallet.get_coins_ids()), ["BTC", "XMR"])
+        self.assertFalse(os.path.exists(self.legacy_path))
+        self.assertTrue(os.path.exists(self.legacy_path + MIGRATED_SUFFIX))
+        
+        reopened = self.open_wallet()
+        self.assertSetEqual(reopened.get_coin_info("BTC").addresses, {"addr1", "addr2"})
+        self.assertEqual(reopened.get_coin_info("BTC").manual_balance, 0.5)
+        self.assertEqual(reopened.get_coin_info("XMR").manual_balance, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
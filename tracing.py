@@ -0,0 +1,154 @@
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+"""
+This module records spans (named intervals of time) of the refresh cycle, such as loading the
+wallet, looking up the prices and the addresses, and drawing the screens, and exports them as a
+Chrome trace-event JSON file. The file can be opened in chrome://tracing or in
+https://ui.perfetto.dev to see on a timeline where the time goes, and which thread waits for
+which.
+Tracing is off unless start_tracing() is called, and then a disabled span costs a single check.
+
+usage:
+    @traced()
+    def lookup(...): ...
+
+    with span("parse ticker", coins=len(ticker)):
+        ...
+"""
+
+
+class Tracer:
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._pid = os.getpid()
+        self._events: List[dict] = []
+        self._thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+    
+    def _timestamp(self, t: float) -> float:
+        # trace events are in microseconds
+        return (t - self._start) * 1e6
+    
+    def add_span(self, name: str, start: float, end: float, args: Optional[dict] = None):
+        """
+        :param start: the perf_counter time the span started at
+        :param end: the perf_counter time the span ended at
+        """
+        thread = threading.current_thread()
+        event = {
+            "name": name, "ph": "X", "pid": self._pid, "tid": thread.ident,
+            "ts": self._timestamp(start), "dur": (end - start) * 1e6,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._events.append(event)
+            self._thread_names.setdefault(thread.ident, thread.name)
+    
+    def events(self) -> List[dict]:
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                 "args": {"name": name}}
+                for tid, name in self._thread_names.items()
+            ]
+            return metadata + list(self._events)
+    
+    def export(self, path: str):
+        """
+        write the spans to a Chrome trace-event JSON file
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+
+
+# the current tracer. None while tracing is off
+_tracer: Optional[Tracer] = None
+
+
+def start_tracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing() -> Optional[Tracer]:
+    """
+    stop recording spans
+
+    :return: the tracer with the recorded spans, or None if tracing wasn't on
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def is_tracing() -> bool:
+    return _tracer is not None
+
+
+class _Span:
+    def __init__(self, tracer: Tracer, name: str, args: dict):
+        self._tracer = tracer
+        self._name = name
+        self._args = args
+        self._start = 0.0
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._tracer.add_span(self._name, self._start, time.perf_counter(), self._args)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, **args):
+    """
+    a context manager which records a span around its block. The keyword arguments are shown
+    with the span
+    """
+    tracer = _tracer
+    return _NO_SPAN if tracer is None else _Span(tracer, name, args)
+
+
+def traced(name: Optional[str] = None, describe: Optional[Callable[..., dict]] = None) -> Callable:
+    """
+    a decorator which records a span around every call of the decorated function
+
+    :param name: the name of the spans. the qualified name of the function by default
+    :param describe: called with the arguments of every traced call. returns the arguments shown
+                     with its span (e.g. the coin that was looked up)
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.add_span(span_name, start, time.perf_counter(),
+                                describe(*args, **kwargs) if describe is not None else None)
+        return wrapper
+    return decorator
@@ -0,0 +1,258 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    HTTP_BACKOFF_FACTOR, HTTP_CONNECT_TIMEOUT, HTTP_MAX_RETRIES, HTTP_MAX_THROTTLED_RETRIES,
+    HTTP_POOL_SIZE, HTTP_READ_TIMEOUT, RATE_LIMITS, RATE_LIMIT_JITTER, RATE_LIMIT_MAX_WAIT,
+)
+from metrics import metrics
+from tracing import span
+from utils import logger
+
+"""
+This module is the HTTP transport layer used by the data retriever. It keeps a session per
+provider host, so connections are pooled and kept alive between refreshes, and applies
+timeouts and bounded retries to every request.
+Requests to each host are scheduled within the host's request budget (see RATE_LIMITS), and
+throttled responses (429) are retried after the time the host asked for
+"""
+
+RETRY_STATUSES = (500, 502, 503, 504)
+TOO_MANY_REQUESTS = 429
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average, with bursts of up to `capacity` requests.
+    Callers that exceed the budget wait until it refills
+    """
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0  # no requests are allowed before this time
+        self._lock = Lock()
+    
+    def _refill(self, now: float):
+        # must be called while holding the lock
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+    
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        take a token, waiting for one if the budget is used up or the bucket is paused
+
+        :param timeout: maximum number of seconds to wait. None means wait as long as needed
+        :return: True if a token was taken, False if it couldn't be taken within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_time = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            if deadline is not None and time.monotonic() + wait_time > deadline:
+                return False
+            time.sleep(wait_time)
+    
+    def pause(self, seconds: float):
+        """
+        don't allow any request in the next given number of seconds
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+    
+    def remaining(self) -> float:
+        """
+        return the number of requests that can be sent right now without waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return 0 if now < self._paused_until else self._tokens
+    
+    def is_paused(self) -> bool:
+        return time.monotonic() < self._paused_until
+
+
+# keys are hosts (e.g. 'blockchain.info')
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = Lock()
+_buckets: Dict[str, Optional[TokenBucket]] = {}
+# time until which each host is considered throttled
+_throttled_until: Dict[str, float] = {}
+
+
+def _create_session() -> requests.Session:
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        # POST is used only for read-only JSON-RPC calls, which are safe to send again
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,  # after the last retry return the response instead of raising
+        # throttled responses are returned to _send, which backs off within the host's budget
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(host: str) -> requests.Session:
+    """
+    return the session of the given host. A new session is created on the first request to it
+    """
+    with _sessions_lock:
+        if host not in _sessions:
+            _sessions[host] = _create_session()
+        return _sessions[host]
+
+
+def get_bucket(host: str) -> Optional[TokenBucket]:
+    """
+    return the request budget of the given host, or None if requests to it are not limited
+    """
+    with _sessions_lock:
+        if host not in _buckets:
+            limit = RATE_LIMITS.get(host)
+            _buckets[host] = None if limit is None else TokenBucket(*limit)
+        return _buckets[host]
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """
+    return the number of seconds the Retry-After header asks to wait, or None if it's missing
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:  # the header may also be an HTTP date
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def get(url: str) -> Optional[requests.Response]:
+    """
+    send a GET request through the session of the url's host, within the host's request budget.
+    Throttled requests (429) are retried after the time the host asks for, plus jitter
+
+    :return: the response (which may have a failure status code). None is returned if no response
+             was received (connection error, timeout, the budget wasn't available in time, etc.)
+    """
+    return _send("GET", url)
+
+
+def post(url: str, json_body) -> Optional[requests.Response]:
+    """
+    send a POST request with a JSON body (e.g. a batch of JSON-RPC calls), the same way as get()
+    """
+    return _send("POST", url, json=json_body)
+
+
+def _send(method: str, url: str, **kwargs) -> Optional[requests.Response]:
+    host = urlsplit(url).netloc
+    session = get_session(host)
+    bucket = get_bucket(host)
+    for attempt in range(HTTP_MAX_THROTTLED_RETRIES + 1):
+        if bucket is not None and not bucket.acquire(timeout=RATE_LIMIT_MAX_WAIT):
+            logger.error(f"Request budget of {host} wasn't available within "
+                         f"{RATE_LIMIT_MAX_WAIT} seconds")
+            _throttled_until[host] = time.monotonic() + RATE_LIMIT_MAX_WAIT
+            metrics.record_throttled(host)
+            return None
+        start = time.monotonic()
+        try:
+            with span(method, host=host):
+                response = session.request(method, url, **kwargs,
+                                           timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        except requests.RequestException as e:
+            logger.error(f"Request to {host} failed: {e!r}")
+            metrics.record_request(host, time.monotonic() - start, succeeded=False)
+            return None
+        metrics.record_request(host, time.monotonic() - start, succeeded=response.ok,
+                               payload_bytes=len(response.content),
+                               throttled=response.status_code == TOO_MANY_REQUESTS)
+        
+        if response.status_code != TOO_MANY_REQUESTS:
+            _throttled_until.pop(host, None)
+            return response
+        
+        delay = _retry_after(response)
+        if delay is None:
+            delay = HTTP_BACKOFF_FACTOR * (2 ** attempt)
+        delay += random.uniform(0, RATE_LIMIT_JITTER * delay)
+        _throttled_until[host] = time.monotonic() + delay
+        logger.info(f"{host} throttled the request. backing off for {delay:.2f} seconds")
+        if bucket is not None:
+            bucket.pause(delay)
+        if attempt < HTTP_MAX_THROTTLED_RETRIES:
+            if bucket is None:
+                time.sleep(delay)
+            # else - acquiring from the paused bucket waits
+    
+    return response
+
+
+def is_throttled(url: str) -> bool:
+    """
+    return True if the host of the given url throttled our requests recently, or its request
+    budget ran out
+    """
+    return time.monotonic() < _throttled_until.get(urlsplit(url).netloc, 0)
+
+
+def remaining_budget(url: str) -> Optional[Tuple[float, float]]:
+    """
+    :return: a tuple (remaining, capacity) - the number of requests that can be sent right now
+             to the host of the given url, out of its burst size. None if the host is not limited
+    """
+    bucket = get_bucket(urlsplit(url).netloc)
+    if bucket is None:
+        return None
+    return bucket.remaining(), bucket.capacity
+
+
+def request_budgets() -> Dict[str, Tuple[float, float, bool]]:
+    """
+    :return: a dictionary from each rate limited host that requests were sent to, to a tuple
+             (remaining, capacity, throttled) - see remaining_budget and is_throttled
+    """
+    with _sessions_lock:
+        buckets = {host: bucket for host, bucket in _buckets.items() if bucket is not None}
+    now = time.monotonic()
+    return {
+        host: (bucket.remaining(), bucket.capacity, now < _throttled_until.get(host, 0))
+        for host, bucket in buckets.items()
+    }
+
+
+def close_sessions():
+    """
+    close all open sessions and their pooled connections
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -1,11 +1,22 @@
 import os
 import pickle
+import time
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
-from typing import Dict, Iterable, List, Set
+from threading import Event
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from config import CRYPTO_WATCH_DIR, WALLET_FULLPATH
-from data_retriever import lookup_addresses, lookup_value
+from address_validation import InvalidAddress, normalize_address, split_addresses
+from config import (ERC20_TOKENS, REFRESH_DEADLINE, REFRESH_MAX_WORKERS, WALLET_DB_FULLPATH,
+                    WALLET_FULLPATH)
+from storage import WalletStorage
+from tracing import span, traced
+from utils import logger
+
+MIGRATED_SUFFIX = ".migrated"
+
+CANCEL_CHECK_INTERVAL = 0.1  # seconds
 
 
 @dataclass
@@ -18,62 +29,142 @@ class TrackedCoin:
         return TrackedCoin()
 
 
+@dataclass
+class ImportReport:
+    added: List[str] = field(default_factory=list)  # the new addresses, normalized
+    duplicates: int = 0  # addresses that were repeated or already in the wallet
+    rejected: List[Tuple[int, str, str]] = field(default_factory=list)  # (line, address, reason)
+
+
 class Wallet:
-    def __init__(self):
-        os.makedirs(CRYPTO_WATCH_DIR, exist_ok=True)
+    @traced()
+    def __init__(self, storage_path: str = WALLET_DB_FULLPATH, legacy_path: str = WALLET_FULLPATH,
+                 tokens: Iterable[str] = ERC20_TOKENS):
+        """
+        :param storage_path: the wallet database file
+        :param legacy_path: a wallet file in the old (pickle) format. If it exists, it is migrated
+                            to the database the first time the wallet is loaded
+        :param tokens: symbols of the ERC-20 tokens whose balances are looked up in the ETH
+                       addresses of the wallet. The wallet doesn't register their contracts:
+                       the tokens of ERC20_TOKENS are registered when the data retriever is
+                       imported, and any other token must be registered with
+                       data_retriever.register_erc20_token before its balances can be found
+        """
+        self._storage = WalletStorage(storage_path)
+        self._legacy_path = legacy_path
+        self.tokens = [token.upper() for token in tokens]
+        # keys are coin symbols. loaded on first use
+        self._wallet: Optional[Dict[str, TrackedCoin]] = None
+    
+    @property
+    def wallet(self) -> Dict[str, TrackedCoin]:
+        if self._wallet is None:
+            self._wallet = self._load()
+        return self._wallet
+    
+    @traced()
+    def _load(self) -> Dict[str, TrackedCoin]:
+        if os.path.isfile(self._legacy_path):
+            self._migrate_legacy_wallet()
         
-        # if wallet file exists, load it
-        if os.path.isfile(WALLET_FULLPATH):
-            with open(WALLET_FULLPATH, 'rb') as f:
-                self.wallet: Dict[str, TrackedCoin] = pickle.load(f)
-        else:
-            # keys are coin symbols
-            # we can't use a lambda for the defaultdict so it will be picklable
-            self.wallet: Dict[str, TrackedCoin] = defaultdict(
-                TrackedCoin.get_empty_tracked_coin
-            )
-    
-    def dump(self):
-        with open(WALLET_FULLPATH, 'wb') as f:
-            pickle.dump(self.wallet, f)
+        wallet = defaultdict(TrackedCoin.get_empty_tracked_coin)
+        if self._storage.exists():
+            for coin_symbol, (addresses, manual_balance) in self._storage.load().items():
+                wallet[coin_symbol] = TrackedCoin(addresses, manual_balance)
+        return wallet
+    
+    def _migrate_legacy_wallet(self):
+        """
+        copy the wallet from the legacy pickle file to the database, and rename the legacy file
+        so it won't be migrated again. Importing is idempotent, so if we crash before renaming,
+        the next migration does no harm
+        """
+        with open(self._legacy_path, 'rb') as f:
+            legacy_wallet: Dict[str, TrackedCoin] = pickle.load(f)
+        self._storage.import_coins({
+            coin_symbol: (tracked_coin.addresses, tracked_coin.manual_balance)
+            for coin_symbol, tracked_coin in legacy_wallet.items()
+        })
+        os.replace(self._legacy_path, self._legacy_path + MIGRATED_SUFFIX)
+        logger.info(f"Migrated wallet file {self._legacy_path} to {self._storage.path}")
     
     def add_addresses(self, coin_symbol: str, addresses: Iterable[str]):
         """
         :param coin_symbol: coin code (e.g. BTC for Bitcoin)
         :param addresses: an iterable of addresses to watch of the given coin
         """
+        addresses = list(addresses)
+        self._storage.add_addresses(coin_symbol, addresses)
         self.wallet[coin_symbol].addresses.update(addresses)
-        self.dump()
+    
+    def import_addresses(self, coin_symbol: str, lines: Iterable[str]) -> ImportReport:
+        """
+        validate, normalize and de-duplicate addresses in one pass, and add the valid ones to
+        the wallet in a single transaction. Nothing is looked up in the network
+
+        :param coin_symbol: coin code (e.g. BTC for Bitcoin)
+        :param lines: lines of comma separated addresses (e.g. the lines of a file)
+        :return: the added addresses, and the rejected ones with their line numbers (starting
+                 from 1) and the reason they were rejected
+        """
+        report = ImportReport()
+        tracked_coin = self.wallet.get(coin_symbol)
+        known = tracked_coin.addresses if tracked_coin is not None else set()
+        added: Dict[str, None] = {}  # a dict keeps the order, unlike a set
+        for line_number, line in enumerate(lines, start=1):
+            for address in split_addresses(line):
+                try:
+                    address = normalize_address(coin_symbol, address)
+                except InvalidAddress as e:
+                    report.rejected.append((line_number, address, str(e)))
+                    continue
+                if address in known or address in added:
+                    report.duplicates += 1
+                else:
+                    added[address] = None
+        
+        report.added = list(added)
+        if len(report.added) > 0:
+            self.add_addresses(coin_symbol, report.added)
+        return report
     
     def add_manual_balance(self, coin_symbol: str, balance: float):
         """
         adds balance for some coin manually. If a manual balance already exists for this coin,
         adds the given balance to the current balance
         """
-        self.wallet[coin_symbol].manual_balance += balance
-        self.dump()
+        new_balance = self.wallet[coin_symbol].manual_balance + balance
+        self._storage.set_manual_balance(coin_symbol, new_balance)
+        self.wallet[coin_symbol].manual_balance = new_balance
     
     def remove_watch_address(self, coin_symbol: str, addresses: Iterable[str]):
         """
         removes addresses of a coin from the watch list. If a given address is
         not on the watch list it is ignored.
         """
+        if coin_symbol not in self.wallet:
+            return
+        # imported here (as in _iter_balances) so loading a wallet doesn't import the network stack
+        from data_retriever import forget_addresses
+        
+        addresses = list(addresses)
+        self._storage.remove_addresses(coin_symbol, addresses)
         self.wallet[coin_symbol].addresses.difference_update(addresses)
-        self.dump()
+        forget_addresses(coin_symbol, addresses)
     
     def remove_manual_balance(self, coin_symbol: str):
         """
         removes the manual balance of the given coin
         """
+        self._storage.set_manual_balance(coin_symbol, 0)
         self.wallet[coin_symbol].manual_balance = 0
-        self.dump()
     
     def remove_coin(self, coin_symbol: str):
         """
         completely remove the coin from the wallet
         """
+        self._storage.remove_coin(coin_symbol)
         self.wallet.pop(coin_symbol, None)
-        self.dump()
     
     def get_coins_ids(self) -> List[str]:
         """
@@ -81,47 +172,213 @@ class Wallet:
         """
         return list(self.wallet.keys())
     
+    def get_token_ids(self) -> List[str]:
+        """
+        return the tokens whose balances are looked up in the ETH addresses of this wallet. Tokens
+        which are also coins of the wallet are left out, so every row has a single source
+        """
+        eth = self.wallet.get("ETH")
+        if eth is None or len(eth.addresses) == 0:
+            return []
+        return [token for token in self.tokens if token not in self.wallet]
+    
+    def get_row_ids(self) -> List[str]:
+        """
+        return the ids of the balances rows: the coins of this wallet, followed by its tokens
+        """
+        return self.get_coins_ids() + self.get_token_ids()
+    
     def get_coin_info(self, coin_symbol: str) -> TrackedCoin:
         return self.wallet[coin_symbol]
     
+    @traced()
     def get_balances(self):
         """
+        The price lookup and the addresses lookup of every coin are sent concurrently.
+        Lookups which didn't finish within REFRESH_DEADLINE seconds are treated as failures.
+        
         :return: List of lists. each inner list has the following elements:
                       [coin_code, amount, value_in_usd, value_in_btc]
-                 coins for which finding the value was failed, the values will be 'N/A'
-        """
-        res = []
-        coin_symbols_list = list(self.wallet.keys())
-        coins_values = lookup_value(coin_symbols_list)
-        for coin_idx, coin_code in enumerate(coin_symbols_list):
-            addresses_amounts = lookup_addresses(coin_code, list(self.wallet[coin_code].addresses))
-            total_coin_amount = 0
-            if addresses_amounts is not None:
-                # addresses whose balance was failed to retrieve is -1. sum everything except
-                # failures
-                for addr_amount in addresses_amounts:
-                    if addr_amount > 0:
-                        total_coin_amount += addr_amount
-            
-            total_coin_amount += self.wallet[coin_code].manual_balance
-            total_coin_amount = round(total_coin_amount, 8)  # truncate to maximum 8 digits after decimal point
+                 coins for which finding the value was failed, the values will be 'N/A'.
+                 The rows of the coins are followed by the rows of the tokens (see
+                 get_token_ids)
+        """
+        coin_symbols_list = self.get_row_ids()
+        rows = {row[0]: row for row, _ in self.iter_balances()}
+        return [rows[coin_code] for coin_code in coin_symbols_list]
+    
+    def iter_balances(
+        self,
+        cancelled: Optional[Event] = None,
+        coins: Optional[Iterable[str]] = None,
+        use_cache: bool = True,
+        revalidate: bool = False,
+    ) -> Iterator[Tuple[List, bool]]:
+        """
+        Like get_balances, but yields the row of each coin as soon as it is ready, in no
+        particular order.
+        The coins to look up are taken when this method is called, so the returned generator may
+        be consumed by another thread while the wallet is changed.
+        
+        :param cancelled: if given, stop looking up (and yielding) once this event is set
+        :param coins: if given, look up only these coins (or tokens). Coins which are not in the
+                      wallet are ignored
+        :param use_cache: if False, the addresses balances are looked up in the providers even if
+                          they were looked up recently
+        :param revalidate: if True, the cached balances are taken only if the chain tip hasn't
+                           advanced since they were looked up (see lookup_addresses)
+        :return: a generator of tuples (row, succeeded). row is the same as in get_balances.
+                 succeeded is False if looking up the coin's addresses failed, in which case
+                 the amount in the row includes only the manual balance
+        """
+        wanted = None if coins is None else set(coins)
+        coins = {
+            coin_code: (list(tracked_coin.addresses), tracked_coin.manual_balance)
+            for coin_code, tracked_coin in self.wallet.items()
+            if wanted is None or coin_code in wanted
+        }
+        # a token is looked up like a coin whose addresses are the ETH addresses
+        for token in self.get_token_ids():
+            if wanted is None or token in wanted:
+                coins[token] = (list(self.wallet["ETH"].addresses), 0)
+        return self._iter_balances(coins, cancelled, use_cache, revalidate)
+    
+    @staticmethod
+    def _iter_balances(
+        coins: Dict[str, Tuple[List[str], float]],
+        cancelled: Optional[Event],
+        use_cache: bool,
+        revalidate: bool,
+    ) -> Iterator[Tuple[List, bool]]:
+        coin_symbols_list = list(coins.keys())
+        if len(coin_symbols_list) == 0:
+            return
+        # importing the data retriever (and the HTTP stack with it) takes a while. do it only when
+        # there is something to look up
+        with span("import data_retriever"):
+            from data_retriever import lookup_addresses, lookup_value
+        
+        coin_indices = {coin_code: i for i, coin_code in enumerate(coin_symbols_list)}
+        
+        executor = ThreadPoolExecutor(max_workers=REFRESH_MAX_WORKERS)
+        try:
+            values_future = executor.submit(lookup_value, coin_symbols_list)
+            amounts_futures = {}
+            for coin_code, (addresses, _) in coins.items():
+                if len(addresses) > 0:  # don't bother the provider for manual-only coins
+                    amounts_futures[executor.submit(lookup_addresses, coin_code, addresses,
+                                                    use_cache, revalidate)] = coin_code
             
-            if coins_values[coin_idx] is None:
-                value_usd = 'N/A'
-                value_btc = 'N/A'
-            else:
-                value_usd = round((total_coin_amount * coins_values[coin_idx][0]), 3)
-                value_btc = round((total_coin_amount * coins_values[coin_idx][1]), 8)
+            coins_values = None  # known once the price lookup is done
+            amounts = {
+                coin_code: []
+                for coin_code, (addresses, _) in coins.items() if len(addresses) == 0
+            }
+            not_done = {values_future, *amounts_futures}
+            deadline = time.monotonic() + REFRESH_DEADLINE
+            while len(amounts) > 0 or len(not_done) > 0:
+                # rows are ready once both their addresses and the coins values are known
+                if coins_values is not None:
+                    for coin_code, addresses_amounts in amounts.items():
+                        if cancelled is not None and cancelled.is_set():
+                            return
+                        coin_value = coins_values[coin_indices[coin_code]]
+                        yield (_make_row(coin_code, addresses_amounts, coins[coin_code][1],
+                                         coin_value),
+                               addresses_amounts is not None)
+                    amounts.clear()
+                
+                if cancelled is not None and cancelled.is_set():
+                    return
+                remaining = deadline - time.monotonic()
+                if len(not_done) == 0:
+                    continue
+                if remaining <= 0:
+                    break
+                # wake up periodically to check for cancellation
+                done, not_done = wait(not_done, timeout=min(remaining, CANCEL_CHECK_INTERVAL),
+                                      return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future is values_future:
+                        coins_values = _get_result(values_future, "price lookup")
+                        if coins_values is None:
+                            coins_values = [None] * len(coin_symbols_list)
+                    else:
+                        coin_code = amounts_futures[future]
+                        amounts[coin_code] = _get_result(future, f"{coin_code} addresses lookup")
             
-            res.append([coin_code, total_coin_amount, value_usd, value_btc])
-        
-        return res
+            # the deadline has passed. whatever didn't finish is considered failed
+            for future in not_done:
+                if future is values_future:
+                    _get_result(values_future, "price lookup")
+                    coins_values = [None] * len(coin_symbols_list)
+                else:
+                    coin_code = amounts_futures[future]
+                    amounts[coin_code] = _get_result(future, f"{coin_code} addresses lookup")
+            for coin_code, addresses_amounts in amounts.items():
+                coin_value = coins_values[coin_indices[coin_code]]
+                yield (_make_row(coin_code, addresses_amounts, coins[coin_code][1], coin_value),
+                       addresses_amounts is not None)
+        finally:
+            # lookups that passed the deadline are left running in the background and their
+            # results are ignored
+            executor.shutdown(wait=False, cancel_futures=True)
     
     def delete(self):
         """
         Delete all data from this wallet and delete the file from the disk.
         If later, funds are added to this wallet, it will be created again on the disk
         """
-        if os.path.isfile(WALLET_FULLPATH):
-            os.remove(WALLET_FULLPATH)
+        self._storage.delete()
         self.wallet.clear()
+
+
+def _make_row(
+    coin_code: str,
+    addresses_amounts: Optional[List[float]],
+    manual_balance: float,
+    coin_value: Optional[Tuple[float, float]],
+) -> List:
+    """
+    build the balances row of a coin, as returned by Wallet.get_balances
+    """
+    total_coin_amount = 0
+    if addresses_amounts is not None:
+        # addresses whose balance was failed to retrieve is -1. sum everything except
+        # failures
+        for addr_amount in addresses_amounts:
+            if addr_amount > 0:
+                total_coin_amount += addr_amount
+    
+    total_coin_amount += manual_balance
+    total_coin_amount = round(total_coin_amount, 8)  # truncate to maximum 8 digits after decimal point
+    return price_row(coin_code, total_coin_amount, coin_value)
+
+
+def price_row(coin_code: str, amount: float, coin_value: Optional[Tuple[float, float]]) -> List:
+    """
+    build the balances row of a coin from its total amount and its (value_USD, value_BTC).
+    Used to reprice a row when only the coin value changed
+    """
+    if coin_value is None:
+        value_usd = 'N/A'
+        value_btc = 'N/A'
+    else:
+        value_usd = round((amount * coin_value[0]), 3)
+        value_btc = round((amount * coin_value[1]), 8)
+    
+    return [coin_code, amount, value_usd, value_btc]
+
+
+def _get_result(future: Future, description: str) -> Optional[object]:
+    """
+    return the result of a finished lookup. If the lookup hasn't finished yet or it raised an
+    exception, None is returned
+    """
+    if not future.done():
+        logger.error(f"{description} didn't finish within {REFRESH_DEADLINE} seconds")
+        return None
+    if future.exception() is not None:
+        logger.error(f"{description} failed: {future.exception()!r}")
+        return None
+    return future.result()